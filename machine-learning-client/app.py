@@ -2,21 +2,47 @@
 Flask application for ml client to receive signals from frontend
 """
 
+import functools
+import logging
 import os
-import string
-from collections import Counter
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError, ConnectionFailure, OperationFailure
-from deepgram import (
-    DeepgramClient,
-    PrerecordedOptions,
-    FileSource,
+from pymongo import UpdateMany
+from pymongo.errors import (
+    BulkWriteError,
+    PyMongoError,
+    ConnectionFailure,
+    OperationFailure,
 )
+from backends import get_backend
+from jobs import (
+    JOB_QUEUED,
+    JOB_RUNNING,
+    PermanentJobError,
+    RetryLaterError,
+    start_workers,
+)
+from resilience import CircuitOpenError
+from ratelimit import RATE_LIMIT_COLLECTION, RateLimited, governor
+from singleflight import SINGLE_FLIGHT_COLLECTION, SingleFlight, SingleFlightTimeout
+from transcript_cache import TranscriptCache, cache_key
+from corpus import CORPUS_COLLECTION, record_change
+from text_analytics import (
+    POLICIES,
+    analyze,
+    count_words,
+    top_words,
+    word_frequencies,
+)
+from mongo import LazyDatabase
+import schema
+import startup
 
 
-# Load environment variables from .env file
+# Load environment variables from .env file, before the settings below read them
 load_dotenv()
 
 AUDIO_FOLDER = "/app/uploaded_audio"
@@ -33,79 +59,44 @@ if os.getenv("MODE") == "local":
 elif os.getenv("MODE") == "docker":
     AUDIO_FOLDER = "/app/uploaded_audio"
 
-print(f"AUDIO_FOLDER: {AUDIO_FOLDER}")
+# Each process opens its own client on first use, see mongo.py
+db = LazyDatabase()
+collection = db["transcriptions"]
+jobs_collection = db["transcription_jobs"]
+corpus_collection = db[CORPUS_COLLECTION]
+transcript_cache = TranscriptCache(db["transcript_cache"])
+# shared token buckets, used with TRANSCRIBE_RATE_SHARED=1, see ratelimit.py
+rate_limits_collection = db[RATE_LIMIT_COLLECTION]
+# concurrent requests for the same audio share one transcription
+single_flight = SingleFlight(db[SINGLE_FLIGHT_COLLECTION])
 
-# Connect to MongoDB
-mongo_host = os.getenv(
-    "MONGO_HOST", "mongodb"
-)  # Use the service name from docker-compose
-mongo_username = os.getenv("MONGO_INITDB_ROOT_USERNAME")
-mongo_password = os.getenv("MONGO_INITDB_ROOT_PASSWORD")
-mongo_port = os.getenv("MONGO_PORT", "27017")
-mongo_db_name = os.getenv("MONGO_DB_NAME", "voice_data")
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "2"))
 
-client = MongoClient(
-    f"mongodb://{mongo_username}:{mongo_password}@{mongo_host}:{mongo_port}/"
-)
-db = client[mongo_db_name]
-collection = db["transcriptions"]
+# Transcription options, also part of the transcript cache key
+TRANSCRIBE_OPTIONS = {"model": "nova-3", "smart_format": True}
+
+# Transcription cannot run now, the caller should try again after e.retry_after
+TRY_LATER_ERRORS = (CircuitOpenError, RateLimited, SingleFlightTimeout)
+
+# Batch requests: files per request, and backend calls run at once per request
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
 
 
 app = Flask(__name__)
 
 
-STOP_WORDS = {
-    "the",
-    "is",
-    "in",
-    "and",
-    "of",
-    "a",
-    "to",
-    "with",
-    "that",
-    "for",
-    "on",
-    "as",
-    "are",
-    "at",
-    "by",
-    "an",
-    "be",
-    "this",
-    "it",
-    "from",
-    "or",
-    "was",
-    "we",
-    "you",
-    "your",
-    "they",
-    "he",
-    "she",
-    "but",
-    "not",
-    "have",
-    "has",
-    "had",
-    "can",
-    "will",
-    "do",
-    "does",
-    "did",
-    "so",
-    "if",
-    "then",
-    "them",
-    "these",
-    "those",
-    "there",
-    "here",
-}
+@functools.lru_cache(maxsize=None)
+def get_transcription_backend():
+    """
+    The configured transcription backend (TRANSCRIBE_BACKEND), created on
+    first use so importing the app builds nothing.
+    """
+    return get_backend()
 
 
 @app.route("/get-transcripts", methods=["POST"])
-def process_transcript_api():
+def process_transcript_api():  # pylint: disable=too-many-return-statements
     """
     Receive audio file path from frontend, get transcript from deepgram and update database
 
@@ -121,6 +112,106 @@ def process_transcript_api():
     if not voice_data_rel_file_path:
         return jsonify({"message": "No audio file path provided"}), 400
 
+    try:
+        transcript = transcribe_and_store(voice_data_rel_file_path)["transcript"]
+    except FileNotFoundError as e:
+        return jsonify({"message": f"File not found: {e}"}), 404
+    except TRY_LATER_ERRORS as e:
+        print(f"Transcription unavailable: {e}")
+        return (
+            jsonify({"message": "Transcription service unavailable"}),
+            503,
+            {"Retry-After": str(max(1, round(e.retry_after)))},
+        )
+    except ConnectionFailure as e:
+        print(f"MongoDB connection error: {e}")
+        return jsonify({"message": "Database connection error"}), 503
+    except OperationFailure as e:
+        print(f"MongoDB operation error: {e}")
+        return jsonify({"message": "Database operation failed"}), 500
+    except PyMongoError as e:
+        print(f"Other MongoDB error: {e}")
+        return jsonify({"message": "Database error occurred"}), 500
+
+    return jsonify({"message": "Transcript updated", "transcript": transcript}), 200
+
+
+def transcribe_and_store(voice_data_rel_file_path):
+    """
+    Transcribe an uploaded audio file, compute its word stats and store them on
+    the matching transcriptions entry. A request for a path that is already
+    being transcribed, here or in another replica, waits for that request and
+    returns its stats instead of transcribing and storing again.
+
+    Args:
+        voice_data_rel_file_path (str): the audio path as stored by the web-app
+
+    Returns:
+        dict: transcript, word_count, top_words and word_sketch
+
+    Raises:
+        FileNotFoundError: if the audio file is not on the shared volume
+        CircuitOpenError: if the backend's circuit is open
+        RateLimited: if the backend's rate limit held the call back too long
+        SingleFlightTimeout: if the same audio's transcription ran too long
+        PyMongoError: if the database update fails
+    """
+    return single_flight.do(
+        f"path:{voice_data_rel_file_path}",
+        _transcribe_and_store,
+        voice_data_rel_file_path,
+    )
+
+
+def _transcribe_and_store(voice_data_rel_file_path):
+    """
+    Transcribe and store an uploaded audio file, see transcribe_and_store.
+    """
+    stats, frequencies = transcript_stats(voice_data_rel_file_path)
+
+    # Find the entries by audio_file field,
+    # content-addressed audio can back several entries
+    entries = list(
+        collection.find(
+            {"audio_file": voice_data_rel_file_path}, {"transcript": 1, "speaker": 1}
+        )
+    )
+    if entries:
+        collection.update_many(
+            {"audio_file": voice_data_rel_file_path},
+            # a new version stamp makes the web-app re-render the entry page
+            {"$set": stats, "$inc": {"version": 1}},
+        )
+        print(f"Updated transcript for file: {voice_data_rel_file_path}")
+        for entry in entries:
+            record_change(
+                corpus_collection,
+                word_frequencies(entry.get("transcript") or ""),
+                frequencies,
+                entry.get("speaker"),
+                entry.get("speaker"),
+            )
+    else:
+        print(f"No entry found for file: {voice_data_rel_file_path}")
+    return stats
+
+
+def transcript_stats(voice_data_rel_file_path):
+    """
+    Transcribe an uploaded audio file and compute its word stats.
+
+    Args:
+        voice_data_rel_file_path (str): the audio path as stored by the web-app
+
+    Returns:
+        tuple: (fields to set on the entries, word frequencies of the transcript)
+
+    Raises:
+        FileNotFoundError: if the audio file is not on the shared volume
+        CircuitOpenError: if the backend's circuit is open
+        RateLimited: if the backend's rate limit held the call back too long
+        SingleFlightTimeout: if the same audio's transcription ran too long
+    """
     # Extract just the filename from the path
     filename = os.path.basename(voice_data_rel_file_path)
 
@@ -131,59 +222,228 @@ def process_transcript_api():
     # Check if file exists
     if not os.path.exists(file_path):
         print(f"File not found at: {file_path}")
-        return jsonify({"message": f"File not found: {file_path}"}), 404
+        raise FileNotFoundError(file_path)
 
     # Get transcript
     transcript = get_transcript(file_path)
     print(f"Transcript result: {transcript[:100]}...")  # Print first 100 chars
 
-    # Get top words
-    top_words = trans_to_top_word(transcript)
+    # Word count and top words in one pass over the transcript
+    analysis = analyze(transcript, "transcribe")
+    stats = {
+        "transcript": transcript,
+        "word_count": analysis["word_count"],
+        "top_words": analysis["top_words"],
+        "word_sketch": analysis["word_sketch"],
+        # picked up by the web-app's transcript search index
+        "transcript_updated_at": datetime.now(timezone.utc),
+    }
+    return stats, analysis["frequencies"]
+
+
+@app.route("/get-transcripts/batch", methods=["POST"])
+def process_transcript_batch_api():
+    """
+    Transcribe many audio files in one request and store every result with
+    one bulk write.
+
+    Expects {"audio_file_paths": [...]}, at most BATCH_MAX_FILES paths.
+
+    Returns:
+        json: a status per path, in request order
+    """
+    data = request.get_json(silent=True) or {}
+    paths = data.get("audio_file_paths")
+    if not isinstance(paths, list) or not all(
+        isinstance(path, str) and path for path in paths
+    ):
+        return jsonify({"message": "audio_file_paths must be a list of paths"}), 400
+    if len(paths) > BATCH_MAX_FILES:
+        return jsonify({"message": f"At most {BATCH_MAX_FILES} paths per batch"}), 413
 
-    # Get word count
-    word_count = get_word_count(transcript)
+    results = transcribe_batch(paths)
+    return jsonify({"message": "Batch processed", "results": results}), 200
 
-    # Update database
+
+def _batch_item(path):
+    """
+    Transcribe one file of a batch, catching its errors into a status.
+
+    Returns:
+        tuple: (path, stats, frequencies, None) or (path, None, None, status)
+    """
     try:
-        # Find the entry by audio_file field
-        entry = collection.find_one({"audio_file": voice_data_rel_file_path})
-        if entry:
-            collection.update_one(
-                {"audio_file": voice_data_rel_file_path},
-                {
-                    "$set": {
-                        "transcript": transcript,
-                        "word_count": word_count,
-                        "top_words": top_words,
-                    }
-                },
+        stats, frequencies = transcript_stats(path)
+        return path, stats, frequencies, None
+    except FileNotFoundError:
+        return path, None, None, {"status": "not_found", "error": "File not found"}
+    except TRY_LATER_ERRORS as e:
+        return path, None, None, {"status": "unavailable", "error": str(e)}
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        print(f"Batch transcription of {path} failed: {e}")
+        return path, None, None, {"status": "error", "error": str(e)}
+
+
+def transcribe_batch(paths, workers=BATCH_WORKERS):
+    """
+    Transcribe audio files over a bounded thread pool, then store every
+    transcript with one unordered bulk write and apply the corpus changes
+    summed per speaker.
+
+    Args:
+        paths (list): audio paths as stored by the web-app
+        workers (int): backend calls run at once
+
+    Returns:
+        list: {"audio_file_path", "status", ...} per path, in request order.
+        status is "done" (with word_count and the number of entries updated),
+        "not_found", "unavailable" (circuit open) or "error".
+    """
+    unique = list(dict.fromkeys(paths))
+    outcome = {}
+    done = {}
+    with ThreadPoolExecutor(max(1, min(workers, len(unique)))) as pool:
+        for path, stats, frequencies, failed in pool.map(_batch_item, unique):
+            if failed:
+                outcome[path] = failed
+            else:
+                done[path] = (stats, frequencies)
+
+    if done:
+        store_batch(done, outcome)
+    return [{"audio_file_path": path, **outcome[path]} for path in paths]
+
+
+def store_batch(done, outcome):
+    """
+    Write the transcripts of a batch with one unordered bulk write and move
+    the corpus counts from the old transcripts to the new ones.
+
+    Args:
+        done (dict): audio path -> (stats, frequencies)
+        outcome (dict): audio path -> status, filled in for every path of done
+    """
+    written = list(done)
+    try:
+        entries = list(
+            collection.find(
+                {"audio_file": {"$in": written}},
+                {"transcript": 1, "speaker": 1, "audio_file": 1},
             )
-            print(f"Updated transcript for file: {voice_data_rel_file_path}")
-        else:
-            print(f"Updated transcript for file: {voice_data_rel_file_path}")
-    except ConnectionFailure as e:
-        print(f"MongoDB connection error: {e}")
-        return jsonify({"message": "Database connection error"}), 503
-    except OperationFailure as e:
-        print(f"MongoDB operation error: {e}")
-        return jsonify({"message": "Database operation failed"}), 500
+        )
+        collection.bulk_write(
+            [
+                UpdateMany(
+                    {"audio_file": path},
+                    {"$set": done[path][0], "$inc": {"version": 1}},
+                )
+                for path in written
+            ],
+            ordered=False,
+        )
+        failed = {}
+    except BulkWriteError as e:
+        failed = {
+            error["index"]: error.get("errmsg", "write failed")
+            for error in e.details.get("writeErrors", [])
+        }
     except PyMongoError as e:
-        print(f"Other MongoDB error: {e}")
-        return jsonify({"message": "Database error occurred"}), 500
+        print(f"Batch write failed: {e}")
+        for path in written:
+            outcome[path] = {"status": "error", "error": "Database error"}
+        return
+
+    per_path = Counter(entry["audio_file"] for entry in entries)
+    for index, path in enumerate(written):
+        if index in failed:
+            outcome[path] = {"status": "error", "error": failed[index]}
+            continue
+        outcome[path] = {
+            "status": "done",
+            "word_count": done[path][0]["word_count"],
+            "entries": per_path[path],
+        }
+    record_batch_corpus_change(entries, done, outcome)
+    print(f"Batch stored {len(written) - len(failed)} transcripts")
 
-    return jsonify({"message": "Transcript updated", "transcript": transcript}), 200
+
+def record_batch_corpus_change(entries, done, outcome):
+    """
+    Move the corpus counts of a batch's stored entries from their old
+    transcripts to the new ones. The changes are additive, so one change per
+    speaker covers the whole batch.
+    """
+    old_counts = defaultdict(Counter)
+    new_counts = defaultdict(Counter)
+    for entry in entries:
+        path = entry["audio_file"]
+        if outcome[path]["status"] != "done":
+            continue
+        speaker = entry.get("speaker")
+        old_counts[speaker].update(word_frequencies(entry.get("transcript") or ""))
+        new_counts[speaker].update(done[path][1])
+    for speaker, new in new_counts.items():
+        record_change(corpus_collection, old_counts[speaker], new, speaker, speaker)
+
+
+def handle_transcription_job(job):
+    """
+    Job queue handler: transcribe the job's audio file and store the result.
+
+    Args:
+        job (dict): the claimed job document
+
+    Returns:
+        dict: job result with the word count of the stored transcript
+    """
+    try:
+        stats = transcribe_and_store(job["audio_file"])
+    except FileNotFoundError as e:
+        raise PermanentJobError(f"File not found: {e}") from e
+    except TRY_LATER_ERRORS as e:
+        raise RetryLaterError(str(e), e.retry_after) from e
+    return {"word_count": stats["word_count"]}
+
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats_api():
+    """
+    Report transcript cache hit/miss counters
+
+    Returns:
+        json: cache counters and memory tier size
+    """
+    return jsonify(transcript_cache.stats()), 200
+
+
+@app.route("/single-flight-stats", methods=["GET"])
+def single_flight_stats_api():
+    """
+    Report how many transcriptions ran and how many requests shared one
+
+    Returns:
+        json: single flight counters
+    """
+    return jsonify(single_flight.stats()), 200
+
+
+@app.route("/resilience-stats", methods=["GET"])
+def resilience_stats_api():
+    """
+    Report the transcription backend's circuit state and current timeouts
+
+    Returns:
+        json: endpoint stats, empty for backends without an endpoint
+    """
+    endpoint = getattr(get_transcription_backend(), "endpoint", None)
+    return jsonify(endpoint.stats() if endpoint else {}), 200
 
 
 def get_word_count(transcript):
     """
     count words in transcript
     """
-    if not transcript:
-        return 0
-    if not isinstance(transcript, str):
-        return 0
-    words = transcript.lower().split()
-    return len(words)
+    return count_words(transcript)
 
 
 def rank_by_freq_desc(pairs):
@@ -206,71 +466,52 @@ def rank_by_freq_desc(pairs):
 
 def count_word_frequency(transcript):
     """
-    Parse words using spaces and count their frequency, excluding punctuation.
+    Count the frequency of each word, excluding punctuation.
 
     Args:
         transcript (str): The transcript text to analyze
 
     Returns:
-        list: A list of [word, count] pairs sorted by frequency (descending)
+        list: A list of [word, count] pairs, in the order words first appear
     """
-    if not transcript:
-        return []
-    if not isinstance(transcript, str):
-        return []
-
-    words = transcript.lower().split()
-    words = [word.strip(string.punctuation) for word in words]
-    words = [word for word in words if word]
-    freq = Counter(words)
-
+    freq = word_frequencies(transcript)
     return [[word, count] for word, count in freq.items()]
 
 
 def trans_to_top_word(transcript):
     """
-    1. count_word_frequency(transcript)
-    2. filter out words with length <= 3
-    3. rank_by_freq_desc(pairs)
+    Words seen at least 3 times, excluding stop words, ranked by frequency
+    descending (the "transcribe" policy of text_analytics).
     """
-    if not transcript or not isinstance(transcript, str):
-        return []
-    parsed = count_word_frequency(transcript)
-    filtered = [
-        [word, count] for word, count in parsed if count > 2 and word not in STOP_WORDS
-    ]  # Filter out words that are 3 characters or less
-    ranked = rank_by_freq_desc(filtered)
-    return ranked
+    return top_words(word_frequencies(transcript), **POLICIES["transcribe"])
 
 
 def get_transcript(audio_file: str):
     """
-    Async function to transcribe an audio file using the Deepgram API.
+    Transcribe an audio file with the configured backend (Deepgram by default).
+    Transcripts are cached by audio content, backend and options, so
+    transcribing the same audio again does not call the backend, nor do
+    requests for audio whose transcription is already running.
 
     Args:
         audio_file (str): The path to the audio file to transcribe.
 
     Returns:
         str: The transcript of the audio file.
+
+    Raises:
+        RateLimited: if the model's limits held the call back too long
+        SingleFlightTimeout: if the same audio's transcription ran too long
     """
     try:
-        deepgram = DeepgramClient(api_key=os.getenv("DEEPGRAM_API_KEY"))
-
-        with open(audio_file, "rb") as file:
-            buffer_data = file.read()
+        options = {"backend": get_transcription_backend().name, **TRANSCRIBE_OPTIONS}
+        key = cache_key(transcript_cache.file_digest(audio_file), options)
+        cached = transcript_cache.get(key)
+        if cached is not None:
+            return cached
 
-        payload: FileSource = {
-            "buffer": buffer_data,
-        }
-
-        options = PrerecordedOptions(
-            model="nova-3",
-            smart_format=True,
-        )
-
-        response = deepgram.listen.rest.v("1").transcribe_file(payload, options)
-        result = response.results.channels[0].alternatives[0]
-        return result.transcript
+        # the same audio under several paths is still transcribed once
+        return single_flight.do(f"audio:{key}", fetch_transcript, audio_file, key)
 
     except (OSError, IOError) as e:
         return f"File operation error: {e}"
@@ -282,5 +523,88 @@ def get_transcript(audio_file: str):
         return f"index error: {e}"
 
 
+def fetch_transcript(audio_file, key):
+    """
+    Transcribe an audio file with the backend and cache the transcript.
+    At most the model's rate and concurrency reach the provider.
+
+    Args:
+        audio_file (str): the path to the audio file to transcribe
+        key (str): the transcript's cache key
+
+    Returns:
+        str: the transcript
+
+    Raises:
+        RateLimited: if the model's limits held the call back too long
+    """
+    model = TRANSCRIBE_OPTIONS.get("model", get_transcription_backend().name)
+    transcript = governor(model, rate_limits_collection).call(
+        get_transcription_backend().transcribe, audio_file, TRANSCRIBE_OPTIONS
+    )
+    transcript_cache.put(key, transcript)
+    return transcript
+
+
+def query_shapes():
+    """
+    List every query shape the ml client issues, with representative values.
+    """
+    now = datetime.now(timezone.utc)
+    shape = schema.query_shape
+    return [
+        shape("transcribe_and_store", "transcriptions", {"audio_file": "x"}),
+        shape(
+            "batch entries",
+            "transcriptions",
+            {"audio_file": {"$in": ["x", "y"]}},
+        ),
+        shape(
+            "claim job",
+            "transcription_jobs",
+            {
+                "$or": [
+                    {"status": JOB_QUEUED},
+                    {"status": JOB_RUNNING, "lease_expires_at": {"$lt": now}},
+                ]
+            },
+            sort=[("created_at", 1)],
+        ),
+        shape(
+            "renew/complete/fail job",
+            "transcription_jobs",
+            {"_id": "x", "status": JOB_RUNNING, "lease_owner": "worker"},
+        ),
+        shape("transcript cache lookup", "transcript_cache", {"_id": "x"}),
+    ]
+
+
+@app.cli.command("audit-queries")
+def audit_queries_command():
+    """
+    Explain every ml client query shape and report docs examined vs. returned.
+    """
+    reports = schema.audit_queries(db, query_shapes())
+    if any(report["collscan"] for report in reports):
+        raise SystemExit("Some query shapes do a COLLSCAN")
+
+
+def create_app():
+    """
+    Prepares the ml client for serving in this process and returns it: the
+    indexes exist and WORKER_COUNT job worker threads run in this process.
+    Production runs it once per worker: gunicorn -c gunicorn.conf.py "app:create_app()"
+    """
+    app.logger.setLevel(logging.INFO)
+    app.logger.info("AUDIO_FOLDER: %s", AUDIO_FOLDER)
+    app.logger.info("Transcription backend: %s", get_transcription_backend().name)
+    schema.ensure_indexes(db)
+    if WORKER_COUNT > 0:
+        start_workers(jobs_collection, handle_transcription_job, WORKER_COUNT)
+    startup.report("ml-client")
+    return app
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=6000)
+    # development server, single process
+    create_app().run(host="0.0.0.0", port=6000)
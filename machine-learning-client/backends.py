@@ -0,0 +1,362 @@
+"""
+Transcription backends for the ml client.
+
+The backend is chosen with TRANSCRIBE_BACKEND:
+- "deepgram" (default) calls the Deepgram API through one long-lived client
+  and a pooled HTTP transport shared by every request.
+- "local" needs no network: it returns a deterministic transcript derived
+  from the audio content, sized by the audio duration, after a configurable
+  delay. Use it to load-test the pipeline on a disconnected box.
+
+The Deepgram SDK and httpx take a few hundred milliseconds to import, so
+they are only imported when the Deepgram backend first transcribes.
+
+Deepgram calls go through a resilience.Endpoint: their timeout grows with the
+audio duration and the latency seen so far, timeouts, connection errors and
+5xx answers are retried, and repeated failures open its circuit. A 429 is not
+retried here, as a retry would skip the model's token bucket (ratelimit): it
+is raised as RateLimited, so the caller retries later.
+"""
+
+import abc
+import functools
+import hashlib
+import importlib
+import os
+import random
+import threading
+import time
+from ratelimit import RateLimited
+from resilience import AdaptiveTimeout, Endpoint, audio_duration
+
+DEEPGRAM_MAX_CONNECTIONS = int(os.getenv("DEEPGRAM_MAX_CONNECTIONS", "20"))
+LOCAL_BACKEND_LATENCY = float(os.getenv("LOCAL_BACKEND_LATENCY", "0"))
+LOCAL_WORDS_PER_SECOND = float(os.getenv("LOCAL_WORDS_PER_SECOND", "2.5"))
+
+# Deepgram call timeouts: at least DEEPGRAM_MIN_TIMEOUT, growing with the audio
+# duration, at most DEEPGRAM_MAX_TIMEOUT seconds
+DEEPGRAM_MIN_TIMEOUT = float(os.getenv("DEEPGRAM_MIN_TIMEOUT", "10"))
+DEEPGRAM_MAX_TIMEOUT = float(os.getenv("DEEPGRAM_MAX_TIMEOUT", "300"))
+DEEPGRAM_CONNECT_TIMEOUT = 5.0
+# Processing seconds per audio second assumed before any call was timed
+DEEPGRAM_SECONDS_PER_AUDIO_SECOND = 0.25
+DEEPGRAM_RETRY_STATUSES = {408, 500, 502, 503, 504}
+DEEPGRAM_RATE_LIMITED_STATUS = 429
+# Suggested wait before transcribing again after Deepgram answered 429
+DEEPGRAM_RETRY_AFTER_SECONDS = 5.0
+
+LOCAL_VOCABULARY = (
+    "meeting project team update customer release review budget quarter "
+    "design feature issue plan schedule market product support data report "
+    "question answer decision goal result change process service system "
+    "week today tomorrow morning idea problem solution next point time"
+).split()
+LOCAL_FILLER = "the and to of a in that we it for is on with this".split()
+
+
+class TranscriptionBackend(abc.ABC):
+    """
+    Interface of a transcription backend.
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    def transcribe(self, audio_file, options):
+        """
+        Transcribe an audio file.
+
+        Args:
+            audio_file (str): path of the audio file
+            options (dict): transcription options, e.g. model and smart_format
+
+        Returns:
+            str: the transcript
+        """
+
+
+# Names of the Deepgram SDK this module uses, see deepgram_sdk()
+DEEPGRAM_NAMES = ("DeepgramApiError", "DeepgramClient", "PrerecordedOptions")
+
+
+def deepgram_sdk(name):
+    """
+    A name from the Deepgram SDK, importing the SDK on first use. A name
+    patched onto this module (e.g. in tests) takes precedence.
+    """
+    value = globals().get(name)
+    if value is None:
+        value = getattr(importlib.import_module("deepgram"), name)
+    return value
+
+
+def __getattr__(name):
+    if name in DEEPGRAM_NAMES:
+        return deepgram_sdk(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def persistent_transport_class():
+    """
+    HTTP transport that survives the per-request httpx.Client the Deepgram SDK
+    opens and closes, so its keep-alive connection pool is reused.
+    """
+    httpx = importlib.import_module("httpx")
+
+    class PersistentTransport(httpx.HTTPTransport):
+        """httpx.HTTPTransport that ignores close()."""
+
+        def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+            pass
+
+        def close(self):
+            """Keep the pool open for the next request."""
+
+    return PersistentTransport
+
+
+def deepgram_retryable(error):
+    """
+    Whether a failed Deepgram call is worth retrying: timeouts, connection
+    errors and 5xx answers are, bad requests, auth errors and 429 are not.
+    """
+    if isinstance(error, importlib.import_module("httpx").TransportError):
+        return True
+    if isinstance(error, deepgram_sdk("DeepgramApiError")):
+        return _status(error) in DEEPGRAM_RETRY_STATUSES
+    return False
+
+
+def _status(error):
+    """HTTP status of a DeepgramApiError, None if it has none."""
+    try:
+        return int(error.status)
+    except (TypeError, ValueError):
+        return None
+
+
+class DeepgramBackend(TranscriptionBackend):
+    """
+    Deepgram pre-recorded API with one shared client and connection pool.
+    """
+
+    name = "deepgram"
+
+    def __init__(self, api_key=None, max_connections=DEEPGRAM_MAX_CONNECTIONS):
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self._transport = None
+        self._client = None
+        self._lock = threading.Lock()
+        self.endpoint = Endpoint(
+            "deepgram",
+            AdaptiveTimeout(
+                DEEPGRAM_MIN_TIMEOUT,
+                DEEPGRAM_MAX_TIMEOUT,
+                DEEPGRAM_SECONDS_PER_AUDIO_SECOND,
+            ),
+            deepgram_retryable,
+        )
+
+    @property
+    def transport(self):
+        """
+        The shared HTTP transport, created on first use.
+        """
+        if self._transport is None:
+            with self._lock:
+                if self._transport is None:
+                    httpx = importlib.import_module("httpx")
+                    self._transport = persistent_transport_class()(
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                        )
+                    )
+        return self._transport
+
+    def client(self):
+        """
+        Return the shared DeepgramClient, creating it on first use.
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = deepgram_sdk("DeepgramClient")(
+                        api_key=self.api_key or os.getenv("DEEPGRAM_API_KEY")
+                    )
+        return self._client
+
+    def transcribe(self, audio_file, options):
+        """
+        Transcribe through the Deepgram endpoint, see TranscriptionBackend.
+
+        Raises:
+            RateLimited: if Deepgram answered 429
+        """
+        httpx = importlib.import_module("httpx")
+
+        def send(timeout):
+            # The open file is the request body: httpx sends it in 64KB reads
+            # with a Content-Length from fstat, so the audio is never held in
+            # memory. Each attempt reopens it.
+            with open(audio_file, "rb") as file:
+                return (
+                    self.client()
+                    .listen.rest.v("1")
+                    .transcribe_file(
+                        {"stream": file},
+                        deepgram_sdk("PrerecordedOptions")(**options),
+                        timeout=httpx.Timeout(
+                            timeout, connect=min(timeout, DEEPGRAM_CONNECT_TIMEOUT)
+                        ),
+                        transport=self.transport,
+                    )
+                )
+
+        try:
+            response = self.endpoint.call(send, audio_duration(audio_file))
+        except deepgram_sdk("DeepgramApiError") as e:
+            if _status(e) == DEEPGRAM_RATE_LIMITED_STATUS:
+                raise RateLimited(self.name, DEEPGRAM_RETRY_AFTER_SECONDS) from e
+            raise
+        result = response.results.channels[0].alternatives[0]
+        return result.transcript
+
+
+class LocalBackend(TranscriptionBackend):  # pylint: disable=too-few-public-methods
+    """
+    Offline backend returning a deterministic transcript for an audio file.
+
+    The same audio content always gives the same transcript. Its length
+    follows the audio duration (words_per_second), and each call sleeps for
+    latency seconds to stand in for the provider round trip.
+    """
+
+    name = "local"
+
+    def __init__(
+        self, latency=LOCAL_BACKEND_LATENCY, words_per_second=LOCAL_WORDS_PER_SECOND
+    ):
+        self.latency = latency
+        self.words_per_second = words_per_second
+
+    def transcribe(self, audio_file, options):
+        sha256 = hashlib.sha256()
+        with open(audio_file, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        rng = random.Random(sha256.hexdigest())
+        word_total = max(1, int(audio_duration(audio_file) * self.words_per_second))
+
+        words = []
+        for _ in range(word_total):
+            pool = LOCAL_FILLER if rng.random() < 0.4 else LOCAL_VOCABULARY
+            words.append(rng.choice(pool))
+        sentences = [
+            " ".join(words[i : i + 12]).capitalize() + "."
+            for i in range(0, len(words), 12)
+        ]
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return " ".join(sentences)
+
+
+BACKENDS = {
+    DeepgramBackend.name: DeepgramBackend,
+    LocalBackend.name: LocalBackend,
+}
+
+
+def get_backend(name=None):
+    """
+    Build the configured transcription backend.
+
+    Args:
+        name (str): backend name, defaults to TRANSCRIBE_BACKEND or "deepgram"
+
+    Returns:
+        TranscriptionBackend: the backend instance
+
+    Raises:
+        ValueError: if the backend name is unknown
+    """
+    name = name or os.getenv("TRANSCRIBE_BACKEND", DeepgramBackend.name)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend: {name}")
+    return BACKENDS[name]()
+
+
+def _legacy_transcribe(backend, audio_file, options):
+    """The Deepgram upload as it was: the whole file read into one bytes."""
+    with open(audio_file, "rb") as file:
+        payload = {"buffer": file.read()}
+    response = (
+        backend.client()
+        .listen.rest.v("1")
+        .transcribe_file(
+            payload,
+            deepgram_sdk("PrerecordedOptions")(**options),
+            transport=backend.transport,
+        )
+    )
+    return response.results.channels[0].alternatives[0].transcript
+
+
+def _benchmark(sizes_mb=(5, 20, 50), concurrency=(1, 4, 16)):
+    """
+    Trace peak memory of concurrent Deepgram uploads, buffered against
+    streamed, as file size and concurrency grow. Requests go to a transport
+    that drains the body in chunks and answers with a canned result.
+    """
+    # pylint: disable=import-outside-toplevel,too-many-locals
+    import tempfile
+    import tracemalloc
+    from concurrent.futures import ThreadPoolExecutor
+
+    httpx = importlib.import_module("httpx")
+
+    class DrainTransport(httpx.BaseTransport):  # pylint: disable=too-few-public-methods
+        """Reads each request body in chunks, like a socket would."""
+
+        def handle_request(self, request):
+            """Drain the body and answer with an empty transcript."""
+            for _ in request.stream:
+                pass
+            alternatives = [{"transcript": "", "words": []}]
+            return httpx.Response(
+                200,
+                json={
+                    "metadata": {},
+                    "results": {"channels": [{"alternatives": alternatives}]},
+                },
+            )
+
+    backend = DeepgramBackend(api_key="key")
+    backend._transport = DrainTransport()  # pylint: disable=protected-access
+    runs = (("buffer", _legacy_transcribe), ("stream", DeepgramBackend.transcribe))
+
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes_mb:
+            audio_file = os.path.join(folder, f"{size}mb.mp3")
+            with open(audio_file, "wb") as file:
+                for _ in range(size):
+                    file.write(os.urandom(1024 * 1024))
+            backend.transcribe(audio_file, {})  # warm up the SDK
+            for workers in concurrency:
+                for name, run in runs:
+                    tracemalloc.start()
+                    with ThreadPoolExecutor(workers) as pool:
+                        for _ in range(workers):
+                            pool.submit(run, backend, audio_file, {})
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    print(
+                        f"{size:3d} MB x {workers:2d}: {name} peak {peak / 1e6:7.1f} MB"
+                    )
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -4,8 +4,12 @@ fixture for test_ml_client
 
 import os
 import tempfile
+from unittest.mock import patch
 import pytest
 from app import app
+from backends import DeepgramBackend
+from singleflight import SingleFlight
+from transcript_cache import TranscriptCache
 
 
 @pytest.fixture
@@ -34,3 +38,25 @@ def test_client():
     for file in os.listdir(app.config["UPLOAD_FOLDER"]):
         os.remove(os.path.join(app.config["UPLOAD_FOLDER"], file))
     os.rmdir(app.config["UPLOAD_FOLDER"])
+
+
+@pytest.fixture(autouse=True)
+def memory_only_transcript_cache():
+    """Give every test an empty transcript cache without the MongoDB tier"""
+    with patch("app.transcript_cache", TranscriptCache()) as cache:
+        yield cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_deepgram_backend():
+    """Give every test a Deepgram backend that has not created its client yet"""
+    backend = DeepgramBackend()
+    with patch("app.get_transcription_backend", return_value=backend):
+        yield backend
+
+
+@pytest.fixture(autouse=True)
+def in_process_single_flight():
+    """Give every test a single flight without the MongoDB locks"""
+    with patch("app.single_flight", SingleFlight()) as flight:
+        yield flight
@@ -0,0 +1,163 @@
+"""
+Corpus-wide word counts, shared by the web-app and the ml client.
+
+The corpus_word_counts collection is a materialized view of the word counts
+of every entry's transcript, across all entries and per speaker. Every write
+that changes a transcript or a speaker applies the difference with atomic
+$inc updates (record_change()), so corpus_top_words() answers from the
+scope_count index, whatever the number of entries. Words whose count drops
+to zero stay in the view until rebuild() recomputes it from the entries.
+"""
+
+from collections import Counter
+from datetime import datetime, timezone
+from pymongo import DESCENDING, InsertOne, UpdateOne
+from pymongo.errors import PyMongoError
+from text_analytics import STOP_WORDS, word_frequencies
+import schema
+
+CORPUS_COLLECTION = "corpus_word_counts"
+ALL_SCOPE = "all"
+
+
+def speaker_scope(speaker):
+    """
+    Scope name of a speaker's word counts.
+    """
+    return f"speaker:{(speaker or '').strip().lower()}"
+
+
+def _doc_id(scope, word):
+    return f"{scope}|{word}"
+
+
+def _scope_deltas(old_counts, new_counts, old_speaker, new_speaker):
+    """Count changes per scope, for one entry going from old to new."""
+    delta = Counter(new_counts)
+    delta.subtract(old_counts)
+    if speaker_scope(old_speaker) == speaker_scope(new_speaker):
+        return {ALL_SCOPE: delta, speaker_scope(new_speaker): delta}
+    removed = Counter()
+    removed.subtract(old_counts)
+    return {
+        ALL_SCOPE: delta,
+        speaker_scope(old_speaker): removed,
+        speaker_scope(new_speaker): Counter(new_counts),
+    }
+
+
+def record_change(corpus, old_counts, new_counts, old_speaker, new_speaker):
+    """
+    Apply the change of one entry's word counts to the corpus view, in a
+    single unordered bulk write that skips unchanged words.
+
+    Args:
+        corpus: the corpus_word_counts collection
+        old_counts (Counter): word counts of the entry before the change,
+            empty for a new entry
+        new_counts (Counter): word counts after the change, empty for a
+            deleted entry
+        old_speaker (str): speaker before the change
+        new_speaker (str): speaker after the change
+
+    Returns:
+        bool: True if the view was updated, False on a database error
+    """
+    deltas = _scope_deltas(old_counts, new_counts, old_speaker, new_speaker)
+    now = datetime.now(timezone.utc)
+    operations = []
+    for scope, scope_delta in deltas.items():
+        for word, change in scope_delta.items():
+            if change == 0 or word in STOP_WORDS:
+                continue
+            operations.append(
+                UpdateOne(
+                    {"_id": _doc_id(scope, word)},
+                    {
+                        "$inc": {"count": change},
+                        "$set": {"updated_at": now},
+                        "$setOnInsert": {"scope": scope, "word": word},
+                    },
+                    upsert=True,
+                )
+            )
+    if not operations:
+        return True
+    try:
+        corpus.bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        print(f"Error updating corpus word counts: {e}")
+        return False
+    return True
+
+
+def corpus_top_words(corpus, speaker=None, limit=10):
+    """
+    Most frequent words across all entries, or across one speaker's entries.
+
+    Returns:
+        list: [word, count] pairs, most frequent first
+    """
+    scope = ALL_SCOPE if speaker is None else speaker_scope(speaker)
+    cursor = (
+        corpus.find(
+            {"scope": scope, "count": {"$gt": 0}}, {"_id": 0, "word": 1, "count": 1}
+        )
+        .sort([("count", DESCENDING)])
+        .limit(limit)
+    )
+    return [[doc["word"], doc["count"]] for doc in cursor]
+
+
+def rebuild(db, entries, batch_size=1000):
+    """
+    Recompute the corpus view from every entry's transcript.
+
+    The view is built in a scratch collection and swapped in with a rename,
+    so readers never see a half-built view. Changes recorded while the
+    rebuild runs are lost; run it when the service is quiet.
+
+    Args:
+        db: the MongoDB database
+        entries: the transcriptions collection
+        batch_size (int): inserts per bulk write
+
+    Returns:
+        int: number of entries counted
+    """
+    totals = {}
+    counted = 0
+    for entry in entries.find({}, {"transcript": 1, "speaker": 1}):
+        counts = word_frequencies(entry.get("transcript") or "")
+        for scope in (ALL_SCOPE, speaker_scope(entry.get("speaker"))):
+            totals.setdefault(scope, Counter()).update(counts)
+        counted += 1
+
+    scratch = db[f"{CORPUS_COLLECTION}_rebuild"]
+    scratch.drop()
+    now = datetime.now(timezone.utc)
+    batch = []
+    for scope, counts in totals.items():
+        for word, count in counts.items():
+            if word in STOP_WORDS:
+                continue
+            batch.append(
+                InsertOne(
+                    {
+                        "_id": _doc_id(scope, word),
+                        "scope": scope,
+                        "word": word,
+                        "count": count,
+                        "updated_at": now,
+                    }
+                )
+            )
+            if len(batch) >= batch_size:
+                scratch.bulk_write(batch, ordered=False)
+                batch = []
+    if batch:
+        scratch.bulk_write(batch, ordered=False)
+    # also creates the collection if there was nothing to insert
+    schema.ensure_indexes(db, {scratch.name: schema.INDEXES[CORPUS_COLLECTION]})
+    scratch.rename(CORPUS_COLLECTION, dropTarget=True)
+    return counted
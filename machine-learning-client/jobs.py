@@ -0,0 +1,285 @@
+"""
+Durable transcription job queue backed by a MongoDB collection.
+
+The web-app enqueues one job per uploaded audio file. Any number of workers,
+in any number of ml-client replicas, claim jobs with a time-limited lease,
+keep the lease alive with heartbeats while working, and write the result back.
+A job whose lease expires (worker crashed or hung) is picked up again by
+another worker until it runs out of attempts.
+"""
+
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying the job cannot succeed."""
+
+
+class RetryLaterError(Exception):
+    """
+    Raised by a job handler when the job cannot run for now, e.g. while a
+    circuit breaker is open. The job goes back to the queue without using up
+    an attempt and the worker pauses for delay seconds.
+    """
+
+    def __init__(self, message, delay):
+        super().__init__(message)
+        self.delay = delay
+
+
+def new_worker_id():
+    """
+    Build a worker id that is unique across threads and replicas.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def claim_job(jobs, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Atomically claim the oldest queued job, or a running job whose lease expired.
+
+    Args:
+        jobs: the job collection
+        worker_id (str): id written as the lease owner
+        lease_seconds (int): how long the lease lasts without a heartbeat
+
+    Returns:
+        dict: the claimed job document, or None if there is nothing to do
+    """
+    now = datetime.now(timezone.utc)
+    return jobs.find_one_and_update(
+        {
+            "$or": [
+                {"status": JOB_QUEUED},
+                {"status": JOB_RUNNING, "lease_expires_at": {"$lt": now}},
+            ]
+        },
+        {
+            "$set": {
+                "status": JOB_RUNNING,
+                "lease_owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def renew_lease(jobs, job_id, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Extend the lease on a job this worker still owns.
+
+    Returns:
+        bool: False if the lease was lost to another worker
+    """
+    now = datetime.now(timezone.utc)
+    result = jobs.update_one(
+        {"_id": job_id, "status": JOB_RUNNING, "lease_owner": worker_id},
+        {
+            "$set": {
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "updated_at": now,
+            }
+        },
+    )
+    return result.matched_count > 0
+
+
+def complete_job(jobs, job_id, worker_id, result):
+    """
+    Mark a job done and store its result, if this worker still owns it.
+    """
+    outcome = jobs.update_one(
+        {"_id": job_id, "status": JOB_RUNNING, "lease_owner": worker_id},
+        {
+            "$set": {
+                "status": JOB_DONE,
+                "result": result,
+                "error": None,
+                "updated_at": datetime.now(timezone.utc),
+            },
+            "$unset": {"lease_owner": "", "lease_expires_at": ""},
+        },
+    )
+    return outcome.matched_count > 0
+
+
+def fail_job(jobs, job, worker_id, error, permanent=False):
+    """
+    Record a failed attempt. The job goes back to the queue unless it is out
+    of attempts or the failure is permanent.
+    """
+    out_of_attempts = job.get("attempts", 0) >= job.get("max_attempts", MAX_ATTEMPTS)
+    status = JOB_FAILED if permanent or out_of_attempts else JOB_QUEUED
+    outcome = jobs.update_one(
+        {"_id": job["_id"], "status": JOB_RUNNING, "lease_owner": worker_id},
+        {
+            "$set": {
+                "status": status,
+                "error": str(error),
+                "updated_at": datetime.now(timezone.utc),
+            },
+            "$unset": {"lease_owner": "", "lease_expires_at": ""},
+        },
+    )
+    return outcome.matched_count > 0
+
+
+def defer_job(jobs, job, worker_id, error):
+    """
+    Put a job back in the queue without counting the attempt.
+    """
+    outcome = jobs.update_one(
+        {"_id": job["_id"], "status": JOB_RUNNING, "lease_owner": worker_id},
+        {
+            "$set": {
+                "status": JOB_QUEUED,
+                "error": str(error),
+                "updated_at": datetime.now(timezone.utc),
+            },
+            "$unset": {"lease_owner": "", "lease_expires_at": ""},
+            "$inc": {"attempts": -1},
+        },
+    )
+    return outcome.matched_count > 0
+
+
+class _Heartbeat(threading.Thread):
+    """
+    Background thread renewing a job lease until stopped.
+    """
+
+    def __init__(self, jobs, job_id, worker_id, lease_seconds):
+        super().__init__(daemon=True)
+        self.jobs = jobs
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            try:
+                if not renew_lease(
+                    self.jobs, self.job_id, self.worker_id, self.lease_seconds
+                ):
+                    self.lost = True
+                    return
+            except PyMongoError as e:
+                print(f"Heartbeat error for job {self.job_id}: {e}")
+
+    def stop(self):
+        """Stop renewing the lease."""
+        self.stopped.set()
+        self.join()
+
+
+def run_job(jobs, job, handler, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Run the handler for a claimed job while heartbeating its lease, then record
+    the outcome.
+
+    Returns:
+        str: the status the job was left in
+
+    Raises:
+        RetryLaterError: after putting the job back, so the worker can pause
+    """
+    if job.get("attempts", 0) > job.get("max_attempts", MAX_ATTEMPTS):
+        fail_job(jobs, job, worker_id, "Lease expired too many times", True)
+        return JOB_FAILED
+
+    heartbeat = _Heartbeat(jobs, job["_id"], worker_id, lease_seconds)
+    heartbeat.start()
+    try:
+        result = handler(job)
+    except PermanentJobError as e:
+        heartbeat.stop()
+        fail_job(jobs, job, worker_id, e, permanent=True)
+        return JOB_FAILED
+    except RetryLaterError as e:
+        heartbeat.stop()
+        print(f"Job {job['_id']} put back: {e}")
+        defer_job(jobs, job, worker_id, e)
+        raise
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        heartbeat.stop()
+        print(f"Job {job['_id']} failed: {e}")
+        fail_job(jobs, job, worker_id, e)
+        return JOB_QUEUED
+    heartbeat.stop()
+
+    if heartbeat.lost or not complete_job(jobs, job["_id"], worker_id, result):
+        print(f"Lost lease on job {job['_id']}, result discarded")
+        return JOB_QUEUED
+    return JOB_DONE
+
+
+def run_worker(jobs, handler, stop_event, worker_id=None, poll_interval=POLL_INTERVAL):
+    """
+    Claim and process jobs until stop_event is set.
+
+    Args:
+        jobs: the job collection
+        handler (callable): takes the job document, returns a result dict
+        stop_event (threading.Event): set to shut the worker down
+        worker_id (str): lease owner id, generated if not given
+        poll_interval (float): seconds to sleep when the queue is empty
+    """
+    worker_id = worker_id or new_worker_id()
+    print(f"Worker {worker_id} started")
+    while not stop_event.is_set():
+        try:
+            job = claim_job(jobs, worker_id)
+        except PyMongoError as e:
+            print(f"Worker {worker_id} could not claim a job: {e}")
+            job = None
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+        try:
+            run_job(jobs, job, handler, worker_id)
+        except RetryLaterError as e:
+            stop_event.wait(e.delay)
+        except PyMongoError as e:
+            # the lease will expire and another worker will retry the job
+            print(f"Worker {worker_id} could not record job {job['_id']}: {e}")
+    print(f"Worker {worker_id} stopped")
+
+
+def start_workers(jobs, handler, count):
+    """
+    Start count worker threads sharing one stop event.
+
+    Returns:
+        tuple: (stop_event, list of threads)
+    """
+    stop_event = threading.Event()
+    threads = []
+    for _ in range(count):
+        thread = threading.Thread(
+            target=run_worker, args=(jobs, handler, stop_event), daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    return stop_event, threads
@@ -0,0 +1,80 @@
+"""
+Per-process MongoDB connections, shared by the web-app and the ml client.
+
+A MongoClient must not be carried across fork(): its pool and monitor
+threads belong to the process that created it. The services' collections are
+therefore LazyCollection stand-ins that open the client on first use, in the
+process using them, and open a fresh one when they find themselves in a
+forked child. Each gunicorn worker then gets its own pool of at most
+MONGO_POOL_SIZE connections.
+"""
+
+import os
+import threading
+from pymongo import MongoClient
+
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", "50"))
+
+_lock = threading.Lock()
+# the client and the id of the process that created it
+_process = {"client": None, "pid": None}
+
+
+def mongo_uri():
+    """
+    Connection string built from the MONGO_* environment variables.
+    """
+    host = os.getenv("MONGO_HOST", "mongodb")
+    port = os.getenv("MONGO_PORT", "27017")
+    username = os.getenv("MONGO_INITDB_ROOT_USERNAME", "admin")
+    password = os.getenv("MONGO_INITDB_ROOT_PASSWORD", "password")
+    return f"mongodb://{username}:{password}@{host}:{port}/"
+
+
+def get_client():
+    """
+    This process's MongoClient, created on first use.
+    """
+    if _process["pid"] != os.getpid():
+        with _lock:
+            if _process["pid"] != os.getpid():
+                # a client inherited through fork() is left alone, never closed
+                _process["client"] = MongoClient(
+                    mongo_uri(), maxPoolSize=MONGO_POOL_SIZE
+                )
+                _process["pid"] = os.getpid()
+    return _process["client"]
+
+
+def get_db():
+    """
+    This process's handle on the MONGO_DB_NAME database.
+    """
+    return get_client().get_database(os.getenv("MONGO_DB_NAME", "voice_data"))
+
+
+class LazyDatabase:
+    """
+    Stands in for the database, resolved in the process using it.
+    """
+
+    def __getitem__(self, name):
+        return LazyCollection(name)
+
+    def __getattr__(self, attribute):
+        return getattr(get_db(), attribute)
+
+
+class LazyCollection:
+    """
+    Stands in for a collection, resolved in the process using it.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(get_db()[self.name], attribute)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
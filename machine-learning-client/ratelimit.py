@@ -0,0 +1,214 @@
+"""
+Rate and concurrency limits for transcription backend calls.
+
+Each model gets a Governor: a token bucket refilling at `rate` calls per
+second up to `burst` calls, and a semaphore allowing `concurrency` calls at
+once. A call waits for a slot and a token for up to TRANSCRIBE_QUEUE_SECONDS,
+then gives up with RateLimited instead of going to the provider and being
+throttled there. Calls are then spread just under the provider's quota.
+
+Limits come from TRANSCRIBE_RATE, TRANSCRIBE_BURST and TRANSCRIBE_CONCURRENCY,
+overridden per model by TRANSCRIBE_LIMITS, e.g.
+TRANSCRIBE_LIMITS='{"nova-3": {"rate": 10, "burst": 20, "concurrency": 8}}'.
+
+The bucket is per process unless TRANSCRIBE_RATE_SHARED=1. Then every
+process and replica takes its tokens from one document per model in the
+rate_limits collection, so `rate` is the limit of the whole deployment.
+If MongoDB cannot be reached, each process falls back to its own bucket.
+The concurrency limit is always per process.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+TRANSCRIBE_RATE = float(os.getenv("TRANSCRIBE_RATE", "5"))
+TRANSCRIBE_BURST = float(os.getenv("TRANSCRIBE_BURST", "10"))
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "8"))
+TRANSCRIBE_LIMITS = json.loads(os.getenv("TRANSCRIBE_LIMITS", "{}"))
+TRANSCRIBE_QUEUE_SECONDS = float(os.getenv("TRANSCRIBE_QUEUE_SECONDS", "30"))
+TRANSCRIBE_RATE_SHARED = os.getenv("TRANSCRIBE_RATE_SHARED", "0") == "1"
+RATE_LIMIT_COLLECTION = "rate_limits"
+
+
+class RateLimited(Exception):
+    """Raised when a call got no slot or token within the queue time."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} rate limited, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """
+    Process-local token bucket.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """
+        Take a token if there is one.
+
+        Returns:
+            float: 0 if a token was taken, else seconds until one is due
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class SharedTokenBucket:  # pylint: disable=too-few-public-methods
+    """
+    Token bucket kept in a MongoDB document, shared by every process using
+    the same key. Refilling and taking a token is one atomic update.
+    """
+
+    def __init__(self, collection, key, rate, burst):
+        self.collection = collection
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self.local = TokenBucket(rate, burst)
+
+    def take(self):
+        """
+        Take a token from the shared bucket, or from the local one if MongoDB
+        cannot be reached.
+
+        Returns:
+            float: 0 if a token was taken, else seconds until one is due
+        """
+        now = datetime.now(timezone.utc)
+        # replicas' clocks may disagree a little, time never runs backwards
+        elapsed = {
+            "$max": [0, {"$divide": [{"$subtract": [now, "$updated_at"]}, 1000]}]
+        }
+        refilled = {
+            "$cond": [
+                {"$eq": [{"$type": "$updated_at"}, "date"]},
+                {
+                    "$min": [
+                        self.burst,
+                        {"$add": ["$tokens", {"$multiply": [elapsed, self.rate]}]},
+                    ]
+                },
+                self.burst,
+            ]
+        }
+        pipeline = [
+            {"$set": {"tokens": refilled, "updated_at": now}},
+            {"$set": {"granted": {"$gte": ["$tokens", 1]}}},
+            {
+                "$set": {
+                    "tokens": {
+                        "$cond": ["$granted", {"$subtract": ["$tokens", 1]}, "$tokens"]
+                    }
+                }
+            },
+        ]
+        for _ in range(2):
+            try:
+                bucket = self.collection.find_one_and_update(
+                    {"_id": self.key},
+                    pipeline,
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                break
+            except DuplicateKeyError:
+                # another process created the document first, update it
+                continue
+            except PyMongoError as e:
+                print(f"Shared rate limit unavailable, limiting locally: {e}")
+                return self.local.take()
+        else:
+            return self.local.take()
+        if bucket["granted"]:
+            return 0.0
+        return (1 - bucket["tokens"]) / self.rate
+
+
+class Governor:  # pylint: disable=too-few-public-methods
+    """
+    Concurrency semaphore and token bucket guarding one model's calls.
+    """
+
+    def __init__(
+        self, name, bucket, concurrency, queue_seconds=TRANSCRIBE_QUEUE_SECONDS
+    ):
+        self.name = name
+        self.bucket = bucket
+        self.queue_seconds = queue_seconds
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def call(self, func, *args):
+        """
+        Call func(*args) once a slot and a token are available.
+
+        Raises:
+            RateLimited: if either took longer than queue_seconds
+        """
+        deadline = time.monotonic() + self.queue_seconds
+        # pylint: disable-next=consider-using-with
+        if not self._slots.acquire(timeout=self.queue_seconds):
+            raise RateLimited(self.name, 1.0)
+        try:
+            while True:
+                wait = self.bucket.take()
+                if wait == 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    raise RateLimited(self.name, wait)
+                time.sleep(wait)
+            return func(*args)
+        finally:
+            self._slots.release()
+
+
+_governors = {}
+_lock = threading.Lock()
+
+
+def governor(model, collection=None):
+    """
+    The Governor of a model, created on first use from the configured limits.
+
+    Args:
+        model (str): the model name, key of TRANSCRIBE_LIMITS
+        collection: the rate_limits collection, used if TRANSCRIBE_RATE_SHARED
+
+    Returns:
+        Governor: shared by every call for the model in this process
+    """
+    with _lock:
+        if model not in _governors:
+            limits = TRANSCRIBE_LIMITS.get(model, {})
+            rate = float(limits.get("rate", TRANSCRIBE_RATE))
+            burst = float(limits.get("burst", TRANSCRIBE_BURST))
+            if TRANSCRIBE_RATE_SHARED and collection is not None:
+                bucket = SharedTokenBucket(collection, model, rate, burst)
+            else:
+                bucket = TokenBucket(rate, burst)
+            _governors[model] = Governor(
+                model,
+                bucket,
+                int(limits.get("concurrency", TRANSCRIBE_CONCURRENCY)),
+            )
+        return _governors[model]
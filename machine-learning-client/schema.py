@@ -0,0 +1,184 @@
+"""
+Index definitions and query-plan audit shared by the web-app and the ml client.
+
+Every index either service relies on is declared in INDEXES, and
+ensure_indexes() creates them at startup. audit_queries() runs explain() on
+the query shapes a service issues and reports how many index keys and
+documents each one examines against how many it returns.
+"""
+
+import os
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+TRANSCRIPT_CACHE_TTL_SECONDS = int(
+    os.getenv("TRANSCRIPT_CACHE_TTL_SECONDS", str(30 * 24 * 3600))
+)
+
+# collection name -> list of (keys, create_index options)
+INDEXES = {
+    "transcriptions": [
+        ([("created_at", DESCENDING), ("_id", DESCENDING)], {"name": "created_at_id"}),
+        ([("audio_file", ASCENDING)], {"name": "audio_file"}),
+        ([("audio_sha256", ASCENDING)], {"name": "audio_sha256"}),
+        ([("title_lc", ASCENDING)], {"name": "title_lc"}),
+        ([("speaker_lc", ASCENDING)], {"name": "speaker_lc"}),
+        ([("date_lc", ASCENDING)], {"name": "date_lc"}),
+        (
+            [("recorded_on", DESCENDING), ("_id", DESCENDING)],
+            {"name": "recorded_on_id"},
+        ),
+        (
+            [
+                ("speaker_lc", ASCENDING),
+                ("recorded_on", DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            {"name": "speaker_lc_recorded_on"},
+        ),
+        (
+            [
+                ("speaker_lc", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            {"name": "speaker_lc_created_at"},
+        ),
+        ([("transcript_updated_at", ASCENDING)], {"name": "transcript_updated_at"}),
+        (
+            [("title", TEXT), ("speaker", TEXT)],
+            {"name": "metadata_text", "default_language": "none"},
+        ),
+    ],
+    "transcription_jobs": [
+        (
+            [("status", ASCENDING), ("created_at", ASCENDING)],
+            {"name": "status_created"},
+        ),
+        (
+            [("status", ASCENDING), ("lease_expires_at", ASCENDING)],
+            {"name": "status_lease"},
+        ),
+        ([("audio_file", ASCENDING), ("status", ASCENDING)], {"name": "audio_status"}),
+    ],
+    "corpus_word_counts": [
+        ([("scope", ASCENDING), ("count", DESCENDING)], {"name": "scope_count"}),
+    ],
+    "single_flight": [
+        # lock documents expire on their own, see singleflight.py
+        (
+            [("expires_at", ASCENDING)],
+            {"name": "expires_at_ttl", "expireAfterSeconds": 0},
+        ),
+    ],
+    "transcript_cache": [
+        (
+            [("created_at", ASCENDING)],
+            {
+                "name": "created_at_ttl",
+                "expireAfterSeconds": TRANSCRIPT_CACHE_TTL_SECONDS,
+            },
+        ),
+    ],
+}
+
+
+def ensure_indexes(db, indexes=None):
+    """
+    Create every declared index. Indexes that already exist are left alone,
+    so this is safe to call on every startup from any number of replicas.
+
+    Args:
+        db: the MongoDB database
+        indexes (dict): collection name -> index specs, defaults to INDEXES
+
+    Returns:
+        list: names of the indexes that could not be created
+    """
+    failed = []
+    for collection_name, specs in (indexes or INDEXES).items():
+        for keys, options in specs:
+            try:
+                db[collection_name].create_index(keys, **options)
+            except OperationFailure as e:
+                # e.g. an index with the same name but different options
+                print(f"Could not create index {options['name']}: {e}")
+                failed.append(options["name"])
+    return failed
+
+
+def query_shape(name, collection, query, projection=None, sort=None):
+    """
+    Describe a query the code issues, with representative values.
+
+    Returns:
+        dict: the query shape
+    """
+    return {
+        "name": name,
+        "collection": collection,
+        "filter": query,
+        "projection": projection,
+        "sort": sort,
+    }
+
+
+def plan_stages(plan):
+    """
+    Collect every stage name in an explain() plan tree.
+    """
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def explain_shape(db, shape):
+    """
+    Run explain() on one query shape.
+
+    Returns:
+        dict: name, winning plan stages, keys/docs examined and docs returned
+    """
+    cursor = db[shape["collection"]].find(shape["filter"], shape["projection"])
+    if shape["sort"]:
+        cursor = cursor.sort(shape["sort"])
+    explained = cursor.explain()
+    stats = explained.get("executionStats", {})
+    stages = plan_stages(explained["queryPlanner"]["winningPlan"])
+    return {
+        "name": shape["name"],
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages,
+        "keys_examined": stats.get("totalKeysExamined", 0),
+        "docs_examined": stats.get("totalDocsExamined", 0),
+        "returned": stats.get("nReturned", 0),
+    }
+
+
+def audit_queries(db, shapes):
+    """
+    Explain every query shape and print a report.
+
+    Args:
+        db: the MongoDB database
+        shapes (list): query shapes from query_shape()
+
+    Returns:
+        list: one explain_shape() report per shape
+    """
+    reports = [explain_shape(db, shape) for shape in shapes]
+    for report in reports:
+        flag = "  COLLSCAN" if report["collscan"] else ""
+        print(
+            f"{report['name']}: keys {report['keys_examined']}, "
+            f"docs {report['docs_examined']}, returned {report['returned']} "
+            f"[{' -> '.join(report['stages'])}]{flag}"
+        )
+    return reports
@@ -0,0 +1,270 @@
+"""
+Single-flight execution of transcriptions.
+
+A retry or a double-click can post the same audio to /get-transcripts while
+its first request is still running. SingleFlight.do(key, func) runs func
+once per key at a time and hands its result to every request that arrives
+meanwhile, instead of calling Deepgram and updating MongoDB again.
+
+Within a process, later callers wait for the running call and share its
+result or its exception. Across processes and replicas, the caller running
+func holds a lock document in the single_flight collection. It renews the
+lock every LOCK_SECONDS / 3 while func runs and, when func returns, stores
+the result in the document for RESULT_SECONDS. Callers in other processes
+poll the document and return that result if they saw that run in progress.
+A caller arriving after the run finished runs func again. If the holder
+fails, the lock is deleted. If the holder dies, its lock expires after
+LOCK_SECONDS. Either way a waiting caller then runs func itself. Results
+must be storable in MongoDB. If MongoDB cannot be reached, calls are only
+deduplicated within the process.
+
+No caller waits longer than WAIT_SECONDS, which is under the ml-client's
+gunicorn timeout. After that it raises SingleFlightTimeout, answered with
+503 and Retry-After like the other "try again later" errors.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+SINGLE_FLIGHT_COLLECTION = "single_flight"
+LOCK_SECONDS = float(os.getenv("SINGLE_FLIGHT_LOCK_SECONDS", "30"))
+RESULT_SECONDS = float(os.getenv("SINGLE_FLIGHT_RESULT_SECONDS", "10"))
+POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", "0.2"))
+WAIT_SECONDS = float(os.getenv("SINGLE_FLIGHT_WAIT_SECONDS", "100"))
+# Suggested wait before asking again after SingleFlightTimeout
+RETRY_AFTER_SECONDS = 5.0
+
+RUNNING = "running"
+DONE = "done"
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when the running call for a key took longer than WAIT_SECONDS."""
+
+    def __init__(self, key, retry_after=RETRY_AFTER_SECONDS):
+        super().__init__(f"{key} still running, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class _Call:  # pylint: disable=too-few-public-methods
+    """
+    A running call and its outcome, shared by the callers that wait for it.
+    """
+
+    def __init__(self):
+        self.finished = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time, in this process and, given a
+    collection, across processes.
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._calls = {}
+        # keys whose lock documents this process holds, renewed in the background
+        self._held = set()
+        self._renewer = None
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "shared": 0, "shared_remote": 0}
+
+    def do(self, key, func, *args):
+        """
+        Call func(*args), or wait for the call already running for key and
+        return its result.
+
+        Args:
+            key (str): what makes two calls the same, e.g. the audio path
+            func (callable): the call to run at most once at a time per key
+
+        Returns:
+            what func returns
+
+        Raises:
+            SingleFlightTimeout: if the running call took over WAIT_SECONDS
+            what func raises, also to the callers sharing its call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.counters["calls"] += 1
+            else:
+                self.counters["shared"] += 1
+        if not leader:
+            if not call.finished.wait(WAIT_SECONDS):
+                raise SingleFlightTimeout(key)
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._run(key, func, args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.finished.set()
+
+    def _run(self, key, func, args):
+        """
+        Run func under the key's lock document, or return the result stored
+        by the process that ran it.
+        """
+        if self.collection is None:
+            return func(*args)
+        try:
+            stored = self._acquire(key)
+        except PyMongoError as e:
+            print(f"Single flight lock unavailable, running {key} anyway: {e}")
+            return func(*args)
+        if stored is not None:
+            with self._lock:
+                self.counters["shared_remote"] += 1
+            return stored["result"]
+        self._hold(key)
+        try:
+            result = func(*args)
+        except Exception:
+            self._release(key)
+            raise
+        self._store(key, result)
+        return result
+
+    def _acquire(self, key):
+        """
+        Take the key's lock document, waiting while another process holds it.
+
+        Returns:
+            dict: None once the lock is taken, or the lock document holding
+            the result of the run this caller waited for
+
+        Raises:
+            SingleFlightTimeout: if the lock stayed held for WAIT_SECONDS
+        """
+        deadline = time.monotonic() + WAIT_SECONDS
+        # the run in progress when this caller started waiting
+        waited_for = None
+        while True:
+            now = datetime.now(timezone.utc)
+            lock = {
+                "owner": self.owner,
+                "run": uuid.uuid4().hex,
+                "state": RUNNING,
+                "expires_at": now + timedelta(seconds=LOCK_SECONDS),
+            }
+            try:
+                self.collection.insert_one({"_id": key, **lock})
+                return None
+            except DuplicateKeyError:
+                pass
+            # an expired lock, or a result nobody here waited for, is taken over
+            taken = self.collection.update_one(
+                {
+                    "_id": key,
+                    "$or": [
+                        {"expires_at": {"$lt": now}},
+                        {"state": DONE, "run": {"$ne": waited_for}},
+                    ],
+                },
+                {"$set": lock},
+            )
+            if taken.matched_count:
+                return None
+            stored = self.collection.find_one({"_id": key})
+            if stored is not None:
+                if (
+                    stored["state"] == DONE
+                    and waited_for is not None
+                    and stored.get("run") == waited_for
+                ):
+                    return stored
+                if stored["state"] == RUNNING:
+                    waited_for = stored.get("run")
+            if time.monotonic() >= deadline:
+                raise SingleFlightTimeout(key)
+            time.sleep(POLL_INTERVAL)
+
+    def _release(self, key):
+        """
+        Stop renewing the key's lock and delete it, as func failed.
+        """
+        with self._lock:
+            self._held.discard(key)
+        try:
+            self.collection.delete_one({"_id": key, "owner": self.owner})
+        except PyMongoError as e:
+            # the lock expires on its own
+            print(f"Could not release single flight lock {key}: {e}")
+
+    def _store(self, key, result):
+        """
+        Stop renewing the key's lock and store func's result in it for
+        RESULT_SECONDS.
+        """
+        with self._lock:
+            self._held.discard(key)
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=RESULT_SECONDS)
+        try:
+            self.collection.update_one(
+                {"_id": key, "owner": self.owner},
+                {"$set": {"state": DONE, "result": result, "expires_at": expires_at}},
+            )
+        except PyMongoError as e:
+            # the lock expires on its own
+            print(f"Could not store single flight result {key}: {e}")
+
+    def _hold(self, key):
+        """
+        Renew the key's lock until it is released, with one background
+        thread renewing every lock of this process.
+        """
+        with self._lock:
+            self._held.add(key)
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew, daemon=True)
+                self._renewer.start()
+
+    def _renew(self):
+        """
+        Push back the expiry of every held lock, every LOCK_SECONDS / 3.
+        """
+        while True:
+            time.sleep(LOCK_SECONDS / 3)
+            with self._lock:
+                held = list(self._held)
+            if not held:
+                continue
+            try:
+                self.collection.update_many(
+                    {"_id": {"$in": held}, "owner": self.owner, "state": RUNNING},
+                    {
+                        "$set": {
+                            "expires_at": datetime.now(timezone.utc)
+                            + timedelta(seconds=LOCK_SECONDS)
+                        }
+                    },
+                )
+            except PyMongoError as e:
+                print(f"Could not renew single flight locks: {e}")
+
+    def stats(self):
+        """
+        Calls run, and calls that shared a running call in this process or
+        took the result stored by another process.
+        """
+        with self._lock:
+            return dict(self.counters)
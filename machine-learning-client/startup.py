@@ -0,0 +1,139 @@
+"""
+Cold-start timing, shared by the web-app and the ml client.
+
+install() times every module import from then on, like python -X importtime,
+and report() prints how long the process took to become ready and which
+top-level imports it spent that time on. The gunicorn configs install it
+before the app is imported and each worker reports when create_app()
+returns. A boot slower than STARTUP_BUDGET_SECONDS is flagged in the report.
+"""
+
+import os
+import sys
+import threading
+import time
+
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "2"))
+STARTUP_REPORT_TOP = int(os.getenv("STARTUP_REPORT_TOP", "8"))
+
+
+class _TimedLoader:
+    """Loader wrapper recording how long exec_module takes."""
+
+    def __init__(self, loader, timer):
+        self.loader = loader
+        self.timer = timer
+
+    def create_module(self, spec):
+        """Let the wrapped loader create the module."""
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        """Run the module, timing it and the imports nested in it."""
+        # the module only ever sees its real loader
+        module.__loader__ = self.loader
+        if getattr(module, "__spec__", None) is not None:
+            module.__spec__.loader = self.loader
+        self.timer.enter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.timer.leave(module.__name__)
+
+    def __getattr__(self, attribute):
+        return getattr(self.loader, attribute)
+
+
+class ImportTimer:
+    """
+    Meta path finder that times the imports found by the finders after it.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports = []  # (module name, nesting depth, cumulative, self)
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def find_spec(self, name, path=None, target=None):
+        """Find the module with the other finders and time its loader."""
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def enter(self):
+        """An import starts."""
+        self._stack().append([time.perf_counter(), 0.0])
+
+    def leave(self, name):
+        """The innermost import ends."""
+        stack = self._stack()
+        started, nested = stack.pop()
+        cumulative = time.perf_counter() - started
+        self.imports.append((name, len(stack), cumulative, cumulative - nested))
+        if stack:
+            stack[-1][1] += cumulative
+
+    def reset(self):
+        """Start timing afresh, e.g. in a newly forked worker."""
+        self.started = time.perf_counter()
+        self.imports = []
+
+
+_timer = ImportTimer()
+
+
+def install():
+    """
+    Time every import from now on.
+    """
+    if _timer not in sys.meta_path:
+        _timer.reset()
+        sys.meta_path.insert(0, _timer)
+
+
+def reset():
+    """
+    Restart the clock, e.g. in a gunicorn worker right after the fork.
+    """
+    _timer.reset()
+
+
+def report(service, top=STARTUP_REPORT_TOP, budget=STARTUP_BUDGET_SECONDS):
+    """
+    Print the time since install() or reset() and the slowest top-level imports.
+
+    Returns:
+        float: seconds since the clock started
+    """
+    elapsed = time.perf_counter() - _timer.started
+    imported = sum(entry[3] for entry in _timer.imports)
+    status = "over budget" if elapsed > budget else "within budget"
+    lines = [
+        f"{service} ready in {elapsed:.3f}s ({status} of {budget:.1f}s), "
+        f"{imported:.3f}s importing {len(_timer.imports)} modules"
+    ]
+    outermost = [entry for entry in _timer.imports if entry[1] <= 1]
+    outermost.sort(key=lambda entry: entry[2], reverse=True)
+    for name, depth, cumulative, own in outermost[:top]:
+        lines.append(f"  {cumulative:8.3f}s {own:8.3f}s  {'  ' * depth}{name}")
+    print("\n".join(lines))
+    return elapsed
@@ -0,0 +1,183 @@
+"""Test for the transcription backends"""
+
+# pylint: disable=no-member
+
+import os
+import subprocess
+import sys
+import wave
+from unittest.mock import MagicMock, patch
+import httpx
+import pytest
+from ratelimit import RateLimited
+from backends import (
+    DeepgramBackend,
+    LocalBackend,
+    TranscriptionBackend,
+    audio_duration,
+    get_backend,
+)
+
+
+def write_wav(path, seconds, tone=0):
+    """Write a mono 8kHz 16-bit WAV file"""
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(8000)
+        wav.writeframes(bytes([tone % 256, 0]) * 8000 * seconds)
+
+
+def test_get_backend():
+    """Backends are selected by name or TRANSCRIBE_BACKEND"""
+    assert isinstance(get_backend("local"), LocalBackend)
+    assert isinstance(get_backend("deepgram"), DeepgramBackend)
+    with patch.dict("os.environ", {"TRANSCRIBE_BACKEND": "local"}):
+        assert isinstance(get_backend(), LocalBackend)
+    with pytest.raises(ValueError):
+        get_backend("whisper-on-a-toaster")
+    with pytest.raises(TypeError):
+        TranscriptionBackend()  # pylint: disable=abstract-class-instantiated
+
+
+def test_local_backend_is_deterministic(tmp_path):
+    """The local backend returns the same transcript for the same WAV audio"""
+    first, other = tmp_path / "a.wav", tmp_path / "b.wav"
+    write_wav(first, 4)
+    write_wav(other, 4, tone=7)
+    assert audio_duration(str(first)) == 4
+
+    backend = LocalBackend(words_per_second=2.5)
+    transcript = backend.transcribe(str(first), {})
+    assert transcript == backend.transcribe(str(first), {})
+    assert len(transcript.split()) == 10
+    assert transcript != backend.transcribe(str(other), {})
+
+
+def test_local_backend_non_wav(fixture_mock_audio_file):
+    """Non-WAV audio still gets a transcript sized from the file"""
+    assert LocalBackend().transcribe(fixture_mock_audio_file, {})
+
+
+def test_deepgram_backend_reuses_client_and_transport(fixture_mock_audio_file):
+    """The Deepgram client is built once and every call shares the pooled transport"""
+    mock_deepgram = MagicMock()
+    transcribe_file = mock_deepgram.listen.rest.v.return_value.transcribe_file
+    transcribe_file.return_value.results.channels[0].alternatives[
+        0
+    ].transcript = "hello"
+
+    backend = DeepgramBackend(api_key="key")
+    with patch("backends.DeepgramClient", return_value=mock_deepgram) as mock_cls:
+        assert backend.transcribe(fixture_mock_audio_file, {"model": "nova-3"}) == (
+            "hello"
+        )
+        backend.transcribe(fixture_mock_audio_file, {"model": "nova-3"})
+
+    mock_cls.assert_called_once_with(api_key="key")
+    assert transcribe_file.call_count == 2
+    for call in transcribe_file.call_args_list:
+        assert call[1]["transport"] is backend.transport
+
+
+def test_deepgram_backend_streams_the_file(tmp_path):
+    """The audio is sent from the open file, whole and with its length"""
+    audio_file = tmp_path / "clip.mp3"
+    audio_file.write_bytes(os.urandom(300_000))
+    received = {}
+
+    class Recorder(httpx.BaseTransport):
+        """Collects the body chunk by chunk and answers like Deepgram."""
+
+        def handle_request(self, request):
+            received["length"] = request.headers["content-length"]
+            received["chunks"] = list(request.stream)
+            return httpx.Response(
+                200,
+                json={
+                    "metadata": {},
+                    "results": {"channels": [{"alternatives": [{"transcript": "hi"}]}]},
+                },
+            )
+
+    backend = DeepgramBackend(api_key="key")
+    backend._transport = Recorder()  # pylint: disable=protected-access
+    assert backend.transcribe(str(audio_file), {"model": "nova-3"}) == "hi"
+    assert received["length"] == "300000"
+    assert len(received["chunks"]) > 1
+    assert b"".join(received["chunks"]) == audio_file.read_bytes()
+
+
+@patch("resilience.RETRY_BACKOFF_SECONDS", 0)
+def test_deepgram_backend_retries_server_errors(fixture_mock_audio_file):
+    """Busy answers are retried with a timeout sized by the audio, bad requests not"""
+    statuses = [503, 200, 400]
+    timeouts = []
+
+    def answer(request):
+        timeouts.append(request.extensions["timeout"]["read"])
+        status = statuses.pop(0)
+        if status != 200:
+            return httpx.Response(status, json={"err_msg": "nope"})
+        return httpx.Response(
+            200,
+            json={
+                "metadata": {},
+                "results": {"channels": [{"alternatives": [{"transcript": "hi"}]}]},
+            },
+        )
+
+    backend = DeepgramBackend(api_key="key")
+    backend._transport = httpx.MockTransport(answer)  # pylint: disable=protected-access
+    assert backend.transcribe(fixture_mock_audio_file, {}) == "hi"
+    assert (
+        timeouts[0]
+        == timeouts[1]
+        == backend.endpoint.timeouts.timeout(audio_duration(fixture_mock_audio_file))
+    )
+    with pytest.raises(Exception) as rejected:
+        backend.transcribe(fixture_mock_audio_file, {})
+    assert "400" in str(rejected.value)
+    assert backend.endpoint.breaker.failed == 0
+
+
+def test_deepgram_backend_surfaces_rate_limits(fixture_mock_audio_file):
+    """A 429 is not retried past the token bucket but raised as RateLimited"""
+    calls = []
+
+    def answer(request):
+        calls.append(request)
+        return httpx.Response(429, json={"err_msg": "slow down"})
+
+    backend = DeepgramBackend(api_key="key")
+    backend._transport = httpx.MockTransport(answer)  # pylint: disable=protected-access
+    with pytest.raises(RateLimited) as limited:
+        backend.transcribe(fixture_mock_audio_file, {})
+    assert limited.value.retry_after > 0
+    assert len(calls) == 1
+    assert backend.endpoint.breaker.failed == 0
+
+
+def test_persistent_transport_outlives_client():
+    """Closing the per-request httpx client leaves the shared pool open"""
+    backend = DeepgramBackend()
+    with patch.object(httpx.HTTPTransport, "close") as mock_close:
+        with httpx.Client(transport=backend.transport):
+            pass
+        backend.transport.close()
+    mock_close.assert_not_called()
+
+
+def test_deepgram_sdk_is_imported_lazily():
+    """Importing the backends leaves the Deepgram SDK and httpx unloaded"""
+    code = (
+        "import sys, backends\n"
+        "backends.get_backend('deepgram')\n"
+        "assert 'deepgram' not in sys.modules and 'httpx' not in sys.modules\n"
+        "assert backends.DeepgramClient.__module__.startswith('deepgram')\n"
+    )
+    subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True,
+    )
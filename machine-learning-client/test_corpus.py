@@ -0,0 +1,86 @@
+# pylint: disable=protected-access
+"""Test the corpus-wide word counts"""
+
+from collections import Counter
+from unittest.mock import MagicMock
+from pymongo.errors import PyMongoError
+import corpus
+from corpus import corpus_top_words, rebuild, record_change, speaker_scope
+
+
+def incs(collection):
+    """Map each bulk-written doc id to its $inc"""
+    return {
+        op._filter["_id"]: op._doc["$inc"]["count"]
+        for op in collection.bulk_write.call_args[0][0]
+    }
+
+
+def test_record_change_increments_deltas():
+    """Only changed words are written, overall and for the speaker"""
+    collection = MagicMock()
+    old = Counter({"river": 2, "stone": 1, "the": 4})
+    new = Counter({"river": 3, "stone": 1, "tree": 1, "the": 5})
+    assert record_change(collection, old, new, "Ann", "ann ")
+    assert incs(collection) == {
+        "all|river": 1,
+        "all|tree": 1,
+        "speaker:ann|river": 1,
+        "speaker:ann|tree": 1,
+    }
+    collection.bulk_write.assert_called_once()
+
+
+def test_record_change_moves_words_between_speakers():
+    """A speaker change moves the entry's counts in the same bulk write"""
+    collection = MagicMock()
+    counts = Counter({"river": 2})
+    assert record_change(collection, counts, counts, "Ann", "Bob")
+    assert incs(collection) == {"speaker:ann|river": -2, "speaker:bob|river": 2}
+    assert collection.bulk_write.call_args[1] == {"ordered": False}
+    collection.delete_many.assert_not_called()
+
+    collection = MagicMock()
+    assert record_change(collection, counts, counts, "Ann", "Ann")
+    collection.bulk_write.assert_not_called()
+
+    collection.bulk_write.side_effect = PyMongoError()
+    assert not record_change(collection, {}, counts, "Ann", "Ann")
+
+
+def test_corpus_top_words_reads_one_scope():
+    """Top words come from the index, sorted and limited in the query"""
+    collection = MagicMock()
+    cursor = collection.find.return_value.sort.return_value.limit
+    cursor.return_value = [{"word": "river", "count": 5}]
+    assert corpus_top_words(collection, "Ann", 3) == [["river", 5]]
+    assert collection.find.call_args[0][0] == {
+        "scope": speaker_scope("Ann"),
+        "count": {"$gt": 0},
+    }
+    cursor.assert_called_once_with(3)
+    corpus_top_words(collection)
+    assert collection.find.call_args[0][0]["scope"] == corpus.ALL_SCOPE
+
+
+def test_rebuild_swaps_in_new_counts():
+    """Rebuild counts every entry into a scratch collection, then renames it"""
+    db = MagicMock()
+    entries = MagicMock()
+    entries.find.return_value = [
+        {"transcript": "river the river", "speaker": "Ann"},
+        {"transcript": "river stone", "speaker": "Bob"},
+        {"speaker": "Bob"},
+    ]
+    assert rebuild(db, entries, batch_size=2) == 3
+    scratch = db["corpus_word_counts_rebuild"]
+    scratch.drop.assert_called_once()
+    docs = [op._doc for call in scratch.bulk_write.call_args_list for op in call[0][0]]
+    assert {doc["_id"]: doc["count"] for doc in docs} == {
+        "all|river": 3,
+        "all|stone": 1,
+        "speaker:ann|river": 2,
+        "speaker:bob|river": 1,
+        "speaker:bob|stone": 1,
+    }
+    scratch.rename.assert_called_once_with("corpus_word_counts", dropTarget=True)
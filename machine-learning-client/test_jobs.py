@@ -0,0 +1,158 @@
+"""Test for the transcription job queue"""
+
+import threading
+from unittest.mock import MagicMock, patch
+import pytest
+from pymongo.errors import PyMongoError
+from jobs import (
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    PermanentJobError,
+    RetryLaterError,
+    claim_job,
+    fail_job,
+    run_job,
+    run_worker,
+)
+from resilience import CircuitOpenError
+from app import handle_transcription_job
+
+
+def make_job(attempts=1, max_attempts=3):
+    """Build a claimed job document"""
+    return {
+        "_id": "job1",
+        "audio_file": "static/uploaded_audio/test.mp3",
+        "status": JOB_RUNNING,
+        "attempts": attempts,
+        "max_attempts": max_attempts,
+    }
+
+
+def test_claim_job_takes_queued_or_expired():
+    """Claiming filters on queued jobs and expired leases and bumps attempts"""
+    jobs = MagicMock()
+    jobs.find_one_and_update.return_value = make_job()
+    assert claim_job(jobs, "worker-1")["_id"] == "job1"
+
+    query, update = jobs.find_one_and_update.call_args[0]
+    statuses = [clause["status"] for clause in query["$or"]]
+    assert statuses == [JOB_QUEUED, JOB_RUNNING]
+    assert "$lt" in query["$or"][1]["lease_expires_at"]
+    assert update["$set"]["lease_owner"] == "worker-1"
+    assert update["$inc"] == {"attempts": 1}
+
+
+def test_run_job_success():
+    """A successful handler completes the job with its result"""
+    jobs = MagicMock()
+    jobs.update_one.return_value = MagicMock(matched_count=1)
+    handler = MagicMock(return_value={"word_count": 3})
+
+    assert run_job(jobs, make_job(), handler, "worker-1") == JOB_DONE
+    handler.assert_called_once()
+    query, update = jobs.update_one.call_args[0]
+    assert query["lease_owner"] == "worker-1"
+    assert update["$set"]["status"] == JOB_DONE
+    assert update["$set"]["result"] == {"word_count": 3}
+
+
+def test_run_job_retries_then_fails():
+    """Transient failures requeue the job until attempts run out"""
+    jobs = MagicMock()
+    jobs.update_one.return_value = MagicMock(matched_count=1)
+    handler = MagicMock(side_effect=PyMongoError("down"))
+
+    assert run_job(jobs, make_job(attempts=1), handler, "worker-1") == JOB_QUEUED
+    assert jobs.update_one.call_args[0][1]["$set"]["status"] == JOB_QUEUED
+
+    run_job(jobs, make_job(attempts=3), handler, "worker-1")
+    assert jobs.update_one.call_args[0][1]["$set"]["status"] == JOB_FAILED
+
+
+def test_run_job_permanent_failure():
+    """Permanent failures are not retried"""
+    jobs = MagicMock()
+    jobs.update_one.return_value = MagicMock(matched_count=1)
+    handler = MagicMock(side_effect=PermanentJobError("missing"))
+
+    assert run_job(jobs, make_job(), handler, "worker-1") == JOB_FAILED
+    assert jobs.update_one.call_args[0][1]["$set"]["status"] == JOB_FAILED
+
+
+def test_run_job_expired_too_often():
+    """A job reclaimed past max_attempts is failed without running it"""
+    jobs = MagicMock()
+    jobs.update_one.return_value = MagicMock(matched_count=1)
+    handler = MagicMock()
+    assert run_job(jobs, make_job(attempts=4), handler, "worker-1") == JOB_FAILED
+    handler.assert_not_called()
+
+
+def test_run_job_lost_lease():
+    """A result is discarded if another worker took over the lease"""
+    jobs = MagicMock()
+    jobs.update_one.return_value = MagicMock(matched_count=0)
+    handler = MagicMock(return_value={})
+    assert run_job(jobs, make_job(), handler, "worker-1") == JOB_QUEUED
+
+
+def test_fail_job_ignores_foreign_lease():
+    """Only the lease owner can record a failure"""
+    jobs = MagicMock()
+    jobs.update_one.return_value = MagicMock(matched_count=0)
+    assert not fail_job(jobs, make_job(), "worker-2", "boom")
+
+
+def test_run_worker_processes_until_stopped():
+    """The worker loop claims jobs and stops when the event is set"""
+    stop_event = threading.Event()
+    jobs = MagicMock()
+    jobs.update_one.return_value = MagicMock(matched_count=1)
+
+    def claim(*_args, **_kwargs):
+        if jobs.find_one_and_update.call_count > 1:
+            stop_event.set()
+            return None
+        return make_job()
+
+    jobs.find_one_and_update.side_effect = claim
+    handler = MagicMock(return_value={})
+    run_worker(jobs, handler, stop_event, "worker-1", poll_interval=0)
+    handler.assert_called_once()
+
+
+def test_retry_later_puts_job_back_and_pauses_worker():
+    """A job deferred by its handler keeps its attempt and the worker waits"""
+    stop_event = MagicMock()
+    stop_event.is_set.side_effect = [False, True]
+    jobs = MagicMock()
+    jobs.find_one_and_update.return_value = make_job(attempts=2)
+    jobs.update_one.return_value = MagicMock(matched_count=1)
+    handler = MagicMock(side_effect=RetryLaterError("circuit open", 7))
+
+    run_worker(jobs, handler, stop_event, "worker-1", poll_interval=0)
+    update = jobs.update_one.call_args[0][1]
+    assert update["$set"]["status"] == JOB_QUEUED
+    assert update["$inc"] == {"attempts": -1}
+    stop_event.wait.assert_called_once_with(7)
+
+
+def test_handle_transcription_job():
+    """The job handler stores the transcript and flags missing files as permanent"""
+    with patch(
+        "app.transcribe_and_store",
+        return_value={"transcript": "a b", "word_count": 2, "top_words": []},
+    ):
+        assert handle_transcription_job(make_job()) == {"word_count": 2}
+
+    with patch("app.transcribe_and_store", side_effect=FileNotFoundError("x.mp3")):
+        with pytest.raises(PermanentJobError):
+            handle_transcription_job(make_job())
+
+    with patch("app.transcribe_and_store", side_effect=CircuitOpenError("deepgram", 5)):
+        with pytest.raises(RetryLaterError) as deferred:
+            handle_transcription_job(make_job())
+    assert deferred.value.delay == 5
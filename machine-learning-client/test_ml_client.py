@@ -1,8 +1,14 @@
 """Test for machine-learning-client"""
 
 import os
+import subprocess
+import sys
+import threading
 from unittest.mock import patch, MagicMock, mock_open
 from pymongo.errors import PyMongoError
+from resilience import CircuitOpenError
+from ratelimit import RateLimited
+from singleflight import SingleFlightTimeout
 from app import (
     get_word_count,
     rank_by_freq_desc,
@@ -48,6 +54,16 @@ def test_get_word_count():
     assert get_word_count(None) == 0
 
 
+def test_word_stats_keep_contractions_and_decimals():
+    """Contractions and decimals count as one word, as in the baseline"""
+    text = "I don't think it's 3.5 percent, U.S. e-mail rock'n'roll"
+    assert get_word_count(text) == 9
+    assert ["3.5", 1] in count_word_frequency(text)
+    assert trans_to_top_word("It's fine, it's late, it's 3.5 now. Don't.") == [
+        ["it's", 3]
+    ]
+
+
 def test_count_word_frequency():
     """Test count_word_frequency function."""
     assert count_word_frequency(SAMPLE_TRANSCRIPT) == [
@@ -159,8 +175,10 @@ def test_processs_transcript_api(test_client):
         mock_exists.return_value = True
         with patch("app.get_transcript") as mock_get_transcript:
             mock_get_transcript.return_value = "This is a sample transcript."
-            with patch("app.collection.find_one") as mock_find:
-                mock_find.return_value.sort.return_value = [
+            with patch("app.collection.find") as mock_find, patch(
+                "app.corpus_collection"
+            ) as mock_corpus:
+                mock_find.return_value = [
                     {
                         "_id": "test/audio.mp3",
                         "title": "Test Entry",
@@ -174,7 +192,7 @@ def test_processs_transcript_api(test_client):
                         "created_at": "2025-04-01T12:00:00Z",
                     }
                 ]
-                with patch("app.collection.update_one") as mock_update:
+                with patch("app.collection.update_many") as mock_update:
                     mock_update.return_value = 1
                     response = test_client.post(
                         "/get-transcripts", json={"audio_file_path": "test.mp3"}
@@ -184,6 +202,8 @@ def test_processs_transcript_api(test_client):
                     mock_update.assert_called_once()
                     mock_get_transcript.assert_called_once()
                     mock_find.assert_called_once()
+                    # corpus counts move from the old transcript to the new one
+                    mock_corpus.bulk_write.assert_called_once()
                     # Check the status code from the response object
                     assert response.status_code == 200
 
@@ -194,6 +214,151 @@ def test_processs_transcript_api(test_client):
                     assert response.status_code == 500
 
 
+def test_transcript_api_when_circuit_open(test_client):
+    """Test /get-transcripts answers 503 with Retry-After while Deepgram's circuit is open"""
+    with patch("os.path.exists", return_value=True), patch(
+        "app.get_transcript", side_effect=CircuitOpenError("deepgram", 12.3)
+    ):
+        response = test_client.post(
+            "/get-transcripts", json={"audio_file_path": "test.mp3"}
+        )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "12"
+
+
+def test_transcript_api_when_rate_limited(test_client):
+    """Test /get-transcripts answers 503 with Retry-After when held back by the
+    rate limit or by a transcription of the same audio that runs too long"""
+    with patch("os.path.exists", return_value=True), patch(
+        "app.get_transcript", side_effect=RateLimited("nova-3", 2.6)
+    ):
+        response = test_client.post(
+            "/get-transcripts", json={"audio_file_path": "test.mp3"}
+        )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+    with patch("os.path.exists", return_value=True), patch(
+        "app.get_transcript", side_effect=SingleFlightTimeout("path:test.mp3")
+    ):
+        response = test_client.post(
+            "/get-transcripts", json={"audio_file_path": "test.mp3"}
+        )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+
+def test_concurrent_requests_share_one_transcription(
+    test_client, fresh_deepgram_backend
+):
+    """Two requests for the same audio call Deepgram and update MongoDB once"""
+    release = threading.Event()
+
+    def slow_transcribe(*_args):
+        release.wait(5)
+        return "shared words"
+
+    with patch("os.path.exists", return_value=True), patch(
+        "app.TranscriptCache.file_digest", return_value="abc"
+    ), patch.object(
+        fresh_deepgram_backend, "transcribe", side_effect=slow_transcribe
+    ) as transcribe, patch(
+        "app.collection.find", return_value=[]
+    ), patch(
+        "app.collection.update_many"
+    ):
+        responses = []
+        threads = [
+            threading.Thread(
+                # one client per thread, like separate browser requests
+                target=lambda: responses.append(
+                    test_client.application.test_client().post(
+                        "/get-transcripts", json={"audio_file_path": "test.mp3"}
+                    )
+                )
+            )
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        while test_client.get("/single-flight-stats").get_json()["shared"] < 1:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+    assert [response.get_json()["transcript"] for response in responses] == [
+        "shared words"
+    ] * 2
+    transcribe.assert_called_once()
+
+
+def test_transcript_batch_api(test_client):
+    """Test /get-transcripts/batch stores every result with one bulk write"""
+
+    def transcribe(path):
+        if path.endswith("broken.mp3"):
+            raise RuntimeError("provider error")
+        return f"hello world from {os.path.basename(path)}"
+
+    entries = [
+        {"audio_file": "a.mp3", "speaker": "Ann", "transcript": ""},
+        {"audio_file": "a.mp3", "speaker": "Bob", "transcript": "old words"},
+        {"audio_file": "b.mp3", "speaker": "Ann", "transcript": ""},
+    ]
+    with patch("os.path.exists", side_effect=lambda path: "missing" not in path), patch(
+        "app.get_transcript", side_effect=transcribe
+    ), patch("app.collection.find", return_value=entries) as mock_find, patch(
+        "app.collection.bulk_write"
+    ) as mock_bulk, patch(
+        "app.record_change"
+    ) as mock_record:
+        response = test_client.post(
+            "/get-transcripts/batch",
+            json={
+                "audio_file_paths": [
+                    "a.mp3",
+                    "missing.mp3",
+                    "b.mp3",
+                    "broken.mp3",
+                    "a.mp3",
+                ]
+            },
+        )
+
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [item["status"] for item in results] == [
+        "done",
+        "not_found",
+        "done",
+        "error",
+        "done",
+    ]
+    assert results[0]["entries"] == 2
+    assert results[0]["word_count"] == 4
+    assert mock_find.call_args[0][0] == {"audio_file": {"$in": ["a.mp3", "b.mp3"]}}
+    operations = mock_bulk.call_args[0][0]
+    assert [op._filter for op in operations] == [  # pylint: disable=protected-access
+        {"audio_file": "a.mp3"},
+        {"audio_file": "b.mp3"},
+    ]
+    assert mock_bulk.call_args[1] == {"ordered": False}
+    # one corpus change per speaker
+    assert sorted(call[0][3] for call in mock_record.call_args_list) == ["Ann", "Bob"]
+
+
+def test_transcript_batch_api_rejects_bad_input(test_client):
+    """Test /get-transcripts/batch wants a bounded list of paths"""
+    response = test_client.post("/get-transcripts/batch", json={"audio_file_path": "a"})
+    assert response.status_code == 400
+    with patch("app.BATCH_MAX_FILES", 1):
+        response = test_client.post(
+            "/get-transcripts/batch", json={"audio_file_paths": ["a", "b"]}
+        )
+    assert response.status_code == 413
+
+
 def test_get_transcript_success():
     """Test successful transcription of an audio file."""
     # Mock audio file content
@@ -211,7 +376,7 @@ def test_get_transcript_success():
     )
 
     # Mock the DeepgramClient constructor
-    with patch("app.DeepgramClient", return_value=mock_deepgram):
+    with patch("backends.DeepgramClient", return_value=mock_deepgram):
         # Mock the file open operation
         with patch("builtins.open", mock_open(read_data=mock_audio_content)):
             # Call the function
@@ -225,10 +390,29 @@ def test_get_transcript_success():
             mock_deepgram.listen.rest.v.return_value.transcribe_file.assert_called_once()
 
 
+def test_get_transcript_is_cached(test_client, fixture_mock_audio_file):
+    """Transcribing the same audio twice calls Deepgram once."""
+    mock_response = MagicMock()
+    mock_response.results.channels[0].alternatives[0].transcript = "cached words"
+    mock_deepgram = MagicMock()
+    mock_deepgram.listen.rest.v.return_value.transcribe_file.return_value = (
+        mock_response
+    )
+
+    with patch("backends.DeepgramClient", return_value=mock_deepgram):
+        assert get_transcript(fixture_mock_audio_file) == "cached words"
+        assert get_transcript(fixture_mock_audio_file) == "cached words"
+
+    mock_deepgram.listen.rest.v.return_value.transcribe_file.assert_called_once()
+    stats = test_client.get("/cache-stats").get_json()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+
+
 def test_get_transcript_file_error():
     """Test handling of file operation errors."""
     # Mock the DeepgramClient constructor
-    with patch("app.DeepgramClient"):
+    with patch("backends.DeepgramClient"):
         # Mock the file open operation to raise an error
         with patch("builtins.open", side_effect=OSError("File not found")):
             # Call the function
@@ -250,7 +434,7 @@ def test_get_transcript_api_error():
     )
 
     # Mock the DeepgramClient constructor
-    with patch("app.DeepgramClient", return_value=mock_deepgram):
+    with patch("backends.DeepgramClient", return_value=mock_deepgram):
         # Mock the file open operation
         with patch("builtins.open", mock_open(read_data=mock_audio_content)):
             # Call the function
@@ -272,7 +456,7 @@ def test_get_transcript_runtime_error():
     )
 
     # Mock the DeepgramClient constructor
-    with patch("app.DeepgramClient", return_value=mock_deepgram):
+    with patch("backends.DeepgramClient", return_value=mock_deepgram):
         # Mock the file open operation
         with patch("builtins.open", mock_open(read_data=mock_audio_content)):
             # Call the function
@@ -294,7 +478,7 @@ def test_get_transcript_index_error():
     )
 
     # Mock the DeepgramClient constructor
-    with patch("app.DeepgramClient", return_value=mock_deepgram):
+    with patch("backends.DeepgramClient", return_value=mock_deepgram):
         # Mock the file open operation
         with patch("builtins.open", mock_open(read_data=mock_audio_content)):
             # Call the function
@@ -302,3 +486,19 @@ def test_get_transcript_index_error():
 
             # Verify the result contains the error message
             assert "index error" in result
+
+
+def test_import_builds_no_backend():
+    """Importing the app prints nothing and leaves the backend unbuilt"""
+    code = (
+        "import app\n"
+        "assert app.get_transcription_backend.cache_info().currsize == 0\n"
+    )
+    done = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert done.stdout == ""
@@ -0,0 +1,101 @@
+"""Test the token buckets and concurrency governors"""
+
+import threading
+from unittest.mock import MagicMock, patch
+import pytest
+from pymongo.errors import DuplicateKeyError, ServerSelectionTimeoutError
+import ratelimit
+from ratelimit import Governor, RateLimited, SharedTokenBucket, TokenBucket
+
+
+def test_bucket_allows_burst_then_refills():
+    """A full bucket grants burst calls, then one per 1/rate seconds"""
+    with patch("time.monotonic", return_value=100.0):
+        bucket = TokenBucket(rate=2, burst=3)
+        assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+        assert bucket.take() == 0.5
+    with patch("time.monotonic", return_value=100.25):
+        assert bucket.take() == 0.25
+    with patch("time.monotonic", return_value=100.5):
+        assert bucket.take() == 0
+    with patch("time.monotonic", return_value=1000.0):
+        assert [bucket.take() for _ in range(4)] == [0, 0, 0, 0.5]
+
+
+def test_governor_gives_up_after_queue_seconds():
+    """A call whose token is due after the queue time raises RateLimited"""
+    bucket = MagicMock()
+    bucket.take.side_effect = [0.01, 0.0]
+    func = MagicMock(return_value="words")
+    assert Governor("test", bucket, 1, queue_seconds=1).call(func, "a.mp3") == "words"
+    func.assert_called_once_with("a.mp3")
+
+    bucket.take.side_effect = [5.0]
+    with pytest.raises(RateLimited) as limited:
+        Governor("test", bucket, 1, queue_seconds=1).call(func, "a.mp3")
+    assert limited.value.retry_after == 5.0
+    assert func.call_count == 1
+
+
+def test_governor_caps_concurrency():
+    """Calls beyond the concurrency limit wait for a slot, then give up"""
+    governor = Governor("test", TokenBucket(100, 100), 1, queue_seconds=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(_audio_file):
+        started.set()
+        release.wait(5)
+
+    first = threading.Thread(target=governor.call, args=(slow, "a.mp3"))
+    first.start()
+    assert started.wait(5)
+    with pytest.raises(RateLimited):
+        governor.call(slow, "b.mp3")
+    release.set()
+    first.join()
+    assert governor.call(len, "b.mp3") == 5
+
+
+def test_shared_bucket_reads_the_atomic_update():
+    """The shared bucket's document says whether a token was granted"""
+    collection = MagicMock()
+    bucket = SharedTokenBucket(collection, "nova-3", rate=4, burst=8)
+    collection.find_one_and_update.return_value = {"granted": True, "tokens": 6.5}
+    assert bucket.take() == 0
+    collection.find_one_and_update.return_value = {"granted": False, "tokens": 0.5}
+    assert bucket.take() == 0.125
+    query, pipeline = collection.find_one_and_update.call_args[0]
+    assert query == {"_id": "nova-3"}
+    assert isinstance(pipeline, list)
+    assert collection.find_one_and_update.call_args[1]["upsert"] is True
+
+
+def test_shared_bucket_retries_racing_upsert_and_falls_back():
+    """A racing upsert is retried, an unreachable MongoDB limits locally"""
+    collection = MagicMock()
+    bucket = SharedTokenBucket(collection, "nova-3", rate=1, burst=1)
+    collection.find_one_and_update.side_effect = [
+        DuplicateKeyError("dup"),
+        {"granted": True, "tokens": 0},
+    ]
+    assert bucket.take() == 0
+    assert collection.find_one_and_update.call_count == 2
+
+    collection.find_one_and_update.side_effect = ServerSelectionTimeoutError("down")
+    assert bucket.take() == 0
+    assert bucket.take() > 0
+
+
+def test_governor_per_model():
+    """Each model gets its own limits, shared buckets only when configured"""
+    # pylint: disable=protected-access
+    limits = {"nova-3": {"rate": 1, "burst": 2, "concurrency": 3}}
+    with patch.dict(ratelimit._governors, clear=True), patch(
+        "ratelimit.TRANSCRIBE_LIMITS", limits
+    ), patch("ratelimit.TRANSCRIBE_RATE_SHARED", True):
+        nova = ratelimit.governor("nova-3", MagicMock())
+        assert nova is ratelimit.governor("nova-3")
+        assert isinstance(nova.bucket, SharedTokenBucket)
+        assert nova.bucket.rate == 1
+        assert nova.bucket.burst == 2
+        assert isinstance(ratelimit.governor("local").bucket, TokenBucket)
@@ -0,0 +1,38 @@
+"""Test that both services ship the same shared modules and their tests"""
+
+import os
+import pytest
+
+# Modules both Docker images need, kept identical in web-app and
+# machine-learning-client, with the tests that run in both services
+SHARED_MODULES = [
+    "corpus.py",
+    "mongo.py",
+    "resilience.py",
+    "schema.py",
+    "startup.py",
+    "text_analytics.py",
+    "test_corpus.py",
+    "test_mongo.py",
+    "test_resilience.py",
+    "test_schema.py",
+    "test_shared_modules.py",
+    "test_startup.py",
+    "test_text_analytics.py",
+]
+SERVICES = ("web-app", "machine-learning-client")
+
+
+@pytest.mark.parametrize("filename", SHARED_MODULES)
+def test_shared_copies_match(filename):
+    """This service's copy of a shared file is the other service's copy"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    other = [name for name in SERVICES if name != os.path.basename(here)][0]
+    other_path = os.path.join(here, "..", other, filename)
+    if not os.path.exists(other_path):
+        pytest.skip(f"../{other} is not checked out next to this service")
+    with open(os.path.join(here, filename), encoding="utf-8") as f:
+        this_copy = f.read()
+    with open(other_path, encoding="utf-8") as f:
+        other_copy = f.read()
+    assert this_copy == other_copy, f"{filename} differs from ../{other}/{filename}"
@@ -0,0 +1,161 @@
+"""Test single-flight transcription calls"""
+
+import threading
+from unittest.mock import MagicMock, patch
+import pytest
+from pymongo.errors import DuplicateKeyError, ServerSelectionTimeoutError
+from singleflight import DONE, SingleFlight, SingleFlightTimeout
+
+
+def run_together(flight, key, func, count):
+    """Start count calls of func for key and return their outcomes"""
+    outcomes = [None] * count
+
+    def call(index):
+        try:
+            outcomes[index] = flight.do(key, func)
+        except ValueError as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_concurrent_calls_share_one_run():
+    """Calls for a key that is running wait for it and share its result"""
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    func = MagicMock(side_effect=lambda: started.set() or release.wait(5) and "words")
+
+    threads, outcomes = run_together(flight, "path:a.mp3", func, 4)
+    assert started.wait(5)
+    while flight.stats()["shared"] < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert outcomes == ["words"] * 4
+    assert func.call_count == 1
+    assert flight.stats() == {"calls": 1, "shared": 3, "shared_remote": 0}
+
+    # once finished, the next call runs again
+    assert flight.do("path:a.mp3", lambda: "new words") == "new words"
+
+
+def test_failure_is_shared_then_forgotten():
+    """Waiting calls get the running call's exception, later calls run again"""
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("no audio")
+
+    threads, outcomes = run_together(flight, "path:a.mp3", fail, 2)
+    while flight.stats()["shared"] < 1:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert flight.do("path:a.mp3", lambda: "words") == "words"
+
+
+def test_lock_holder_stores_its_result():
+    """The process holding the lock stores the result for other replicas"""
+    collection = MagicMock()
+    flight = SingleFlight(collection)
+    assert flight.do("path:a.mp3", lambda: {"transcript": "words"}) == {
+        "transcript": "words"
+    }
+    inserted = collection.insert_one.call_args[0][0]
+    assert inserted["_id"] == "path:a.mp3"
+    assert inserted["owner"] == flight.owner
+    query, update = collection.update_one.call_args[0]
+    assert query == {"_id": "path:a.mp3", "owner": flight.owner}
+    assert update["$set"]["state"] == DONE
+    assert update["$set"]["result"] == {"transcript": "words"}
+
+    with pytest.raises(ValueError):
+        flight.do("path:b.mp3", MagicMock(side_effect=ValueError("no audio")))
+    collection.delete_one.assert_called_once_with(
+        {"_id": "path:b.mp3", "owner": flight.owner}
+    )
+
+
+@patch("singleflight.POLL_INTERVAL", 0)
+def test_waits_for_result_of_other_replica():
+    """While another replica holds the lock, its stored result is returned"""
+    collection = MagicMock()
+    collection.insert_one.side_effect = DuplicateKeyError("held")
+    collection.update_one.return_value = MagicMock(matched_count=0)
+    collection.find_one.side_effect = [
+        {"_id": "path:a.mp3", "state": "running", "run": "r1"},
+        {"_id": "path:a.mp3", "state": DONE, "run": "r1", "result": "words"},
+    ]
+    func = MagicMock()
+    flight = SingleFlight(collection)
+    assert flight.do("path:a.mp3", func) == "words"
+    func.assert_not_called()
+    assert flight.stats()["shared_remote"] == 1
+
+
+@patch("singleflight.POLL_INTERVAL", 0)
+def test_finished_result_is_not_reused():
+    """A result stored before this caller arrived is not returned, it runs again"""
+    collection = MagicMock()
+    collection.insert_one.side_effect = DuplicateKeyError("held")
+    collection.update_one.side_effect = [MagicMock(matched_count=0)] + [
+        MagicMock(matched_count=1)
+    ] * 2
+    collection.find_one.return_value = {
+        "_id": "path:a.mp3",
+        "state": DONE,
+        "run": "r0",
+        "result": "old words",
+    }
+    flight = SingleFlight(collection)
+    assert flight.do("path:a.mp3", lambda: "new words") == "new words"
+    query = collection.update_one.call_args_list[1][0][0]
+    assert {"state": DONE, "run": {"$ne": None}} in query["$or"]
+
+
+@patch("singleflight.POLL_INTERVAL", 0)
+@patch("singleflight.WAIT_SECONDS", 0)
+def test_waiting_is_bounded():
+    """A lock held by another replica for WAIT_SECONDS raises SingleFlightTimeout"""
+    collection = MagicMock()
+    collection.insert_one.side_effect = DuplicateKeyError("held")
+    collection.update_one.return_value = MagicMock(matched_count=0)
+    collection.find_one.return_value = {"state": "running", "run": "r1"}
+    func = MagicMock()
+    with pytest.raises(SingleFlightTimeout) as waited:
+        SingleFlight(collection).do("path:a.mp3", func)
+    assert waited.value.retry_after > 0
+    func.assert_not_called()
+
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=("k", release.wait, 5))
+    leader.start()
+    while "k" not in flight._calls:  # pylint: disable=protected-access
+        release.wait(0.01)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do("k", func)
+    release.set()
+    leader.join()
+
+
+def test_takes_over_expired_lock_and_survives_mongo_outage():
+    """An expired lock is taken over, an unreachable MongoDB is ignored"""
+    collection = MagicMock()
+    collection.insert_one.side_effect = DuplicateKeyError("held")
+    collection.update_one.return_value = MagicMock(matched_count=1)
+    flight = SingleFlight(collection)
+    assert flight.do("path:a.mp3", lambda: "words") == "words"
+    collection.find_one.assert_not_called()
+
+    collection.insert_one.side_effect = ServerSelectionTimeoutError("down")
+    assert flight.do("path:a.mp3", lambda: "again") == "again"
@@ -0,0 +1,41 @@
+"""Test the cold-start timing report"""
+
+import importlib
+import sys
+import startup
+from startup import ImportTimer
+
+
+def test_import_timer_records_nested_imports(tmp_path, monkeypatch):
+    """Imports are timed with their nesting, modules keep their real loader"""
+    (tmp_path / "boot_outer.py").write_text("import boot_inner\n")
+    (tmp_path / "boot_inner.py").write_text("VALUE = 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    timer = ImportTimer()
+    monkeypatch.setattr(sys, "meta_path", [timer] + sys.meta_path)
+    try:
+        boot_outer = importlib.import_module("boot_outer")
+    finally:
+        sys.modules.pop("boot_outer", None)
+        sys.modules.pop("boot_inner", None)
+
+    names = {
+        name: (depth, cumulative, own) for name, depth, cumulative, own in timer.imports
+    }
+    assert names["boot_outer"][0] == 0 and names["boot_inner"][0] == 1
+    assert names["boot_outer"][1] >= names["boot_inner"][1]
+    assert names["boot_outer"][2] <= names["boot_outer"][1]
+    assert type(boot_outer.__loader__).__name__ == "SourceFileLoader"
+
+
+def test_report_flags_slow_boots(capsys, monkeypatch):
+    """The report lists the slowest imports and compares to the budget"""
+    timer = ImportTimer()
+    timer.imports = [("app", 0, 0.5, 0.1), ("flask", 1, 0.3, 0.01)]
+    monkeypatch.setattr(startup, "_timer", timer)
+    startup.report("web-app", budget=100)
+    output = capsys.readouterr().out
+    assert "within budget" in output and "2 modules" in output
+    assert output.index("app") < output.index("flask")
+    startup.report("web-app", budget=0)
+    assert "over budget" in capsys.readouterr().out
@@ -0,0 +1,72 @@
+"""Test for the two-tier transcript cache"""
+
+from unittest.mock import MagicMock
+from pymongo.errors import PyMongoError
+from transcript_cache import TranscriptCache, cache_key
+
+
+def test_cache_key_includes_options():
+    """Different options never share a cache entry"""
+    assert cache_key("abc", {"smart_format": True, "model": "nova-3"}) == (
+        "abc:model=nova-3,smart_format=True"
+    )
+    assert cache_key("abc", {"model": "nova-3"}) != cache_key("abc", {"model": "x"})
+
+
+def test_file_digest_is_memoized(fixture_mock_audio_file):
+    """Unchanged files are only hashed once"""
+    cache = TranscriptCache()
+    first = cache.file_digest(fixture_mock_audio_file)
+    assert len(first) == 64
+    assert cache.file_digest(fixture_mock_audio_file) == first
+    assert len(cache._digests) == 1  # pylint: disable=protected-access
+
+
+def test_memory_tier_lru_eviction_by_size():
+    """The memory tier evicts least recently used transcripts past max_bytes"""
+    cache = TranscriptCache(max_bytes=10)
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a") == "aaaa"  # a becomes most recently used
+    cache.put("c", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 8
+
+    # transcripts larger than the whole tier are not kept in memory
+    cache.put("big", "x" * 11)
+    assert cache.get("big") is None
+
+
+def test_mongo_tier():
+    """Misses fall through to MongoDB and hits are promoted to memory"""
+    cache_collection = MagicMock()
+    cache_collection.find_one.return_value = {"_id": "k", "transcript": "hello"}
+    cache = TranscriptCache(cache_collection)
+
+    assert cache.get("k") == "hello"
+    assert cache.get("k") == "hello"
+    cache_collection.find_one.assert_called_once()
+    assert cache.stats()["mongo_hits"] == 1
+    assert cache.stats()["memory_hits"] == 1
+
+    cache.put("k2", "world")
+    assert cache_collection.replace_one.call_args[0][1]["transcript"] == "world"
+    assert cache_collection.replace_one.call_args[1]["upsert"]
+
+
+def test_mongo_tier_errors_are_misses():
+    """A failing MongoDB tier degrades to a miss instead of an error"""
+    cache_collection = MagicMock()
+    cache_collection.find_one.side_effect = PyMongoError()
+    cache_collection.replace_one.side_effect = PyMongoError()
+    cache = TranscriptCache(cache_collection)
+    assert cache.get("k") is None
+    cache.put("k", "hello")
+    assert cache.get("k") == "hello"
@@ -0,0 +1,162 @@
+"""
+Two-tier cache for transcripts.
+
+Transcripts are keyed by the SHA-256 of the audio content plus the
+transcription options. The first tier is an in-process LRU bounded by the
+total size of the cached transcripts, the second is a MongoDB collection
+whose documents expire through the TTL index declared in schema.py.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pymongo.errors import PyMongoError
+
+CHUNK_SIZE = 1024 * 1024
+MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def cache_key(digest, options):
+    """
+    Build the cache key for audio content and transcription options.
+
+    Args:
+        digest (str): hex SHA-256 of the audio content
+        options (dict): transcription options, e.g. model and smart_format
+
+    Returns:
+        str: the cache key
+    """
+    opts = ",".join(f"{name}={options[name]}" for name in sorted(options))
+    return f"{digest}:{opts}"
+
+
+class TranscriptCache:
+    """
+    In-process LRU of transcripts in front of an optional MongoDB collection.
+    """
+
+    def __init__(self, cache_collection=None, max_bytes=MAX_BYTES):
+        self.cache_collection = cache_collection
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # (path, size, mtime) -> digest, so unchanged files are not re-hashed
+        self._digests = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "mongo_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+
+    def file_digest(self, path):
+        """
+        Hash a file's content, reusing the digest while the file is unchanged.
+
+        Raises:
+            OSError: if the file cannot be read
+        """
+        try:
+            stat = os.stat(path)
+            stamp = (path, stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            stamp = None
+        if stamp is not None and stamp in self._digests:
+            return self._digests[stamp]
+
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as file:
+            while True:
+                chunk = file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        if stamp is not None:
+            with self._lock:
+                if len(self._digests) > 10000:
+                    self._digests.clear()
+                self._digests[stamp] = digest
+        return digest
+
+    def get(self, key):
+        """
+        Look a transcript up in memory, then in MongoDB.
+
+        Returns:
+            str: the cached transcript, or None on a miss
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return self._entries[key]
+
+        if self.cache_collection is not None:
+            try:
+                doc = self.cache_collection.find_one({"_id": key})
+            except PyMongoError as e:
+                print(f"Transcript cache lookup failed: {e}")
+                doc = None
+            if doc is not None:
+                self._remember(key, doc["transcript"])
+                with self._lock:
+                    self.counters["mongo_hits"] += 1
+                return doc["transcript"]
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, key, transcript):
+        """
+        Store a transcript in both tiers.
+        """
+        self._remember(key, transcript)
+        if self.cache_collection is None:
+            return
+        try:
+            self.cache_collection.replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "transcript": transcript,
+                    "created_at": datetime.now(timezone.utc),
+                },
+                upsert=True,
+            )
+        except PyMongoError as e:
+            print(f"Transcript cache store failed: {e}")
+
+    def _remember(self, key, transcript):
+        size = len(transcript.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key).encode("utf-8"))
+            self._entries[key] = transcript
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.encode("utf-8"))
+                self.counters["evictions"] += 1
+
+    def stats(self):
+        """
+        Report hit/miss counters and the memory tier's size.
+
+        Returns:
+            dict: counters plus entries, bytes and max_bytes
+        """
+        with self._lock:
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -1,142 +1,241 @@
 """
 The main file for the web application.
-This file contains the routes for the web application.
+This file contains the routes for the web application. Search, typeahead,
+facet and upload routes are blueprints in *_routes.py, entries are read and
+written through entries.py.
 """
 
+import atexit
+import logging
 import os
-import re
 from datetime import datetime, timezone
-from collections import Counter
-from flask import Flask, render_template, request, redirect, url_for
-from pymongo import MongoClient
+from flask import Flask, render_template, request, redirect, url_for, jsonify
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING
 from pymongo.errors import PyMongoError
-from dotenv import load_dotenv
-import requests
-
-
-# Load environment variables from .env file
-load_dotenv()
-
-
-# Connect to MongoDB
-ML_CLIENT_URL = os.getenv("ML_CLIENT_URL", "http://ml-client:6000/get-transcripts")
-if os.getenv("MODE") == "docker":
-    ML_CLIENT_URL = os.getenv("ML_CLIENT_URL", "http://ml-client:6000/get-transcripts")
-elif os.getenv("MODE") == "local":
-    ML_CLIENT_URL = os.getenv("ML_CLIENT_URL", "http://localhost:6000/get-transcripts")
-
-print(f"ML_CLIENT_URL: {ML_CLIENT_URL}")
-mongo_host = os.getenv("MONGO_HOST", "mongodb")
-mongo_port = os.getenv("MONGO_PORT", "27017")
-mongo_username = os.getenv("MONGO_INITDB_ROOT_USERNAME", "admin")
-mongo_password = os.getenv("MONGO_INITDB_ROOT_PASSWORD", "password")
-mongo_db_name = os.getenv("MONGO_DB_NAME", "voice_data")
-
-client = MongoClient(
-    f"mongodb://{mongo_username}:{mongo_password}@{mongo_host}:{mongo_port}/"
+from search_index import TranscriptIndex
+from response_cache import make_etag
+from corpus import CORPUS_COLLECTION, corpus_top_words, rebuild, record_change
+from text_analytics import word_frequency
+from entries import (
+    DATE_SORT,
+    LISTING_CACHE_SECONDS,
+    LIST_PROJECTION,
+    LIST_SORT,
+    MAX_PAGE_SIZE,
+    PAGE_SIZE,
+    SEARCH_INDEX_SNAPSHOT,
+    backfill_search_fields,
+    collection,
+    corpus_collection,
+    db,
+    delete_entry,
+    edit_word_stats,
+    ensure_indexes,
+    entry_filter,
+    entry_pages,
+    entry_versions,
+    entry_word_counts,
+    facet_cache,
+    jobs_collection,
+    keyword_query,
+    list_entries,
+    listing_pages,
+    migrate_dates,
+    prefix_filter,
+    suggest_index,
+    transcript_index,
+    update_entry,
 )
-db = client[mongo_db_name]
-collection = db["transcriptions"]
+from transcription import ML_CLIENT_URL, retranscribe_missing
+import facet_routes
+import search_routes
+import suggest_routes
+import upload_routes
+import schema
+import startup
 
 app = Flask(__name__)
-app.config["UPLOAD_FOLDER"] = os.path.join("static", "uploaded_audio")
+app.config["UPLOAD_FOLDER"] = upload_routes.UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024  # 50MB max file size
-
-STOP_WORDS = {
-    "the",
-    "is",
-    "in",
-    "and",
-    "of",
-    "a",
-    "to",
-    "with",
-    "that",
-    "for",
-    "on",
-    "as",
-    "are",
-    "at",
-    "by",
-    "an",
-    "be",
-    "this",
-    "it",
-    "from",
-    "or",
-    "was",
-    "we",
-    "you",
-    "your",
-    "they",
-    "he",
-    "she",
-    "but",
-    "not",
-    "have",
-    "has",
-    "had",
-    "can",
-    "will",
-    "do",
-    "does",
-    "did",
-    "so",
-    "if",
-    "then",
-    "them",
-    "these",
-    "those",
-    "there",
-    "here",
-}
-
-# Ensure upload directory exists
-os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+for blueprint in (
+    search_routes.blueprint,
+    suggest_routes.blueprint,
+    facet_routes.blueprint,
+    upload_routes.blueprint,
+):
+    app.register_blueprint(blueprint)
 
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     """
-    Main index route. Renders the list of entries.
-    Supports keyword search via POST.
+    Main index route. Renders the first page of entries, newest first.
+    Supports keyword search via POST and speaker and date range filters,
+    further pages are loaded from /api/entries.
     """
-    keyword = ""
+    filters = {
+        name: request.values.get(name, "").strip()
+        for name in ("keyword", "speaker", "from", "to")
+    }
+    key = tuple(filters.values())
+    cached = listing_pages.get(key, LISTING_CACHE_SECONDS)
+    if cached:
+        return conditional_response(*cached)
     try:
-        if request.method == "POST":
-            keyword = request.form.get("keyword", "").strip()
-            query = {
-                "$or": [
-                    {"title": {"$regex": keyword, "$options": "i"}},
-                    {"speaker": {"$regex": keyword, "$options": "i"}},
-                    {"date": {"$regex": keyword, "$options": "i"}},
-                ]
-            }
-            entries = list(collection.find(query).sort("created_at", -1))
-        else:
-            entries = list(collection.find().sort("created_at", -1))
-
-        return render_template("index.html", entries=entries, keyword=keyword)
+        query, order = entry_filter(
+            filters["keyword"], filters["speaker"], filters["from"], filters["to"]
+        )
+    except ValueError:
+        return "Invalid date", 400
+    try:
+        entries, next_cursor = list_entries(query, order=order)
+        facets = facet_cache.get(collection, query)
+
+        body = render_template(
+            "index.html",
+            entries=entries,
+            keyword=filters["keyword"],
+            filters=filters,
+            facets=facets,
+            next_cursor=next_cursor,
+        ).encode("utf-8")
+        etag = make_etag(body)
+        listing_pages.put(key, etag, body)
+        return conditional_response(etag, body)
 
     except PyMongoError as e:
         print("Search error:", e)
         return "Internal Server Error", 500
 
 
+@app.route("/api/entries")
+def api_entries():
+    """
+    JSON listing of entries, one keyset-paginated page at a time.
+
+    Query args:
+        cursor: next_cursor of the previous page
+        limit: page size, at most MAX_PAGE_SIZE
+        keyword: same search as the index page
+        speaker: only this speaker's entries (case-insensitive)
+        from, to: only entries recorded in this date range, both inclusive,
+            as YYYY-MM-DD; the page is then ordered by recording date
+
+    Returns:
+        json: entries and the cursor of the next page (null on the last page)
+    """
+    try:
+        limit = min(int(request.args.get("limit", PAGE_SIZE)), MAX_PAGE_SIZE)
+        query, order = entry_filter(
+            request.args.get("keyword", "").strip(),
+            request.args.get("speaker", "").strip(),
+            request.args.get("from", "").strip(),
+            request.args.get("to", "").strip(),
+        )
+        entries, next_cursor = list_entries(
+            query, request.args.get("cursor"), max(limit, 1), order
+        )
+    except ValueError:
+        return jsonify({"message": "Invalid cursor, limit or date"}), 400
+    except PyMongoError as e:
+        print("Listing error:", e)
+        return jsonify({"message": "Database error"}), 500
+
+    return jsonify(
+        {
+            "entries": [
+                {
+                    "id": entry["_id"],
+                    "title": entry.get("title"),
+                    "speaker": entry.get("speaker"),
+                    "date": entry.get("date"),
+                    "recorded_on": (
+                        entry["recorded_on"].date().isoformat()
+                        if entry.get("recorded_on")
+                        else None
+                    ),
+                    "url": url_for("view_entry", file_path=entry["_id"]),
+                    "delete_url": url_for("delete_route", file_path=entry["_id"]),
+                }
+                for entry in entries
+            ],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+@app.route("/api/corpus/top-words")
+def api_corpus_top_words():
+    """
+    Most frequent words across all recordings, or one speaker's recordings.
+
+    Query args:
+        speaker: only count this speaker's entries
+        limit: number of words, at most MAX_PAGE_SIZE
+
+    Returns:
+        json: scope and [word, count] pairs, most frequent first
+    """
+    speaker = request.args.get("speaker")
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"message": "Invalid limit"}), 400
+    try:
+        words = corpus_top_words(corpus_collection, speaker, limit)
+    except PyMongoError as e:
+        print("Corpus lookup error:", e)
+        return jsonify({"message": "Database error"}), 500
+    return jsonify({"speaker": speaker, "top_words": words})
+
+
 @app.route("/entry/<path:file_path>")
 def view_entry(file_path):
     """
     Renders a detail page for a specific entry using its file path (_id).
+    The page is cached and tagged by the entry's version, so unchanged
+    entries are neither loaded nor rendered again.
     """
     try:
-        entry = collection.find_one({"_id": file_path})
+        version = entry_versions.get(collection, file_path)
+        if version is None:
+            return "Entry not found", 500
+        etag = make_etag(file_path, version)
+        if request.if_none_match.contains(etag):
+            return conditional_response(etag)
+        cached = entry_pages.get(etag)
+        if cached:
+            return conditional_response(*cached)
+
+        entry = collection.find_one({"_id": file_path}, {"word_sketch": 0})
         if entry is None:
+            entry_versions.forget(file_path)
             return "Entry not found", 500
-        return render_template("detail.html", entry=entry)
+        entry_versions.remember(file_path, entry.get("version", 0))
+        etag = make_etag(file_path, entry.get("version", 0))
+        body = render_template("detail.html", entry=entry).encode("utf-8")
+        entry_pages.put(etag, etag, body)
+        return conditional_response(etag, body)
     except PyMongoError:
         return "Database error", 500
 
 
+def conditional_response(etag, body=None):
+    """
+    An HTML response tagged with a strong ETag, or 304 Not Modified if the
+    client already has it. Clients must revalidate before reusing it.
+    """
+    if body is None or request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
 @app.route("/delete/<path:file_path>", methods=["POST"])
 def delete_route(file_path):
     """
@@ -158,80 +257,57 @@ def create():
     return render_template("create.html")
 
 
-@app.route("/upload", methods=["POST"])
-def upload():
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
     """
-    Handles the upload of audio files and associated metadata.
-
-    This route processes POST requests containing:
-    - An audio file
-    - Form data including title, speaker, date, and description
+    Reports the status of a queued transcription job.
 
     Returns:
-        str: A success message if the upload is successful
-        tuple: (error message, status code) if the upload fails
-
-    Raises:
-        400: If no audio file is provided or if no file is selected
-    """
-    # check if the audio file is provided
-    if "audio" not in request.files:
-        return "No audio file", 400
-
-    file = request.files["audio"]
-    if file.filename == "":
-        return "No selected file", 400
-
-    # save the file to the uploads folder in the root directory
-    if file:
-        try:
-            # Generate unique filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{timestamp}_{file.filename}"
-            filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            print("filename:", filename)
-            print("filepath:", filepath)
-            file.save(filepath)
-        except (OSError, IOError) as e:
-            print("Error saving file:", e)
-            return "Error saving file", 500
-
-        # get data from the form
-        try:
-            title = request.form["title"]
-            speaker = request.form["speaker"]
-            date = request.form["date"]
-            description = request.form["description"]
-            print("Got data from page:", title, speaker, date, description)
-            # Prepare metadata dictionary
-            metadata = {
-                "title": title,
-                "speaker": speaker,
-                "date": date,
-                "context": description,
-            }
-
-            # Try to send to ML for transcript
-            try:
-                print(f"Sending file to ML client: {filepath}")
-                ml_response = trigger_ml(filepath)
-                print(f"ML client response: {ml_response}")
-                transcript = ml_response.get("transcript", "")
-                metadata["transcript"] = transcript
-            except requests.exceptions.RequestException as e:
-                print("Error from ML:", e)
-                metadata["transcript"] = ""
+        json: job status, attempts and error if any
+    """
+    try:
+        job = jobs_collection.find_one({"_id": ObjectId(job_id)})
+    except InvalidId:
+        return jsonify({"message": "Invalid job id"}), 400
+    except PyMongoError:
+        return jsonify({"message": "Database error"}), 500
+    if job is None:
+        return jsonify({"message": "Job not found"}), 404
+    return jsonify(
+        {
+            "job_id": job_id,
+            "audio_file": job["audio_file"],
+            "status": job["status"],
+            "attempts": job.get("attempts", 0),
+            "error": job.get("error"),
+        }
+    )
 
-            # Save metadata using upload_entry function
-            if not upload_entry(filepath, metadata):
-                print("Error uploading entry to MongoDB")
-                return "Error saving metadata to database", 500
 
-        except (OSError, IOError) as e:
-            print("Error during data processing:", e)
-            return "Error during data processing", 500
+@app.route("/entry/<path:file_path>/words/<word>")
+def word_frequency_api(file_path, word):
+    """
+    Reports how often a word occurs in an entry's transcript: exact for its top
+    words, estimated from the entry's word sketch otherwise.
 
-    return "File uploaded successfully", 200
+    Returns:
+        json: word, count and whether the count is exact
+    """
+    try:
+        entry = collection.find_one(
+            {"_id": file_path}, {"top_words": 1, "word_sketch": 1}
+        )
+    except PyMongoError:
+        return jsonify({"message": "Database error"}), 500
+    if entry is None:
+        return jsonify({"message": "Entry not found"}), 404
+    try:
+        count, exact = word_frequency(entry, word)
+    except ValueError:
+        count, exact = None, False
+    if count is None:
+        return jsonify({"message": "No word statistics for this entry"}), 404
+    return jsonify({"word": word.lower(), "count": count, "exact": exact})
 
 
 @app.route("/entry/<path:file_path>/edit", methods=["GET", "POST"])
@@ -252,163 +328,219 @@ def edit_entry(file_path):
                 "context": request.form["context"],
                 "transcript": request.form["transcript"],
             }
-            updated_fields["word_count"] = len(updated_fields["transcript"].split())
-            updated_fields["top_words"] = sorted(
-                [
-                    (word, count)
-                    for word, count in Counter(
-                        re.findall(r"\b\w+\b", updated_fields["transcript"].lower())
-                    ).items()
-                    if len(word) > 2 and word not in STOP_WORDS
-                ],
-                key=lambda x: x[1],
-                reverse=True,
-            )
-            update_entry(file_path, updated_fields)
+            old_counts = new_counts = None
+            transcript_changed = updated_fields["transcript"] != entry.get("transcript")
+            if transcript_changed:
+                old_counts, stats = edit_word_stats(entry, updated_fields["transcript"])
+                new_counts = stats["frequencies"]
+                updated_fields["word_count"] = stats["word_count"]
+                updated_fields["top_words"] = stats["top_words"]
+                updated_fields["word_sketch"] = stats["word_sketch"]
+                updated_fields["transcript_updated_at"] = datetime.now(timezone.utc)
+            elif updated_fields["speaker"] != entry.get("speaker"):
+                old_counts = new_counts = entry_word_counts(entry)
+            if not update_entry(file_path, updated_fields):
+                return redirect(url_for("view_entry", file_path=file_path))
+            if transcript_changed:
+                transcript_index.add(file_path, updated_fields["transcript"])
+            suggest_index.record(entry, updated_fields)
+            if new_counts is not None:
+                record_change(
+                    corpus_collection,
+                    old_counts,
+                    new_counts,
+                    entry.get("speaker"),
+                    updated_fields["speaker"],
+                )
             return redirect(url_for("view_entry", file_path=file_path))
         return render_template("edit.html", entry=entry)
     except PyMongoError:
         return False
 
 
-def upload_entry(file_path, field_value_dict=None):
+def query_shapes():
     """
-    Uploads an entry to the MongoDB collection with the given metadata.
-    Stores default values if fields are empty or None.
-    Returns True if successful, False if failed.
-
-    Args:
-        file_path (str): The file path of the audio file.
-        field_value_dict (dict): A dictionary containing metadata fields and their values.
-
-    Returns:
-        bool: True if the entry was uploaded successfully, False otherwise.
+    Lists every query shape the web-app issues, with representative values.
     """
-    if not file_path:
-        return False
-
-    if field_value_dict is None:
-        field_value_dict = {}
-
-    transcript = field_value_dict.get("transcript", "")
-    word_count = len(transcript.split())
-
-    # Filter and rank top words (longer than 3 characters)
-    top_words = sorted(
-        [
-            (word, count)
-            for word, count in Counter(
-                re.findall(r"\b\w+\b", transcript.lower())
-            ).items()
-            if len(word) > 3 and word not in STOP_WORDS
-        ],
-        key=lambda x: x[1],
-        reverse=True,
-    )
-    # store computed values into dic
-    field_value_dict["word_count"] = word_count
-    field_value_dict["top_words"] = top_words
-    # Create a new entry with default values or values from the dictionary
-    new_entry = {
-        "_id": file_path,
-        "title": field_value_dict.get("title", "Untitled"),
-        "speaker": field_value_dict.get("speaker", "Unknown"),
-        "date": field_value_dict.get("date", "N/A"),
-        "context": field_value_dict.get("context", "No context provided"),
-        "transcript": field_value_dict.get("transcript", ""),
-        "word_count": word_count,
-        "top_words": top_words,
-        "audio_file": file_path,
-        "created_at": datetime.now(timezone.utc),
+    now = datetime.now(timezone.utc)
+    next_page = {
+        "$or": [
+            {"created_at": {"$lt": now}},
+            {"created_at": now, "_id": {"$lt": "~"}},
+        ]
     }
-
-    try:
-        result = collection.insert_one(new_entry)
-        return result.acknowledged
-    except PyMongoError:
-        return False
+    shape = schema.query_shape
+    return [
+        shape("index", "transcriptions", {}, LIST_PROJECTION, LIST_SORT),
+        shape(
+            "index next page", "transcriptions", next_page, LIST_PROJECTION, LIST_SORT
+        ),
+        shape(
+            "index search",
+            "transcriptions",
+            keyword_query("weekly"),
+            LIST_PROJECTION,
+            LIST_SORT,
+        ),
+        shape(
+            "date range",
+            "transcriptions",
+            entry_filter(date_from="2025-01-01", date_to="2025-03-31")[0],
+            LIST_PROJECTION,
+            DATE_SORT,
+        ),
+        shape(
+            "speaker date range",
+            "transcriptions",
+            entry_filter(speaker="ann", date_from="2025-01-01", date_to="2025-03-31")[
+                0
+            ],
+            LIST_PROJECTION,
+            DATE_SORT,
+        ),
+        shape("view/edit/update/delete entry", "transcriptions", {"_id": "x"}),
+        shape("search_entry", "transcriptions", {"title_lc": prefix_filter("a")}),
+        shape(
+            "search index sync",
+            "transcriptions",
+            {"transcript_updated_at": {"$gte": datetime.now(timezone.utc)}},
+            {"transcript": 1},
+        ),
+        shape(
+            "duplicate audio lookup",
+            "transcriptions",
+            {"audio_sha256": "0" * 64, "transcript": {"$nin": ["", None]}},
+        ),
+        shape(
+            "enqueue transcription",
+            "transcription_jobs",
+            {"audio_file": "x", "status": {"$in": ["queued", "running"]}},
+        ),
+        shape("job status", "transcription_jobs", {"_id": ObjectId()}),
+        shape(
+            "corpus top words",
+            CORPUS_COLLECTION,
+            {"scope": "all", "count": {"$gt": 0}},
+            {"_id": 0, "word": 1, "count": 1},
+            [("count", DESCENDING)],
+        ),
+    ]
+
+
+@app.cli.command("audit-queries")
+def audit_queries_command():
+    """
+    Explains every web-app query shape and reports docs examined vs. returned.
+    """
+    reports = schema.audit_queries(db, query_shapes())
+    if any(report["collscan"] for report in reports):
+        raise SystemExit("Some query shapes do a COLLSCAN")
 
 
-def trigger_ml(filepath):
+@app.cli.command("backfill-search-fields")
+def backfill_search_fields_command():
     """
-    Triggers machine learning client by sending a signal to ml client by Flask
+    Fills in the lowercase search fields of older entries.
+    """
+    print(f"Backfilled the search fields of {backfill_search_fields()} entries")
 
-    Args:
-        filepath (str): The file path of the audio file.
 
-    Returns:
-        str: the transcript of the audio file if transcript was generated successfully,
-        empty string otherwise.
+@app.cli.command("migrate-dates")
+def migrate_dates_command():
     """
-    try:
-        # Send the data to ML Client
-        print(f"Sending request to ML client at {ML_CLIENT_URL} with file: {filepath}")
-        response = requests.post(
-            ML_CLIENT_URL, json={"audio_file_path": filepath}, timeout=10
-        )
-
-        response_data = response.json()
-        print(f"ML client response: {response_data}")
-        return response_data
-    except requests.exceptions.RequestException as e:
-        print(f"Request exception: {e}")
-        return "Request exception"
-    except ConnectionError:
-        return "Connection error"
-    except TimeoutError:
-        return "Timeout error"
+    Parses the free-text date of older entries into recorded_on.
+    """
+    print(f"Migrated the date of {migrate_dates()} entries")
 
 
-def delete_entry(file_path):
+@app.cli.command("retranscribe-missing")
+def retranscribe_missing_command():
     """
-    Deletes an entry from the MongoDB collection by file path.
-    Returns True if successful, False if no entry was found or failed.
+    Transcribes, in batches, the audio of every entry that has no transcript.
     """
-    if not file_path:
-        return False
+    print(f"Retranscribed: {dict(retranscribe_missing())}")
 
-    try:
-        result = collection.delete_one({"_id": file_path})
-        return result.deleted_count > 0
-    except PyMongoError:
-        return False
+
+@app.cli.command("rebuild-corpus")
+def rebuild_corpus_command():
+    """
+    Recomputes the corpus-wide word counts from every entry.
+    """
+    counted = rebuild(db, collection)
+    print(f"Rebuilt corpus word counts from {counted} entries")
 
 
-def search_entry(file_path=None, title=None, speaker=None):
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
     """
-    Searches for entries in the MongoDB collection based on file path, title, or speaker.
-    Performs a partial and case-insensitive match.
-    Returns a list of matching documents if found, or False if no matching entries are found.
+    Re-reads every transcript into a new transcript search snapshot.
     """
-    query = {}
+    fresh_index = TranscriptIndex(SEARCH_INDEX_SNAPSHOT)
+    indexed = fresh_index.sync(collection)
+    fresh_index.save()
+    print(f"Indexed {indexed} transcripts into {SEARCH_INDEX_SNAPSHOT}")
 
-    if file_path:
-        query["_id"] = {"$regex": file_path, "$options": "i"}
 
-    if title:
-        query["title"] = {"$regex": title, "$options": "i"}
+def search_plans(keywords=("a", "weekly meeting")):
+    """
+    Explains every search query shape the web-app issues, first and next pages.
 
-    if speaker:
-        query["speaker"] = {"$regex": speaker, "$options": "i"}
+    Returns:
+        dict: query shape name -> list of winning plan stages
+    """
+    now = datetime.now(timezone.utc)
+    next_page = {
+        "$or": [
+            {"created_at": {"$lt": now}},
+            {"created_at": now, "_id": {"$lt": "~"}},
+        ]
+    }
+    shapes = {"search_entry title": {"title_lc": prefix_filter("a")}}
+    for keyword in keywords:
+        query = keyword_query(keyword)
+        shapes[f"search {keyword!r}"] = query
+        shapes[f"search {keyword!r}, next page"] = {"$and": [query, next_page]}
 
-    try:
-        results = list(collection.find(query))
-        return results if results else False
-    except PyMongoError:
-        return False
+    plans = {}
+    for name, query in shapes.items():
+        explained = collection.find(query, LIST_PROJECTION).sort(LIST_SORT).explain()
+        plans[name] = schema.plan_stages(explained["queryPlanner"]["winningPlan"])
+    return plans
 
 
-def update_entry(file_path, update_fields):
+@app.cli.command("check-search-plans")
+def check_search_plans():
     """
-    Updates an existing entry in the MongoDB collection.
-    Returns True if update was successful, False if failed.
+    Fails if any search query shape is planned as a collection scan.
     """
-    try:
-        result = collection.update_one({"_id": file_path}, {"$set": update_fields})
-        return result.modified_count > 0
-    except PyMongoError:
-        return False
+    ensure_indexes()
+    scans = []
+    for name, stages in search_plans().items():
+        print(f"{name}: {' -> '.join(stages)}")
+        if "COLLSCAN" in stages:
+            scans.append(name)
+    if scans:
+        raise SystemExit(f"COLLSCAN in: {', '.join(scans)}")
+    print("No search path does a COLLSCAN")
+
+
+def create_app():
+    """
+    Prepares the web-app for serving in this process and returns it.
+    Production runs it once per worker: gunicorn -c gunicorn.conf.py "app:create_app()"
+    """
+    app.logger.setLevel(logging.INFO)
+    app.logger.info("ML_CLIENT_URL: %s", ML_CLIENT_URL)
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    ensure_indexes()
+    # serve searches from the snapshot while the index catches up
+    transcript_index.open()
+    transcript_index.refresh_later(collection)
+    atexit.register(transcript_index.save)
+    startup.report("web-app")
+    return app
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # development server, single process
+    create_app().run(host="0.0.0.0", port=5000, debug=os.getenv("FLASK_DEBUG") == "1")
@@ -0,0 +1,551 @@
+"""
+Entries of the web-app: their MongoDB collections, the listing queries, and
+the writes, which keep the in-process search index, typeahead, facet counts
+and page caches current.
+"""
+
+import base64
+import binascii
+import json
+import os
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+from search_index import TranscriptIndex
+from suggest import SuggestIndex
+from facets import FacetCache
+from response_cache import RESPONSE_CACHE_BYTES, EntryVersions, ResponseCache
+from corpus import CORPUS_COLLECTION, record_change
+from text_analytics import (
+    analyze,
+    summarize,
+    text_digest,
+    update_frequencies,
+    word_frequencies,
+)
+from mongo import LazyDatabase
+import schema
+
+# Load environment variables from .env file, before the settings below read them
+load_dotenv()
+
+# Each process opens its own client on first use, see mongo.py
+db = LazyDatabase()
+collection = db["transcriptions"]
+jobs_collection = db["transcription_jobs"]
+# Full word counts of edited transcripts, for incremental re-analysis
+word_counts_collection = db["word_counts"]
+corpus_collection = db[CORPUS_COLLECTION]
+
+# Listing pages only fetch what the index page shows
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "20"))
+MAX_PAGE_SIZE = 100
+LIST_PROJECTION = {
+    "title": 1,
+    "speaker": 1,
+    "date": 1,
+    "recorded_on": 1,
+    "created_at": 1,
+}
+LIST_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+# Listings filtered by recording date are ordered by it
+DATE_SORT = [("recorded_on", DESCENDING), ("_id", DESCENDING)]
+
+# Formats accepted for the free-text date, the form's date input sends the first
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%Y/%m/%d",
+    "%m/%d/%Y",
+    "%d.%m.%Y",
+    "%B %d, %Y",
+    "%b %d, %Y",
+    "%d %B %Y",
+    "%d %b %Y",
+)
+
+# Fields searched from the index page, each with a lowercase "<name>_lc" shadow
+SEARCH_FIELDS = ("title", "speaker", "date")
+
+# Transcript full-text search, loaded from its snapshot in the app's instance
+# folder and kept in sync with MongoDB
+SEARCH_INDEX_SNAPSHOT = os.getenv(
+    "SEARCH_INDEX_SNAPSHOT",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "instance", "search_index.bin"
+    ),
+)
+SEARCH_SYNC_SECONDS = float(os.getenv("SEARCH_SYNC_SECONDS", "5"))
+transcript_index = TranscriptIndex(SEARCH_INDEX_SNAPSHOT)
+
+# Typeahead over speakers and titles, loaded on the first suggestion
+suggest_index = SuggestIndex()
+
+# Facet counts next to listings, invalidated by writes, recomputed at least
+# every FACET_MAX_AGE seconds
+facet_cache = FacetCache()
+
+# Rendered entry pages keyed by (entry id, version), and listing pages kept
+# for at most LISTING_CACHE_SECONDS or until the next write
+entry_versions = EntryVersions()
+entry_pages = ResponseCache()
+listing_pages = ResponseCache(RESPONSE_CACHE_BYTES // 4)
+LISTING_CACHE_SECONDS = float(os.getenv("LISTING_CACHE_SECONDS", "5"))
+
+
+def search_fields(fields):
+    """
+    Builds the lowercase shadow copies of the searchable fields present in fields.
+    Prefix searches run on these so they can use a plain index.
+    """
+    return {
+        f"{name}_lc": str(fields[name]).lower()
+        for name in SEARCH_FIELDS
+        if fields.get(name) is not None
+    }
+
+
+def parse_date(text):
+    """
+    Parses a free-text recording date, see DATE_FORMATS.
+
+    Returns:
+        datetime: midnight UTC of that day, or None if text is not a date
+    """
+    text = str(text or "").strip()
+    for date_format in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+        return parsed.replace(tzinfo=timezone.utc)
+    return None
+
+
+def date_fields(fields):
+    """
+    Builds the typed copy of the free-text date, if fields has one.
+    Date range filters run on "recorded_on", None when the date does not parse.
+    """
+    if "date" not in fields:
+        return {}
+    return {"recorded_on": parse_date(fields["date"])}
+
+
+def prefix_filter(text):
+    """
+    Builds an anchored, case-sensitive regex matching values starting with text.
+    The text is escaped, so user input never acts as a pattern.
+    """
+    return {"$regex": f"^{re.escape(text)}"}
+
+
+def keyword_query(keyword):
+    """
+    Builds the MongoDB filter for an index page keyword search.
+    An entry matches if its title, speaker or date starts with the keyword
+    (case-insensitive, via the lowercase shadow fields), or if any word of the
+    keyword appears in its title or speaker (via the text index).
+    An empty keyword matches every entry.
+    """
+    if not keyword:
+        return {}
+    prefix = prefix_filter(keyword.lower())
+    clauses = [{f"{name}_lc": prefix} for name in SEARCH_FIELDS]
+    # drop text search operators like -negation and "phrases" from user input
+    tokens = re.findall(r"\w+", keyword)
+    if tokens:
+        clauses.append({"$text": {"$search": " ".join(tokens)}})
+    return {"$or": clauses}
+
+
+def entry_filter(keyword="", speaker="", date_from="", date_to=""):
+    """
+    Builds the MongoDB filter of a listing and the field it is ordered by.
+
+    A speaker is matched exactly on its lowercase shadow field. A date range
+    filters on recorded_on, and the listing is then ordered by it, so a
+    speaker and date range listing is a seek on the speaker_lc_recorded_on
+    index. Either end of the range may be left empty.
+
+    Returns:
+        tuple: (filter, "created_at" or "recorded_on")
+
+    Raises:
+        ValueError: if a date is not YYYY-MM-DD
+    """
+    clauses = [keyword_query(keyword)] if keyword else []
+    if speaker:
+        clauses.append({"speaker_lc": speaker.lower()})
+    order = "created_at"
+    if date_from or date_to:
+        recorded_on = {}
+        if date_from:
+            recorded_on["$gte"] = datetime.strptime(date_from, "%Y-%m-%d").replace(
+                tzinfo=timezone.utc
+            )
+        if date_to:
+            recorded_on["$lte"] = datetime.strptime(date_to, "%Y-%m-%d").replace(
+                tzinfo=timezone.utc
+            )
+        clauses.append({"recorded_on": recorded_on})
+        order = "recorded_on"
+    if len(clauses) > 1:
+        return {"$and": clauses}, order
+    return (clauses[0] if clauses else {}), order
+
+
+def encode_cursor(entry, order="created_at"):
+    """
+    Encodes the (order field, _id) position of an entry as an opaque page cursor.
+    """
+    created_at = entry[order]
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    millis = int(created_at.timestamp() * 1000)
+    token = json.dumps([millis, entry["_id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(token).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a page cursor back to (created_at or recorded_on, _id).
+
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    try:
+        millis, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        created_at = datetime.fromtimestamp(millis / 1000, tz=timezone.utc)
+    except (TypeError, binascii.Error, UnicodeError, OverflowError, OSError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return created_at, entry_id
+
+
+def list_entries(query=None, cursor=None, limit=PAGE_SIZE, order="created_at"):
+    """
+    Fetches one page of entries, newest first, with only the listed fields.
+
+    Pages are keyed on (order, _id) rather than skipped over, so every
+    page costs the same index seek however deep it is.
+
+    Args:
+        query (dict): MongoDB filter, e.g. from entry_filter
+        cursor (str): next_cursor of the previous page, None for the first page
+        limit (int): page size
+        order (str): "created_at", or "recorded_on" for a date range filter
+
+    Returns:
+        tuple: (list of entries, cursor of the next page or None)
+
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    query = dict(query or {})
+    if cursor:
+        position, entry_id = decode_cursor(cursor)
+        after = {
+            "$or": [
+                {order: {"$lt": position}},
+                {order: position, "_id": {"$lt": entry_id}},
+            ]
+        }
+        query = {"$and": [query, after]} if query else after
+
+    sort = DATE_SORT if order == "recorded_on" else LIST_SORT
+    entries = list(collection.find(query, LIST_PROJECTION).sort(sort).limit(limit + 1))
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1], order)
+    return entries, next_cursor
+
+
+def entries_changed(file_path=None):
+    """
+    Drops what the caches hold about the entries after a write.
+    """
+    facet_cache.invalidate()
+    listing_pages.clear()
+    if file_path:
+        entry_versions.forget(file_path)
+
+
+def upload_entry(file_path, field_value_dict=None):
+    """
+    Uploads an entry to the MongoDB collection with the given metadata.
+    Stores default values if fields are empty or None.
+    Returns True if successful, False if failed.
+
+    Args:
+        file_path (str): The entry id, also the audio path unless "audio_file" is given.
+        field_value_dict (dict): A dictionary containing metadata fields and their values.
+            Precomputed "word_count", "top_words" and "word_sketch" are stored
+            as given.
+
+    Returns:
+        bool: True if the entry was uploaded successfully, False otherwise.
+    """
+    if not file_path:
+        return False
+
+    if field_value_dict is None:
+        field_value_dict = {}
+
+    transcript = field_value_dict.get("transcript", "")
+    word_count = field_value_dict.get("word_count")
+    top_words = field_value_dict.get("top_words")
+    word_sketch = field_value_dict.get("word_sketch")
+    counts = None
+    if word_count is None or top_words is None:
+        # top words are longer than 3 characters, see text_analytics.POLICIES
+        stats = analyze(transcript, "upload")
+        counts = stats["frequencies"]
+        word_count = stats["word_count"] if word_count is None else word_count
+        top_words = stats["top_words"] if top_words is None else top_words
+        word_sketch = stats["word_sketch"] if word_sketch is None else word_sketch
+    # store computed values into dic
+    field_value_dict["word_count"] = word_count
+    field_value_dict["top_words"] = top_words
+    # Create a new entry with default values or values from the dictionary
+    new_entry = {
+        "_id": file_path,
+        "title": field_value_dict.get("title", "Untitled"),
+        "speaker": field_value_dict.get("speaker", "Unknown"),
+        "date": field_value_dict.get("date", "N/A"),
+        "context": field_value_dict.get("context", "No context provided"),
+        "transcript": field_value_dict.get("transcript", ""),
+        "word_count": word_count,
+        "top_words": top_words,
+        "audio_file": field_value_dict.get("audio_file", file_path),
+        "created_at": datetime.now(timezone.utc),
+        "version": 1,
+    }
+    new_entry["transcript_updated_at"] = new_entry["created_at"]
+    new_entry.update(search_fields(new_entry))
+    new_entry.update(date_fields(new_entry))
+    if field_value_dict.get("audio_sha256"):
+        new_entry["audio_sha256"] = field_value_dict["audio_sha256"]
+    if word_sketch:
+        new_entry["word_sketch"] = word_sketch
+
+    try:
+        result = collection.insert_one(new_entry)
+    except PyMongoError:
+        return False
+    if result.acknowledged:
+        suggest_index.record(new=new_entry)
+        entries_changed()
+    if result.acknowledged and transcript:
+        transcript_index.add(file_path, transcript)
+        if counts is None:
+            counts = word_frequencies(transcript)
+        record_change(
+            corpus_collection, {}, counts, new_entry["speaker"], new_entry["speaker"]
+        )
+    return result.acknowledged
+
+
+def update_entry(file_path, update_fields):
+    """
+    Updates an existing entry in the MongoDB collection.
+    Returns True if update was successful, False if failed.
+    """
+    try:
+        result = collection.update_one(
+            {"_id": file_path},
+            {
+                "$set": {
+                    **update_fields,
+                    **search_fields(update_fields),
+                    **date_fields(update_fields),
+                },
+                "$inc": {"version": 1},
+            },
+        )
+        if result.modified_count > 0:
+            entries_changed(file_path)
+        return result.modified_count > 0
+    except PyMongoError:
+        return False
+
+
+def delete_entry(file_path):
+    """
+    Deletes an entry from the MongoDB collection by file path.
+    Returns True if successful, False if no entry was found or failed.
+    """
+    if not file_path:
+        return False
+
+    try:
+        entry = collection.find_one_and_delete(
+            {"_id": file_path}, projection={"transcript": 1, "speaker": 1, "title": 1}
+        )
+        if entry is None:
+            return False
+        if entry.get("transcript"):
+            record_change(
+                corpus_collection,
+                entry_word_counts(entry),
+                {},
+                entry.get("speaker"),
+                entry.get("speaker"),
+            )
+        word_counts_collection.delete_one({"_id": file_path})
+        transcript_index.remove(file_path)
+        suggest_index.record(old=entry)
+        entries_changed(file_path)
+        return True
+    except PyMongoError:
+        return False
+
+
+def search_entry(file_path=None, title=None, speaker=None):
+    """
+    Searches for entries in the MongoDB collection based on file path, title, or speaker.
+    Performs an indexed prefix match, case-insensitive for title and speaker.
+    Returns a list of matching documents if found, or False if no matching entries are found.
+    """
+    query = {}
+
+    if file_path:
+        query["_id"] = prefix_filter(file_path)
+
+    if title:
+        query["title_lc"] = prefix_filter(title.lower())
+
+    if speaker:
+        query["speaker_lc"] = prefix_filter(speaker.lower())
+
+    try:
+        results = list(collection.find(query))
+        return results if results else False
+    except PyMongoError:
+        return False
+
+
+def stored_word_counts(entry):
+    """
+    Loads the full word counts stored for an entry, if they were computed from
+    its current transcript.
+
+    Returns:
+        Counter: the word counts, or None if there are none to trust
+    """
+    try:
+        stored = word_counts_collection.find_one({"_id": entry["_id"]})
+    except PyMongoError as e:
+        print("Error loading word counts:", e)
+        return None
+    if stored and stored.get("transcript_sha256") == text_digest(
+        entry.get("transcript") or ""
+    ):
+        return Counter(stored["counts"])
+    return None
+
+
+def entry_word_counts(entry):
+    """
+    Full word counts of an entry's transcript, stored or recounted.
+    """
+    counts = stored_word_counts(entry)
+    if counts is None:
+        counts = word_frequencies(entry.get("transcript") or "")
+    return counts
+
+
+def edit_word_stats(entry, transcript):
+    """
+    Computes the word stats of an edited transcript. The entry's stored word
+    counts are updated from the edited span only; the whole transcript is
+    re-analyzed when there are no usable stored counts or the edit is large.
+
+    Args:
+        entry (dict): the entry before the edit
+        transcript (str): the edited transcript
+
+    Returns:
+        tuple: (word counts before the edit, dict of word_count, frequencies,
+            top_words and word_sketch of the edited transcript)
+    """
+    old_transcript = entry.get("transcript") or ""
+    counts = None
+    old_counts = stored_word_counts(entry)
+    if old_counts is not None:
+        counts = update_frequencies(Counter(old_counts), old_transcript, transcript)
+    else:
+        old_counts = word_frequencies(old_transcript)
+    if counts is None:
+        counts = word_frequencies(transcript)
+
+    try:
+        word_counts_collection.replace_one(
+            {"_id": entry["_id"]},
+            {
+                "counts": dict(counts),
+                "transcript_sha256": text_digest(transcript),
+                "updated_at": datetime.now(timezone.utc),
+            },
+            upsert=True,
+        )
+    except PyMongoError as e:
+        # the next edit falls back to a full recompute
+        print("Error saving word counts:", e)
+    return old_counts, summarize(counts, transcript, "edit")
+
+
+def ensure_indexes():
+    """
+    Creates the indexes behind both services' queries. Safe to call on every
+    startup.
+    """
+    schema.ensure_indexes(db)
+
+
+def backfill_search_fields():
+    """
+    Fills in the lowercase search shadow fields of entries written before
+    they existed.
+
+    Returns:
+        int: number of entries updated
+    """
+    return collection.update_many(
+        {"title_lc": {"$exists": False}},
+        [
+            {
+                "$set": {
+                    f"{name}_lc": {"$toLower": {"$toString": f"${name}"}}
+                    for name in SEARCH_FIELDS
+                }
+            }
+        ],
+    ).modified_count
+
+
+def migrate_dates(batch_size=1000):
+    """
+    Fills in recorded_on for entries written before it existed. Dates that do
+    not parse are stored as None, so each entry is only looked at once.
+
+    Returns:
+        int: number of entries migrated
+    """
+    migrated = 0
+    batch = []
+    for entry in collection.find({"recorded_on": {"$exists": False}}, {"date": 1}):
+        batch.append(
+            UpdateOne(
+                {"_id": entry["_id"], "recorded_on": {"$exists": False}},
+                {"$set": date_fields({"date": entry.get("date")})},
+            )
+        )
+        if len(batch) >= batch_size:
+            migrated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        migrated += collection.bulk_write(batch, ordered=False).modified_count
+    return migrated
@@ -0,0 +1,37 @@
+"""
+Facet counts route: /api/facets, answered from the facet cache (facets.py).
+"""
+
+from flask import Blueprint, jsonify, request
+from pymongo.errors import PyMongoError
+from entries import collection, entry_filter, facet_cache
+
+blueprint = Blueprint("facets", __name__)
+
+
+@blueprint.route("/api/facets")
+def api_facets():
+    """
+    Facet counts of a listing: entries per speaker, per recording month and
+    per transcript length bucket. Cached, so dashboards can poll it.
+
+    Query args:
+        keyword, speaker, from, to: same filters as /api/entries
+
+    Returns:
+        json: speaker, month and length lists of {value, count}, computed_at
+    """
+    try:
+        query, _ = entry_filter(
+            request.args.get("keyword", "").strip(),
+            request.args.get("speaker", "").strip(),
+            request.args.get("from", "").strip(),
+            request.args.get("to", "").strip(),
+        )
+    except ValueError:
+        return jsonify({"message": "Invalid date"}), 400
+    try:
+        return jsonify(facet_cache.get(collection, query))
+    except PyMongoError as e:
+        print("Facet error:", e)
+        return jsonify({"message": "Database error"}), 500
@@ -0,0 +1,162 @@
+"""
+Facet counts of entry listings: entries per speaker, per recording month and
+per transcript length.
+
+The counts come from one $facet aggregation per listing filter. FacetCache
+keeps the latest results in memory. The web-app's writes invalidate it
+(invalidate()). Every result is also recomputed once it is older than
+FACET_MAX_AGE seconds, which bounds how stale the counts get after writes by
+other processes, like transcripts stored by the ml client.
+"""
+
+import calendar
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+FACET_MAX_AGE = float(os.getenv("FACET_MAX_AGE", "60"))
+FACET_CACHE_SIZE = int(os.getenv("FACET_CACHE_SIZE", "256"))
+FACET_SPEAKERS = 20
+
+# Lower bounds of the transcript length buckets, in words
+LENGTH_BOUNDARIES = [0, 1, 100, 500, 1000, 5000]
+
+
+def length_label(lower):
+    """
+    Name of the length bucket starting at lower, e.g. "100-499".
+    """
+    if lower == LENGTH_BOUNDARIES[-1]:
+        return f"{lower}+"
+    upper = LENGTH_BOUNDARIES[LENGTH_BOUNDARIES.index(lower) + 1] - 1
+    return str(lower) if upper == lower else f"{lower}-{upper}"
+
+
+def month_range(month):
+    """
+    First and last day of a "YYYY-MM" month, as YYYY-MM-DD listing filters.
+    """
+    year, number = map(int, month.split("-"))
+    last = calendar.monthrange(year, number)[1]
+    return f"{month}-01", f"{month}-{last:02d}"
+
+
+def facet_pipeline(query):
+    """
+    The aggregation counting the entries matching query by facet.
+    """
+    return [
+        {"$match": query},
+        {
+            "$facet": {
+                "speaker": [
+                    {"$group": {"_id": "$speaker", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1, "_id": 1}},
+                    {"$limit": FACET_SPEAKERS},
+                ],
+                "month": [
+                    {"$match": {"recorded_on": {"$type": "date"}}},
+                    {
+                        "$group": {
+                            "_id": {
+                                "$dateToString": {
+                                    "format": "%Y-%m",
+                                    "date": "$recorded_on",
+                                }
+                            },
+                            "count": {"$sum": 1},
+                        }
+                    },
+                    {"$sort": {"_id": -1}},
+                ],
+                "length": [
+                    {
+                        "$bucket": {
+                            "groupBy": {"$ifNull": ["$word_count", 0]},
+                            # the last bound catches everything above it
+                            "boundaries": LENGTH_BOUNDARIES,
+                            "default": LENGTH_BOUNDARIES[-1],
+                            "output": {"count": {"$sum": 1}},
+                        }
+                    }
+                ],
+            }
+        },
+    ]
+
+
+def compute_facets(collection, query):
+    """
+    Runs the facet aggregation.
+
+    Returns:
+        dict: facet name -> list of {"value", "count"}, plus "computed_at";
+            months also carry the "from" and "to" of their date range
+    """
+    result = next(iter(collection.aggregate(facet_pipeline(query))), {})
+    facets = {
+        "speaker": [
+            {"value": group["_id"], "count": group["count"]}
+            for group in result.get("speaker", [])
+        ],
+        "month": [
+            dict(
+                zip(("from", "to"), month_range(group["_id"])),
+                value=group["_id"],
+                count=group["count"],
+            )
+            for group in result.get("month", [])
+        ],
+        "length": [
+            {"value": length_label(group["_id"]), "count": group["count"]}
+            for group in result.get("length", [])
+        ],
+    }
+    facets["computed_at"] = datetime.now(timezone.utc).isoformat()
+    return facets
+
+
+class FacetCache:
+    """
+    LRU cache of facet counts per listing filter.
+    """
+
+    def __init__(self, max_age=FACET_MAX_AGE, size=FACET_CACHE_SIZE):
+        self.max_age = max_age
+        self.size = size
+        self._results = OrderedDict()  # filter key -> (computed at, facets)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, collection, query):
+        """
+        Facet counts of the entries matching query, cached.
+        """
+        key = json.dumps(query, sort_keys=True, default=str)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and now - cached[0] < self.max_age:
+                self._results.move_to_end(key)
+                return cached[1]
+            generation = self._generation
+        facets = compute_facets(collection, query)
+        with self._lock:
+            # a write during the aggregation may not be counted, don't keep it
+            if generation == self._generation:
+                self._results[key] = (now, facets)
+                self._results.move_to_end(key)
+                while len(self._results) > self.size:
+                    self._results.popitem(last=False)
+        return facets
+
+    def invalidate(self):
+        """
+        Drop every cached result, after a write changed the entries.
+        """
+        with self._lock:
+            self._generation += 1
+            self._results.clear()
@@ -0,0 +1,27 @@
+"""
+gunicorn settings of the web-app: gunicorn -c gunicorn.conf.py "app:create_app()"
+"""
+
+# gunicorn reads these lowercase names
+# pylint: disable=invalid-name
+
+import multiprocessing
+import os
+import startup
+
+# time the app's imports, each worker reports them once create_app() returns
+startup.install()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+# processes, one per core by default; each runs GUNICORN_THREADS request threads
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# the app is imported in each worker, after the fork, never in the master
+preload_app = False
+accesslog = "-"
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Time each worker's boot from its fork."""
+    startup.reset()
@@ -0,0 +1,164 @@
+"""
+Client for the ml-client's transcription API.
+
+One MLClient per web-app process keeps a requests.Session whose connection
+pool holds up to max_in_flight keep-alive connections to the ml-client, so
+uploads do not open a new TCP connection each. At most max_in_flight calls
+run at once. Further calls queue for up to queue_seconds and then raise
+MLClientBusy, which the web-app turns into 503 with Retry-After instead of
+piling more work onto a saturated ml-client.
+
+Calls go through a resilience.Endpoint (timeouts sized by the audio,
+retries and a circuit breaker, see resilience.py).
+"""
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from resilience import AdaptiveTimeout, Endpoint, audio_duration
+
+# Timeouts of ml-client calls: at least ML_CLIENT_MIN_TIMEOUT, growing with the
+# audio duration, at most ML_CLIENT_MAX_TIMEOUT seconds
+ML_CLIENT_MIN_TIMEOUT = float(os.getenv("ML_CLIENT_MIN_TIMEOUT", "15"))
+ML_CLIENT_MAX_TIMEOUT = float(os.getenv("ML_CLIENT_MAX_TIMEOUT", "600"))
+ML_CLIENT_CONNECT_TIMEOUT = 3.05
+# Seconds per audio second assumed before any call was timed, above the
+# ml-client's own estimate for Deepgram so it gives up first
+ML_CLIENT_SECONDS_PER_AUDIO_SECOND = 0.5
+ML_CLIENT_RETRY_STATUSES = {502, 503, 504}
+
+# Calls in flight per web-app process, and how long a call waits for a slot
+ML_CLIENT_MAX_IN_FLIGHT = int(os.getenv("ML_CLIENT_MAX_IN_FLIGHT", "8"))
+ML_CLIENT_QUEUE_SECONDS = float(os.getenv("ML_CLIENT_QUEUE_SECONDS", "5"))
+
+
+class MLClientBusy(Exception):
+    """Raised when every ml-client call slot stayed taken for queue_seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"ml-client busy, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def ml_client_retryable(error):
+    """
+    Whether a failed ml-client call is worth retrying: connection errors,
+    timeouts and 502-504 answers are, unless the ml-client asked to wait
+    with Retry-After.
+    """
+    if isinstance(
+        error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    ):
+        return True
+    response = getattr(error, "response", None)
+    return (
+        isinstance(error, requests.exceptions.HTTPError)
+        and response is not None
+        and response.status_code in ML_CLIENT_RETRY_STATUSES
+        and "Retry-After" not in response.headers
+    )
+
+
+class MLClient:
+    """
+    Pooled, bounded client for the ml-client's /get-transcripts API.
+    """
+
+    def __init__(
+        self,
+        url,
+        max_in_flight=ML_CLIENT_MAX_IN_FLIGHT,
+        queue_seconds=ML_CLIENT_QUEUE_SECONDS,
+    ):
+        self.url = url
+        self.queue_seconds = queue_seconds
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.endpoint = Endpoint(
+            "ml-client",
+            AdaptiveTimeout(
+                ML_CLIENT_MIN_TIMEOUT,
+                ML_CLIENT_MAX_TIMEOUT,
+                ML_CLIENT_SECONDS_PER_AUDIO_SECOND,
+            ),
+            ml_client_retryable,
+        )
+        # batches run their files in parallel, so their latency per audio
+        # second is tracked apart from single calls
+        self.batch_endpoint = Endpoint(
+            "ml-client batch",
+            AdaptiveTimeout(
+                ML_CLIENT_MIN_TIMEOUT,
+                ML_CLIENT_MAX_TIMEOUT,
+                ML_CLIENT_SECONDS_PER_AUDIO_SECOND,
+            ),
+            ml_client_retryable,
+        )
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def _post(self, endpoint, url, payload, duration):
+        """
+        POST payload as JSON once a slot is free and return the decoded answer.
+
+        Raises:
+            MLClientBusy: if no slot freed up within queue_seconds
+            CircuitOpenError: if the ml-client's circuit is open
+            requests.exceptions.RequestException: if the call failed
+        """
+
+        def post(timeout):
+            response = self.session.post(
+                url,
+                json=payload,
+                timeout=(min(timeout, ML_CLIENT_CONNECT_TIMEOUT), timeout),
+            )
+            if response.status_code in ML_CLIENT_RETRY_STATUSES:
+                response.raise_for_status()
+            return response
+
+        # pylint: disable-next=consider-using-with
+        if not self._slots.acquire(timeout=self.queue_seconds):
+            raise MLClientBusy(self.queue_seconds)
+        try:
+            return endpoint.call(post, duration).json()
+        finally:
+            self._slots.release()
+
+    def transcribe(self, filepath):
+        """
+        Ask the ml-client to transcribe one uploaded file and store the result.
+
+        Args:
+            filepath (str): the audio path as stored on the entry
+
+        Returns:
+            dict: the ml-client's answer, with the transcript on success
+        """
+        return self._post(
+            self.endpoint,
+            self.url,
+            {"audio_file_path": filepath},
+            audio_duration(filepath),
+        )
+
+    def transcribe_batch(self, filepaths):
+        """
+        Ask the ml-client to transcribe many uploaded files in one request,
+        taking a single call slot.
+
+        Args:
+            filepaths (list): audio paths as stored on the entries
+
+        Returns:
+            dict: the ml-client's answer, with a status per file
+        """
+        duration = sum(audio_duration(filepath) for filepath in filepaths)
+        return self._post(
+            self.batch_endpoint,
+            f"{self.url}/batch",
+            {"audio_file_paths": list(filepaths)},
+            duration,
+        )
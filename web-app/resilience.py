@@ -0,0 +1,262 @@
+"""
+Circuit breakers, adaptive timeouts and retries, shared by the web-app and the
+ml client.
+
+The web-app sends its calls to the ml-client through one Endpoint and the
+ml-client sends its calls to Deepgram through another.
+
+An Endpoint:
+- sizes each call's timeout from the audio duration and the latency per
+  second of audio observed on earlier calls (LATENCY_PERCENTILE, p99), with
+  TIMEOUT_MARGIN to spare, between a minimum and a maximum;
+- retries idempotent calls that failed in a retryable way, with full-jitter
+  exponential backoff, as long as the retry fits in RETRY_BUDGET times the
+  first attempt's timeout;
+- opens its circuit after BREAKER_FAILURES retryable failures in a row.
+  Calls then fail at once with CircuitOpenError, for BREAKER_RESET_SECONDS.
+  After that one trial call is let through: its success closes the circuit
+  and its failure opens it again.
+"""
+
+import math
+import os
+import random
+import threading
+import time
+import wave
+from collections import deque
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("RETRY_BACKOFF_SECONDS", "0.5"))
+RETRY_MAX_BACKOFF_SECONDS = 8.0
+RETRY_BUDGET = float(os.getenv("RETRY_BUDGET", "2"))
+LATENCY_PERCENTILE = float(os.getenv("LATENCY_PERCENTILE", "99"))
+TIMEOUT_MARGIN = 1.5
+# Observed latencies are only trusted once there are this many
+LATENCY_MIN_SAMPLES = 20
+
+# Rough compressed-audio bitrate used to estimate durations of non-WAV files
+NON_WAV_BYTES_PER_SECOND = 16000
+
+
+def audio_duration(audio_file):
+    """
+    Duration of an audio file in seconds: exact for WAV, estimated from the
+    file size otherwise, 0 if the file cannot be read.
+    """
+    try:
+        with wave.open(audio_file, "rb") as wav:
+            return wav.getnframes() / float(wav.getframerate() or 1)
+    except (wave.Error, EOFError):
+        pass
+    except OSError:
+        return 0.0
+    try:
+        return os.path.getsize(audio_file) / NON_WAV_BYTES_PER_SECOND
+    except OSError:
+        return 0.0
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed, open or half open, counting failures in a row.
+    """
+
+    def __init__(
+        self, name, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS
+    ):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        # failures in a row
+        self.failed = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """ "closed", "open" or "half open"."""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half open"
+
+    def retry_after(self):
+        """
+        Seconds until a call can go through, 0 if one can now.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed" or (state == "half open" and not self.trial):
+                return 0.0
+            if state == "half open":
+                # wait for the trial call to settle
+                return min(1.0, self.reset_seconds)
+            return self.reset_seconds - (time.monotonic() - self.opened_at)
+
+    def before_call(self):
+        """
+        Let a call through or raise CircuitOpenError. In the half open state
+        only one trial call is let through.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half open" and not self.trial:
+                self.trial = True
+                return
+        raise CircuitOpenError(self.name, self.retry_after())
+
+    def success(self):
+        """The call worked: close the circuit."""
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"Circuit {self.name} closed")
+            self.failed = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        """The call failed: open the circuit after enough failures in a row."""
+        with self._lock:
+            self.failed += 1
+            if self.trial or self.failed >= self.failures:
+                if self.opened_at is None or self.trial:
+                    print(
+                        f"Circuit {self.name} open for {self.reset_seconds:.0f}s "
+                        f"after {self.failed} failures"
+                    )
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+
+class AdaptiveTimeout:
+    """
+    Timeouts sized by audio duration and the latency observed per audio second.
+    """
+
+    def __init__(self, minimum, maximum, seconds_per_audio_second, window=500):
+        self.minimum = minimum
+        self.maximum = maximum
+        # used until LATENCY_MIN_SAMPLES calls were observed
+        self.seconds_per_audio_second = seconds_per_audio_second
+        self._ratios = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed, duration):
+        """Record how long a successful call for duration seconds of audio took."""
+        with self._lock:
+            self._ratios.append(elapsed / max(duration, 1.0))
+
+    def ratio(self, percentile=LATENCY_PERCENTILE):
+        """
+        The observed latency per second of audio at the given percentile, or
+        the configured estimate while there are too few observations.
+        """
+        with self._lock:
+            ratios = sorted(self._ratios)
+        if len(ratios) < LATENCY_MIN_SAMPLES:
+            return self.seconds_per_audio_second
+        rank = math.ceil(percentile / 100 * len(ratios)) - 1
+        return ratios[min(max(rank, 0), len(ratios) - 1)]
+
+    def timeout(self, duration):
+        """
+        Seconds to allow a call for duration seconds of audio.
+        """
+        needed = self.minimum + TIMEOUT_MARGIN * self.ratio() * max(duration, 1.0)
+        return min(self.maximum, needed)
+
+
+class Endpoint:
+    """
+    A remote call guarded by a circuit breaker, an adaptive timeout and retries.
+    """
+
+    def __init__(self, name, timeouts, retryable, attempts=RETRY_ATTEMPTS):
+        self.name = name
+        self.timeouts = timeouts
+        self.retryable = retryable
+        self.attempts = attempts
+        self.breaker = CircuitBreaker(name)
+
+    def call(self, func, duration=0.0, idempotent=True):
+        """
+        Call func(timeout) through the circuit breaker.
+
+        Exceptions for which retryable(error) is true count as failures of the
+        endpoint and are retried if the call is idempotent. Other exceptions
+        mean the endpoint answered and are raised as they are.
+
+        Args:
+            func (callable): makes the call, given its timeout in seconds
+            duration (float): seconds of audio the call is about
+            idempotent (bool): whether the call may be repeated
+
+        Returns:
+            what func returns
+
+        Raises:
+            CircuitOpenError: if the circuit is open
+        """
+        timeout = self.timeouts.timeout(duration)
+        deadline = time.monotonic() + timeout * RETRY_BUDGET
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            started = time.monotonic()
+            try:
+                result = func(min(timeout, deadline - started))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if not self.retryable(e):
+                    self.breaker.success()
+                    raise
+                self.breaker.failure()
+                backoff = random.uniform(
+                    0,
+                    min(
+                        RETRY_MAX_BACKOFF_SECONDS,
+                        RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1),
+                    ),
+                )
+                remaining = deadline - time.monotonic() - backoff
+                if (
+                    not idempotent
+                    or attempt >= self.attempts
+                    or remaining < self.timeouts.minimum
+                ):
+                    raise
+                print(
+                    f"{self.name} call failed ({e}), retry {attempt} in {backoff:.2f}s"
+                )
+                time.sleep(backoff)
+                continue
+            self.breaker.success()
+            self.timeouts.observe(time.monotonic() - started, duration)
+            return result
+
+    def stats(self):
+        """
+        The circuit state and the timeout currently given to a minute of audio.
+        """
+        return {
+            "endpoint": self.name,
+            "circuit": self.breaker.state,
+            "failures_in_a_row": self.breaker.failed,
+            "seconds_per_audio_second": round(self.timeouts.ratio(), 4),
+            "timeout_per_minute": round(self.timeouts.timeout(60), 2),
+        }
@@ -0,0 +1,145 @@
+"""
+Rendered page cache and entry version stamps for conditional responses.
+
+Every entry has a "version" field: the web-app and the ml client increment
+it whenever they change the entry. Entry pages are cached by (entry id,
+version) and sent with a strong ETag derived from them, so a client that
+already has the current version gets a 304 without the entry being loaded
+or rendered. EntryVersions remembers the versions it looked up for up to
+RESPONSE_VERSION_TTL seconds; within that window even the version check
+skips MongoDB. ResponseCache is an LRU of rendered pages bounded by their
+total size in bytes.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_VERSION_TTL = float(os.getenv("RESPONSE_VERSION_TTL", "2"))
+MAX_VERSIONS = 100_000
+
+
+def make_etag(*parts):
+    """
+    Strong ETag value (unquoted) of the given parts, e.g. entry id and version.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU of rendered response bodies, evicted by total size.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._bodies = OrderedDict()  # key -> (etag, body, stored at)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._bodies)
+
+    def get(self, key, max_age=None):
+        """
+        A cached (etag, body), or None if missing or older than max_age seconds.
+        """
+        with self._lock:
+            cached = self._bodies.get(key)
+            if cached is None:
+                return None
+            if max_age is not None and time.monotonic() - cached[2] > max_age:
+                self._discard(key)
+                return None
+            self._bodies.move_to_end(key)
+            return cached[0], cached[1]
+
+    def put(self, key, etag, body):
+        """
+        Cache a rendered body. Bodies larger than the whole cache are skipped.
+        """
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._bodies[key] = (etag, body, time.monotonic())
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._bodies)))
+
+    def discard(self, key):
+        """
+        Drop one cached body.
+        """
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        cached = self._bodies.pop(key, None)
+        if cached is not None:
+            self.size -= len(cached[1])
+
+    def clear(self):
+        """
+        Drop every cached body.
+        """
+        with self._lock:
+            self._bodies.clear()
+            self.size = 0
+
+
+class EntryVersions:
+    """
+    Recently looked up entry versions.
+    """
+
+    def __init__(self, ttl=RESPONSE_VERSION_TTL, max_entries=MAX_VERSIONS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._versions = OrderedDict()  # entry id -> (version, checked at)
+        self._lock = threading.Lock()
+
+    def get(self, collection, entry_id):
+        """
+        Current version of an entry, from memory if checked recently.
+
+        Returns:
+            int: the version, 0 for entries written before versions existed,
+                None if there is no such entry
+        """
+        now = time.monotonic()
+        with self._lock:
+            known = self._versions.get(entry_id)
+            if known is not None and now - known[1] < self.ttl:
+                return known[0]
+        entry = collection.find_one({"_id": entry_id}, {"version": 1})
+        if entry is None:
+            self.forget(entry_id)
+            return None
+        version = entry.get("version", 0)
+        self.remember(entry_id, version, now)
+        return version
+
+    def remember(self, entry_id, version, checked_at=None):
+        """
+        Record a version read from MongoDB.
+        """
+        with self._lock:
+            self._versions[entry_id] = (version, checked_at or time.monotonic())
+            self._versions.move_to_end(entry_id)
+            while len(self._versions) > self.max_entries:
+                self._versions.popitem(last=False)
+
+    def forget(self, entry_id):
+        """
+        Drop a version, after the entry was changed or deleted.
+        """
+        with self._lock:
+            self._versions.pop(entry_id, None)
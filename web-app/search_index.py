@@ -0,0 +1,431 @@
+"""
+In-process full-text search over transcripts.
+
+TranscriptIndex is an inverted index: every term maps to the documents it
+occurs in and its frequency in each, stored as two parallel array("I")
+postings lists. Queries are ranked with BM25. Each serving process loads
+the index from its snapshot file when it starts, so booting does not
+re-read every transcript, and catches up with MongoDB in a background
+thread (refresh_later()). It then keeps the index current in two ways. The
+web-app updates it on upload, edit and delete. refresh() also re-reads the
+entries whose transcript_updated_at moved, which covers transcripts written
+by the ml client.
+"""
+
+import heapq
+import json
+import math
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from operator import itemgetter
+from markupsafe import Markup, escape
+from pymongo.errors import PyMongoError
+from text_analytics import STOP_WORDS, tokenize, word_frequencies
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Deleted documents are dropped from the postings once they are this share
+# of all indexed documents
+COMPACT_RATIO = 0.25
+
+# Save the snapshot once this many documents changed since the last save
+SNAPSHOT_EVERY = int(os.getenv("SEARCH_SNAPSHOT_EVERY", "1000"))
+
+# Re-read entries updated this long before the last sync, in case the
+# clocks of the services writing transcripts disagree
+SYNC_OVERLAP = timedelta(seconds=60)
+
+SNAPSHOT_MAGIC = b"TIDX1\n"
+_HEADER_SIZE = struct.Struct("<Q")
+
+
+def _to_bytes(values):
+    values = array("I", values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(data):
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def query_terms(query):
+    """
+    The distinct searchable terms of a query, in order.
+    """
+    return [
+        term for term in dict.fromkeys(tokenize(query or "")) if term not in STOP_WORDS
+    ]
+
+
+def snippet(text, terms, width=200):
+    """
+    Cut the part of a transcript around the first query term and highlight
+    every term in it.
+
+    Returns:
+        Markup: escaped text with the terms wrapped in <mark>
+    """
+    if not text:
+        return Markup("")
+    pattern = None
+    start = 0
+    if terms:
+        pattern = re.compile(
+            r"(?<!\w)(" + "|".join(map(re.escape, terms)) + r")(?!\w)", re.IGNORECASE
+        )
+        match = pattern.search(text)
+        if match:
+            start = max(0, match.start() - width // 3)
+            boundary = text.rfind(" ", 0, start)
+            start = 0 if boundary < 0 else boundary + 1
+    end = min(len(text), start + width)
+    boundary = text.find(" ", end)
+    end = len(text) if boundary < 0 else boundary
+    window = text[start:end]
+
+    parts = [escape("… ")] if start > 0 else []
+    last = 0
+    for match in pattern.finditer(window) if pattern else ():
+        parts.append(escape(window[last : match.start()]))
+        parts.append(Markup("<mark>%s</mark>") % match.group(0))
+        last = match.end()
+    parts.append(escape(window[last:]))
+    if end < len(text):
+        parts.append(escape(" …"))
+    return Markup("").join(parts)
+
+
+class TranscriptIndex:  # pylint: disable=too-many-instance-attributes
+    """
+    Inverted index of entry transcripts with BM25 ranking.
+
+    Documents are numbered in the order they are added. Removing or
+    re-indexing an entry only marks its old number dead; dead numbers are
+    skipped by queries, left out of document frequencies and dropped from
+    the postings by compact().
+    """
+
+    def __init__(self, snapshot_path=None):
+        self.snapshot_path = snapshot_path
+        self._lock = threading.RLock()
+        self._opened = False
+        self._checked = 0.0
+        self._syncing = False
+        self._unsaved = 0
+        self.ids = []  # document number -> entry id
+        self.docnos = {}  # entry id -> live document number
+        self.lengths = array("I")  # document number -> indexed terms
+        self.postings = {}  # term -> (array of document numbers, array of tfs)
+        self.dead = set()
+        self.total_length = 0
+        self.synced_at = None
+
+    def __len__(self):
+        return len(self.docnos)
+
+    def add(self, entry_id, transcript):
+        """
+        Index an entry's transcript, replacing what was indexed for it.
+        """
+        counts = word_frequencies(transcript or "")
+        for word in STOP_WORDS.intersection(counts):
+            del counts[word]
+        with self._lock:
+            self._remove(entry_id)
+            docno = len(self.ids)
+            length = sum(counts.values())
+            self.ids.append(entry_id)
+            self.docnos[entry_id] = docno
+            self.lengths.append(length)
+            self.total_length += length
+            for term, count in counts.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = (array("I"), array("I"))
+                postings[0].append(docno)
+                postings[1].append(count)
+            self._unsaved += 1
+
+    def remove(self, entry_id):
+        """
+        Drop an entry from the results.
+        """
+        with self._lock:
+            if self._remove(entry_id):
+                self._unsaved += 1
+            if len(self.dead) > max(64, COMPACT_RATIO * len(self.ids)):
+                self.compact()
+
+    def _remove(self, entry_id):
+        docno = self.docnos.pop(entry_id, None)
+        if docno is None:
+            return False
+        self.dead.add(docno)
+        self.total_length -= self.lengths[docno]
+        return True
+
+    def compact(self):
+        """
+        Renumber the live documents and drop dead ones from every postings list.
+        """
+        with self._lock:
+            if not self.dead:
+                return
+            renumber = {}
+            ids = []
+            lengths = array("I")
+            for docno, entry_id in enumerate(self.ids):
+                if docno not in self.dead:
+                    renumber[docno] = len(ids)
+                    ids.append(entry_id)
+                    lengths.append(self.lengths[docno])
+            postings = {}
+            for term, (docnos, counts) in self.postings.items():
+                kept = [
+                    (renumber[docno], count)
+                    for docno, count in zip(docnos, counts)
+                    if docno in renumber
+                ]
+                if kept:
+                    postings[term] = (
+                        array("I", map(itemgetter(0), kept)),
+                        array("I", map(itemgetter(1), kept)),
+                    )
+            self.ids = ids
+            self.docnos = {entry_id: docno for docno, entry_id in enumerate(ids)}
+            self.lengths = lengths
+            self.postings = postings
+            self.dead = set()
+
+    def search(self, query, limit=10):
+        """
+        Rank the indexed transcripts against a query with BM25.
+
+        Returns:
+            list: (entry id, score) pairs, best first
+        """
+        terms = query_terms(query)
+        with self._lock:
+            live = len(self.docnos)
+            if not live or not terms:
+                return []
+            scores = {}
+            single = None
+            for term in terms:
+                contributions = self._term_scores(term, live)
+                if len(terms) == 1:
+                    # nothing to add up, rank the postings directly
+                    single = contributions
+                    continue
+                get = scores.get
+                for docno, score in contributions:
+                    scores[docno] = get(docno, 0.0) + score
+            candidates = scores.items() if single is None else single
+            best = heapq.nlargest(limit, candidates, key=itemgetter(1))
+            return [(self.ids[docno], score) for docno, score in best]
+
+    def _term_scores(self, term, live):
+        """BM25 score of one term in every document it occurs in."""
+        postings = self.postings.get(term)
+        if not postings:
+            return []
+        docnos, counts = postings
+        if self.dead:
+            dead = self.dead
+            live_postings = [
+                (docno, count)
+                for docno, count in zip(docnos, counts)
+                if docno not in dead
+            ]
+            if not live_postings:
+                return []
+            docnos, counts = zip(*live_postings)
+        frequency = len(docnos)
+        weight = (K1 + 1) * math.log(1 + (live - frequency + 0.5) / (frequency + 0.5))
+        # length normalization K1 * (1 - B + B * length / average length)
+        base = K1 * (1 - B)
+        per_length = K1 * B * live / max(self.total_length, 1)
+        lengths = [self.lengths[docno] for docno in docnos]
+        return zip(
+            docnos,
+            [
+                weight * count / (count + base + per_length * length)
+                for count, length in zip(counts, lengths)
+            ],
+        )
+
+    def sync(self, collection):
+        """
+        Index every entry whose transcript changed since the last sync, or
+        every entry if the index was never synced.
+
+        Entries are read without holding the index lock, so searches keep
+        being answered from the current index meanwhile.
+
+        Returns:
+            int: number of entries indexed
+        """
+        started = datetime.now(timezone.utc)
+        query = {}
+        with self._lock:
+            if self.synced_at is not None:
+                query = {
+                    "transcript_updated_at": {"$gte": self.synced_at - SYNC_OVERLAP}
+                }
+        indexed = 0
+        for entry in collection.find(query, {"transcript": 1}):
+            self.add(entry["_id"], entry.get("transcript"))
+            indexed += 1
+        with self._lock:
+            self.synced_at = started
+        return indexed
+
+    def open(self):
+        """
+        Load the snapshot, once per process.
+        """
+        with self._lock:
+            if not self._opened:
+                self._opened = True
+                self.load()
+
+    def refresh(self, collection, max_age=0):
+        """
+        Make the index current: load the snapshot on first use, then sync
+        with MongoDB if the last sync is older than max_age seconds. While
+        another thread syncs, the index is used as it is. The snapshot is
+        saved once enough documents changed.
+        """
+        self.open()
+        with self._lock:
+            if self._syncing or (
+                self.synced_at is not None
+                and time.monotonic() - self._checked < max_age
+            ):
+                return
+            self._syncing = True
+        try:
+            self.sync(collection)
+            self._checked = time.monotonic()
+            if self._unsaved >= SNAPSHOT_EVERY:
+                self.save()
+        finally:
+            self._syncing = False
+
+    def refresh_later(self, collection):
+        """
+        Refresh the index in a background thread, so a starting process
+        serves from its snapshot meanwhile.
+
+        Returns:
+            threading.Thread: the started thread
+        """
+
+        def run():
+            try:
+                self.refresh(collection)
+            except PyMongoError as e:
+                print(f"Search index not synced, syncing on next search: {e}")
+
+        thread = threading.Thread(target=run, name="search-index-sync", daemon=True)
+        thread.start()
+        return thread
+
+    def save(self):
+        """
+        Write the index to the snapshot file, atomically. An index that was
+        never synced has nothing worth saving.
+        """
+        if not self.snapshot_path or self.synced_at is None:
+            return
+        with self._lock:
+            self.compact()
+            terms = list(self.postings)
+            header = json.dumps(
+                {
+                    "ids": self.ids,
+                    "terms": terms,
+                    "sizes": [len(self.postings[term][0]) for term in terms],
+                    "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+                }
+            ).encode("utf-8")
+            folder = os.path.dirname(self.snapshot_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            # every serving process saves its own index
+            partial = f"{self.snapshot_path}.{os.getpid()}.part"
+            with open(partial, "wb") as file:
+                file.write(SNAPSHOT_MAGIC)
+                file.write(_HEADER_SIZE.pack(len(header)))
+                file.write(header)
+                file.write(_to_bytes(self.lengths))
+                for term in terms:
+                    file.write(_to_bytes(self.postings[term][0]))
+                for term in terms:
+                    file.write(_to_bytes(self.postings[term][1]))
+            os.replace(partial, self.snapshot_path)
+            self._unsaved = 0
+
+    def load(self):
+        """
+        Replace the index with the snapshot file's, if there is a valid one.
+
+        Returns:
+            bool: True if the snapshot was loaded
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, "rb") as file:
+                data = file.read()
+            if not data.startswith(SNAPSHOT_MAGIC):
+                raise ValueError("not a search index snapshot")
+            offset = len(SNAPSHOT_MAGIC)
+            (header_size,) = _HEADER_SIZE.unpack_from(data, offset)
+            offset += _HEADER_SIZE.size
+            header = json.loads(data[offset : offset + header_size])
+            offset += header_size
+            ids = header["ids"]
+            lengths = _from_bytes(data[offset : offset + 4 * len(ids)])
+            offset += 4 * len(ids)
+            total = sum(header["sizes"])
+            docnos = _from_bytes(data[offset : offset + 4 * total])
+            counts = _from_bytes(data[offset + 4 * total : offset + 8 * total])
+            if len(lengths) != len(ids) or len(counts) != total:
+                raise ValueError("truncated search index snapshot")
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            print(f"Ignoring search index snapshot: {e}")
+            return False
+
+        with self._lock:
+            self.dead = set()
+            self.postings = {}
+            self.ids = ids
+            self.docnos = {entry_id: docno for docno, entry_id in enumerate(ids)}
+            self.lengths = lengths
+            self.total_length = sum(lengths)
+            start = 0
+            for term, size in zip(header["terms"], header["sizes"]):
+                self.postings[term] = (
+                    docnos[start : start + size],
+                    counts[start : start + size],
+                )
+                start += size
+            if header["synced_at"]:
+                self.synced_at = datetime.fromisoformat(header["synced_at"])
+            self._unsaved = 0
+        return True
@@ -0,0 +1,105 @@
+"""
+Transcript search routes: the /search page and /api/search, answered from
+the in-process index (search_index.py).
+"""
+
+from flask import Blueprint, jsonify, render_template, request, url_for
+from pymongo.errors import PyMongoError
+from search_index import query_terms, snippet
+from entries import (
+    MAX_PAGE_SIZE,
+    PAGE_SIZE,
+    SEARCH_SYNC_SECONDS,
+    collection,
+    transcript_index,
+)
+
+blueprint = Blueprint("search", __name__)
+
+
+@blueprint.route("/search")
+def search_page():
+    """
+    Renders transcript search results, BM25-ranked, with highlighted snippets.
+    """
+    query = request.args.get("q", "").strip()
+    try:
+        results = search_transcripts(query) if query else []
+    except PyMongoError as e:
+        print("Search error:", e)
+        return "Database error", 500
+    return render_template("search.html", query=query, results=results)
+
+
+@blueprint.route("/api/search")
+def api_search():
+    """
+    JSON transcript search.
+
+    Query args:
+        q: the search text
+        limit: number of results, at most MAX_PAGE_SIZE
+
+    Returns:
+        json: results with id, title, speaker, date, score and snippet (HTML)
+    """
+    try:
+        limit = min(max(int(request.args.get("limit", PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"message": "Invalid limit"}), 400
+    try:
+        results = search_transcripts(request.args.get("q", ""), limit)
+    except PyMongoError as e:
+        print("Search error:", e)
+        return jsonify({"message": "Database error"}), 500
+    for result in results:
+        result["snippet"] = str(result["snippet"])
+        result["url"] = url_for("view_entry", file_path=result["id"])
+    return jsonify({"results": results})
+
+
+def search_transcripts(query, limit=PAGE_SIZE):
+    """
+    Searches inside transcripts with the in-process index, then loads the
+    matching entries for their metadata and snippets.
+
+    Returns:
+        list: dicts of id, title, speaker, date, score and snippet, best first
+    """
+    transcript_index.refresh(collection, SEARCH_SYNC_SECONDS)
+    hits = transcript_index.search(query, limit)
+    entries = {}
+    while True:
+        wanted = [entry_id for entry_id, _ in hits if entry_id not in entries]
+        if not wanted:
+            break
+        found = {
+            entry["_id"]: entry
+            for entry in collection.find(
+                {"_id": {"$in": wanted}},
+                {"title": 1, "speaker": 1, "date": 1, "transcript": 1},
+            )
+        }
+        entries.update(found)
+        deleted = [entry_id for entry_id in wanted if entry_id not in found]
+        if not deleted:
+            break
+        # deleted by another process: drop them and fill the page again
+        for entry_id in deleted:
+            transcript_index.remove(entry_id)
+        hits = transcript_index.search(query, limit)
+    terms = query_terms(query)
+    results = []
+    for entry_id, score in hits:
+        entry = entries[entry_id]
+        results.append(
+            {
+                "id": entry_id,
+                "title": entry.get("title"),
+                "speaker": entry.get("speaker"),
+                "date": entry.get("date"),
+                "score": round(score, 4),
+                "snippet": snippet(entry.get("transcript") or "", terms),
+            }
+        )
+    return results
@@ -0,0 +1,83 @@
+"""
+Content-addressed storage for uploaded audio.
+
+Files are hashed while they are written to disk and stored under their
+SHA-256 digest, so uploading the same recording twice keeps a single copy.
+"""
+
+import hashlib
+import os
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+def blob_path(folder, digest, extension=""):
+    """
+    Build the storage path for a blob.
+
+    Args:
+        folder (str): the upload folder
+        digest (str): hex SHA-256 of the content
+        extension (str): file extension including the dot, e.g. ".mp3"
+
+    Returns:
+        str: the path of the blob inside the folder
+    """
+    return os.path.join(folder, f"{digest}{extension.lower()}")
+
+
+def store_blob(tmp_path, folder, digest, filename=""):
+    """
+    Move a fully written file into place under its digest.
+
+    Args:
+        tmp_path (str): the written file, on the same filesystem as folder
+        folder (str): the upload folder
+        digest (str): hex SHA-256 of the file's content
+        filename (str): the original file name, used for the extension
+
+    Returns:
+        tuple: (path of the blob, True if the blob already existed)
+    """
+    path = blob_path(folder, digest, os.path.splitext(filename)[1])
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        return path, True
+    os.replace(tmp_path, path)
+    return path, False
+
+
+def save_blob(stream, folder, filename=""):
+    """
+    Stream an upload to disk, hashing it on the way, and store it under its digest.
+
+    The data is written to a temporary file in the same folder and renamed into
+    place, so readers never see a partially written blob. If a blob with the same
+    digest already exists the temporary copy is dropped.
+
+    Args:
+        stream: a binary file-like object (e.g. FileStorage.stream)
+        folder (str): the upload folder
+        filename (str): the original file name, used for the extension
+
+    Returns:
+        tuple: (path of the blob, hex digest, True if the blob already existed)
+    """
+    sha256 = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                out.write(chunk)
+        digest = sha256.hexdigest()
+        path, existed = store_blob(tmp_path, folder, digest, filename)
+        return path, digest, existed
+    except (OSError, IOError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
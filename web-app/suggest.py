@@ -0,0 +1,192 @@
+"""
+In-memory typeahead over the distinct speakers and titles.
+
+SuggestIndex keeps, for each field, a sorted array of lowercase keys: one
+per word start of every distinct value, so "smi" finds "John Smith". A
+prefix lookup is a bisect into that array, so suggestions never touch
+MongoDB. The index is loaded with one aggregation on first use, kept
+current by the web-app's writes, reloaded every SUGGEST_RELOAD_SECONDS to
+pick up other processes' writes, and capped at SUGGEST_MAX_VALUES distinct
+values per field. A full field evicts its least used tenth at once.
+"""
+
+import heapq
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+
+SUGGEST_FIELDS = ("speaker", "title")
+SUGGEST_MAX_VALUES = int(os.getenv("SUGGEST_MAX_VALUES", "50000"))
+SUGGEST_RELOAD_SECONDS = float(os.getenv("SUGGEST_RELOAD_SECONDS", "300"))
+# Share of a full field's values evicted at once, least used first
+SUGGEST_EVICT_FRACTION = 0.1
+
+# Longer values are cut, and only the first words of a value are keys
+MAX_VALUE_LENGTH = 200
+MAX_KEY_WORDS = 8
+
+
+def _keys(value):
+    """Lowercase keys of a value: the value from each of its first words on."""
+    lowered = value.lower()
+    keys = [lowered]
+    position = 0
+    for _ in range(MAX_KEY_WORDS - 1):
+        position = lowered.find(" ", position)
+        if position < 0:
+            break
+        position += 1
+        if position < len(lowered) and lowered[position] != " ":
+            keys.append(lowered[position:])
+    return keys
+
+
+class _FieldIndex:
+    """
+    Sorted prefix array and reference counts of one field's distinct values.
+    """
+
+    def __init__(self, max_values):
+        self.max_values = max_values
+        self.values = {}  # lowercase value -> [display value, entries using it]
+        self.keys = []  # sorted (key, lowercase value)
+
+    def add(self, value, count=1):
+        """Count count more entries using value."""
+        value = (value or "").strip()[:MAX_VALUE_LENGTH]
+        if not value:
+            return
+        lowered = value.lower()
+        if lowered in self.values:
+            self.values[lowered][1] += count
+            return
+        if len(self.values) >= self.max_values:
+            self._evict()
+        self.values[lowered] = [value, count]
+        for key in _keys(value):
+            insort(self.keys, (key, lowered))
+
+    def remove(self, value):
+        """Count one entry fewer using value, dropping it at zero."""
+        lowered = (value or "").strip()[:MAX_VALUE_LENGTH].lower()
+        if lowered not in self.values:
+            return
+        self.values[lowered][1] -= 1
+        if self.values[lowered][1] <= 0:
+            self._drop(lowered)
+
+    def _drop(self, lowered):
+        del self.values[lowered]
+        for key in _keys(lowered):
+            position = bisect_left(self.keys, (key, lowered))
+            if position < len(self.keys) and self.keys[position] == (key, lowered):
+                del self.keys[position]
+
+    def _evict(self):
+        """
+        Make room by dropping the least used SUGGEST_EVICT_FRACTION of the
+        values, in one pass over the counts and the keys, so a full field
+        is not scanned again on every new value.
+        """
+        evict = max(1, int(len(self.values) * SUGGEST_EVICT_FRACTION))
+        dropped = set(
+            heapq.nsmallest(
+                evict, self.values, key=lambda lowered: self.values[lowered][1]
+            )
+        )
+        for lowered in dropped:
+            del self.values[lowered]
+        self.keys = [key for key in self.keys if key[1] not in dropped]
+
+    def suggest(self, prefix, limit):
+        """
+        Values with a word starting with prefix, in alphabetical order of
+        the matching key.
+        """
+        prefix = prefix.lower()
+        found = {}
+        position = bisect_left(self.keys, (prefix,))
+        while position < len(self.keys) and len(found) < limit:
+            key, lowered = self.keys[position]
+            if not key.startswith(prefix):
+                break
+            found.setdefault(lowered, self.values[lowered][0])
+            position += 1
+        return list(found.values())
+
+
+class SuggestIndex:
+    """
+    Typeahead index over the distinct values of SUGGEST_FIELDS.
+    """
+
+    def __init__(
+        self,
+        fields=SUGGEST_FIELDS,
+        max_values=SUGGEST_MAX_VALUES,
+        reload_seconds=SUGGEST_RELOAD_SECONDS,
+    ):
+        self.fields = fields
+        self.max_values = max_values
+        self.reload_seconds = reload_seconds
+        self._indexes = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, collection):
+        """
+        Rebuild the index from the distinct values in MongoDB, most used first.
+        """
+        indexes = {}
+        for field in self.fields:
+            indexes[field] = _FieldIndex(self.max_values)
+            pipeline = [
+                {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+                {"$limit": self.max_values},
+            ]
+            for group in collection.aggregate(pipeline):
+                if isinstance(group["_id"], str):
+                    indexes[field].add(group["_id"], group["count"])
+        with self._lock:
+            self._indexes = indexes
+            self._loaded_at = time.monotonic()
+
+    def suggest(self, collection, prefix, field=None, limit=8):
+        """
+        Suggest values starting with prefix, loading the index if needed.
+
+        Returns:
+            dict: field -> list of values
+        """
+        if (
+            self._indexes is None
+            or time.monotonic() - self._loaded_at > self.reload_seconds
+        ):
+            self.load(collection)
+        fields = [field] if field else self.fields
+        with self._lock:
+            return {
+                name: self._indexes[name].suggest(prefix, limit)
+                for name in fields
+                if name in self._indexes
+            }
+
+    def record(self, old=None, new=None):
+        """
+        Apply a write to the index: old and new are the entry's values before
+        and after, None for an insert or a delete. Ignored until loaded.
+        """
+        with self._lock:
+            if self._indexes is None:
+                return
+            for field, index in self._indexes.items():
+                before = (old or {}).get(field)
+                after = (new or {}).get(field)
+                if old is not None and new is not None and before == after:
+                    continue
+                if old is not None:
+                    index.remove(before)
+                if new is not None:
+                    index.add(after)
@@ -0,0 +1,41 @@
+"""
+Typeahead route: /api/suggest, answered from the in-process index (suggest.py).
+"""
+
+from flask import Blueprint, jsonify, request
+from pymongo.errors import PyMongoError
+from suggest import SUGGEST_FIELDS
+from entries import collection, suggest_index
+
+blueprint = Blueprint("suggest", __name__)
+
+
+@blueprint.route("/api/suggest")
+def api_suggest():
+    """
+    As-you-type suggestions of speakers and titles, from memory.
+
+    Query args:
+        q: what was typed so far
+        field: "speaker" or "title", both if omitted
+        limit: suggestions per field, at most 20
+
+    Returns:
+        json: field -> values starting with q (at a word start)
+    """
+    prefix = request.args.get("q", "").strip()
+    field = request.args.get("field") or None
+    if field is not None and field not in SUGGEST_FIELDS:
+        return jsonify({"message": "Invalid field"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", 8)), 1), 20)
+    except ValueError:
+        return jsonify({"message": "Invalid limit"}), 400
+    if not prefix:
+        return jsonify({name: [] for name in ([field] if field else SUGGEST_FIELDS)})
+    try:
+        suggestions = suggest_index.suggest(collection, prefix, field, limit)
+    except PyMongoError as e:
+        print("Suggestion error:", e)
+        return jsonify({"message": "Database error"}), 500
+    return jsonify(suggestions)
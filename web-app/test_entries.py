@@ -0,0 +1,330 @@
+"""Test the entry queries and writes"""
+
+from datetime import datetime, timezone
+from unittest.mock import patch, MagicMock
+import pytest
+from pymongo.errors import PyMongoError
+from entries import (
+    backfill_search_fields,
+    decode_cursor,
+    delete_entry,
+    edit_word_stats,
+    encode_cursor,
+    entry_filter,
+    keyword_query,
+    list_entries,
+    migrate_dates,
+    parse_date,
+    search_entry,
+    update_entry,
+    upload_entry,
+)
+from text_analytics import TOP_K, summarize, text_digest, word_frequencies
+
+
+def make_entries(count):
+    """Build listing documents, newest first"""
+    return [
+        {
+            "_id": f"static/uploaded_audio/{i:03d}.mp3",
+            "title": f"Entry {i}",
+            "speaker": "Speaker",
+            "date": "2025-04-01",
+            "created_at": datetime(2025, 4, 1, 12, 0, i),
+        }
+        for i in range(count, 0, -1)
+    ]
+
+
+def test_cursor_round_trip():
+    """Page cursors encode the (created_at, _id) keyset position"""
+    entry = make_entries(1)[0]
+    created_at, entry_id = decode_cursor(encode_cursor(entry))
+    assert created_at == entry["created_at"].replace(tzinfo=timezone.utc)
+    assert entry_id == entry["_id"]
+
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+@patch("entries.collection.find")
+def test_list_entries_keyset_pagination(mock_find):
+    """list_entries projects the listed fields and seeks past the cursor"""
+    mock_find.return_value.sort.return_value.limit.return_value = make_entries(3)
+    entries, next_cursor = list_entries(limit=2)
+    assert len(entries) == 2
+    assert next_cursor == encode_cursor(entries[-1])
+
+    query, projection = mock_find.call_args[0]
+    assert query == {}
+    assert "transcript" not in projection and "top_words" not in projection
+    mock_find.return_value.sort.return_value.limit.assert_called_with(3)
+
+    mock_find.return_value.sort.return_value.limit.return_value = make_entries(1)
+    entries, last_cursor = list_entries({"title": "x"}, next_cursor, 2)
+    assert last_cursor is None
+    query = mock_find.call_args[0][0]
+    created_at, entry_id = decode_cursor(next_cursor)
+    assert query["$and"][0] == {"title": "x"}
+    assert query["$and"][1]["$or"] == [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": entry_id}},
+    ]
+
+
+def test_parse_date():
+    """Free-text dates become midnight UTC, anything else None"""
+    expected = datetime(2025, 4, 1, tzinfo=timezone.utc)
+    assert parse_date("2025-04-01") == expected
+    assert parse_date(" April 1, 2025 ") == expected
+    assert parse_date("04/01/2025") == expected
+    assert parse_date("N/A") is None
+    assert parse_date(None) is None
+
+
+def test_entry_filter_speaker_and_date_range():
+    """Date ranges filter and order on recorded_on, speakers match exactly"""
+    assert entry_filter() == ({}, "created_at")
+    assert entry_filter(speaker="Ann") == ({"speaker_lc": "ann"}, "created_at")
+    query, order = entry_filter(speaker="Ann", date_from="2025-01-01")
+    assert order == "recorded_on"
+    assert query == {
+        "$and": [
+            {"speaker_lc": "ann"},
+            {"recorded_on": {"$gte": datetime(2025, 1, 1, tzinfo=timezone.utc)}},
+        ]
+    }
+    query, _ = entry_filter("sync", date_to="2025-03-31")
+    assert query["$and"][0] == keyword_query("sync")
+    with pytest.raises(ValueError):
+        entry_filter(date_from="last quarter")
+
+
+@patch("entries.collection.find")
+def test_list_entries_by_recording_date(mock_find):
+    """Date range pages are sorted and keyed on recorded_on"""
+    entries = make_entries(3)
+    for entry in entries:
+        entry["recorded_on"] = entry["created_at"]
+    mock_find.return_value.sort.return_value.limit.return_value = entries
+    _, next_cursor = list_entries(limit=2, order="recorded_on")
+    mock_find.return_value.sort.assert_called_with([("recorded_on", -1), ("_id", -1)])
+    list_entries({}, next_cursor, 2, "recorded_on")
+    recorded_on, entry_id = decode_cursor(next_cursor)
+    assert mock_find.call_args[0][0]["$or"] == [
+        {"recorded_on": {"$lt": recorded_on}},
+        {"recorded_on": recorded_on, "_id": {"$lt": entry_id}},
+    ]
+
+
+@patch("entries.collection.update_many")
+def test_backfill_search_fields(mock_update_many):
+    """Older entries get their lowercase search fields in one update"""
+    mock_update_many.return_value = MagicMock(modified_count=3)
+    assert backfill_search_fields() == 3
+    query, pipeline = mock_update_many.call_args[0]
+    assert query == {"title_lc": {"$exists": False}}
+    assert pipeline[0]["$set"]["title_lc"] == {"$toLower": {"$toString": "$title"}}
+
+
+@patch("entries.collection.bulk_write")
+@patch("entries.collection.find")
+def test_migrate_dates(mock_find, mock_bulk_write):
+    """Older entries get recorded_on parsed from their date"""
+    mock_find.return_value = [
+        {"_id": "a.mp3", "date": "2025-04-01"},
+        {"_id": "b.mp3", "date": "soon"},
+        {"_id": "c.mp3"},
+    ]
+    mock_bulk_write.return_value = MagicMock(modified_count=2)
+    assert migrate_dates(batch_size=2) == 4
+    assert mock_find.call_args[0][0] == {"recorded_on": {"$exists": False}}
+    first, second = mock_bulk_write.call_args_list[0][0][0]
+    # pylint: disable=protected-access
+    assert first._doc == {
+        "$set": {"recorded_on": datetime(2025, 4, 1, tzinfo=timezone.utc)}
+    }
+    assert second._doc == {"$set": {"recorded_on": None}}
+
+
+@patch("entries.corpus_collection")
+@patch("entries.collection.insert_one")
+def test_upload_entry_bounds_top_words(mock_insert, mock_corpus):
+    """Only the top words and a fixed-size sketch are stored"""
+    mock_insert.return_value = MagicMock(acknowledged=True)
+    transcript = " ".join(f"word{i}" for i in range(2000))
+    assert upload_entry("test/audio.mp3", {"transcript": transcript})
+    entry = mock_insert.call_args[0][0]
+    assert len(entry["top_words"]) == TOP_K
+    assert len(entry["word_sketch"]) < 5000
+    assert entry["word_count"] == 2000
+    # every word is added to the corpus counts, overall and for the speaker
+    assert len(mock_corpus.bulk_write.call_args[0][0]) == 4000
+
+
+@patch("entries.collection.insert_one")
+def test_upload_entry(mock_insert):
+    """Test the upload_entry function."""
+    # Successful upload
+    mock_insert.return_value = MagicMock(acknowledged=True)
+    assert upload_entry("test/audio.mp3", {"title": "Test"})
+
+    # Upload with default values
+    assert upload_entry("test/audio.mp3")
+
+    # Upload failure (DB error)
+    mock_insert.side_effect = PyMongoError()
+    assert not upload_entry("test/audio.mp3")
+
+    # No file path provided
+    assert not upload_entry("")
+
+
+def test_keyword_query_is_index_backed():
+    """Keyword searches are anchored prefix matches on shadow fields plus $text"""
+    assert not keyword_query("")
+
+    query = keyword_query("Dr. Smith (.*")
+    prefix = {"$regex": "^dr\\.\\ smith\\ \\(\\.\\*"}
+    assert {"title_lc": prefix} in query["$or"]
+    assert {"speaker_lc": prefix} in query["$or"]
+    assert {"date_lc": prefix} in query["$or"]
+    assert {"$text": {"$search": "Dr Smith"}} in query["$or"]
+    # user input never becomes an unanchored or case-insensitive regex
+    for clause in query["$or"]:
+        for condition in clause.values():
+            assert "$options" not in condition
+
+
+@patch("entries.collection.insert_one")
+def test_upload_entry_stores_search_fields(mock_insert):
+    """New entries carry lowercase shadow copies of the searchable fields"""
+    mock_insert.return_value = MagicMock(acknowledged=True)
+    upload_entry("test/audio.mp3", {"title": "Weekly Sync", "speaker": "Ana"})
+    entry = mock_insert.call_args[0][0]
+    assert entry["title_lc"] == "weekly sync"
+    assert entry["speaker_lc"] == "ana"
+    assert entry["date_lc"] == "n/a"
+    assert entry["recorded_on"] is None
+
+    upload_entry("test/audio.mp3", {"date": "2025-04-01"})
+    entry = mock_insert.call_args[0][0]
+    assert entry["recorded_on"] == datetime(2025, 4, 1, tzinfo=timezone.utc)
+
+
+@patch("entries.collection.find_one_and_delete")
+@patch("entries.word_counts_collection")
+@patch("entries.record_change")
+def test_delete_entry(mock_record, mock_word_counts, mock_delete):
+    """Test the delete_entry function."""
+    # Successful deletion
+    mock_delete.return_value = {
+        "_id": "test/audio.mp3",
+        "transcript": "river river stone",
+        "speaker": "Ann",
+    }
+    mock_word_counts.find_one.return_value = None
+    assert delete_entry("test/audio.mp3")
+    mock_word_counts.delete_one.assert_called_once_with({"_id": "test/audio.mp3"})
+    # the entry's words are taken out of the corpus counts
+    _, old_counts, new_counts, speaker, _ = mock_record.call_args[0]
+    assert old_counts == {"river": 2, "stone": 1}
+    assert not new_counts and speaker == "Ann"
+
+    # Deletion failed (no such file)
+    mock_delete.return_value = None
+    assert not delete_entry("nonexistent.mp3")
+
+    # No file path or error
+    mock_delete.side_effect = PyMongoError()
+    assert not delete_entry("")
+    assert not delete_entry("test/audio.mp3")
+
+
+@patch("entries.word_counts_collection.replace_one")
+@patch("entries.word_counts_collection.find_one")
+def test_edit_word_stats_incremental(mock_find_counts, mock_replace):
+    """Edits update stored word counts, or fall back to a full recompute"""
+    old = "river stone river tree " * 50
+    new = old.replace("tree", "river", 1)
+    entry = {"_id": "test/audio.mp3", "transcript": old}
+    mock_find_counts.return_value = {
+        "counts": dict(word_frequencies(old)),
+        "transcript_sha256": text_digest(old),
+    }
+    with patch("entries.word_frequencies", wraps=word_frequencies) as mock_full:
+        old_counts, stats = edit_word_stats(entry, new)
+        # only the edited word is re-counted
+        assert all(len(call[0][0]) < 20 for call in mock_full.call_args_list)
+    assert old_counts == word_frequencies(old)
+    assert stats == summarize(word_frequencies(new), new, "edit")
+    saved = mock_replace.call_args[0][1]
+    assert saved["counts"] == dict(word_frequencies(new))
+    assert saved["transcript_sha256"] == text_digest(new)
+
+    # stored counts of another transcript version are ignored
+    mock_find_counts.return_value["transcript_sha256"] = text_digest("stale")
+    assert edit_word_stats(entry, new)[1] == summarize(
+        word_frequencies(new), new, "edit"
+    )
+
+    mock_find_counts.side_effect = PyMongoError()
+    mock_replace.side_effect = PyMongoError()
+    assert edit_word_stats(entry, "")[1] == summarize(word_frequencies(""), "", "edit")
+
+
+@patch("entries.collection.find")
+def test_search_entry(mock_find):
+    """Test the search_entry function."""
+    # Successful search with one match
+    mock_find.return_value = [
+        {"_id": "test/audio.mp3", "title": "Test", "speaker": "John"}
+    ]
+    assert search_entry(file_path="test")
+
+    # No results found
+    mock_find.return_value = []
+    assert not search_entry(file_path="missing")
+
+    # Search with multiple fields
+    mock_find.return_value = [
+        {"_id": "test/audio.mp3", "title": "Test", "speaker": "John"}
+    ]
+    assert search_entry(file_path="test", title="Test", speaker="John")
+
+    # Error during search
+    mock_find.side_effect = PyMongoError()
+    assert not search_entry(file_path="error")
+
+
+@patch("entries.collection.update_one")
+def test_update_entry(mock_update):
+    """Test the update_entry function."""
+    # Successful update
+    mock_update.return_value = MagicMock(modified_count=1)
+    assert update_entry("test/audio.mp3", {"title": "Updated"})
+
+    # Update failed (no changes made) - same values
+    mock_update.return_value = MagicMock(modified_count=0)
+    assert not update_entry("test/audio.mp3", {"title": "No change"})
+
+    # Update failed (no matching document)
+    mock_update.return_value = MagicMock(modified_count=0)
+    assert not update_entry("nonexistent.mp3", {"title": "New Title"})
+
+    # Update failed (empty update fields)
+    mock_update.return_value = MagicMock(modified_count=0)
+    assert not update_entry("test/audio.mp3", {})
+
+    # Update failed (non-existent fields)
+    mock_update.return_value = MagicMock(modified_count=0)
+    assert not update_entry("test/audio.mp3", {"nonexistent_field": "value"})
+
+    # Shadow search fields follow the edited values
+    mock_update.return_value = MagicMock(modified_count=1)
+    update_entry("test/audio.mp3", {"title": "New Title"})
+    assert mock_update.call_args[0][1]["$set"]["title_lc"] == "new title"
+
+    # Update error
+    mock_update.side_effect = PyMongoError()
+    assert not update_entry("test/audio.mp3", {"title": "Error"})
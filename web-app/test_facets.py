@@ -0,0 +1,66 @@
+"""Test the cached facet counts"""
+
+from unittest.mock import MagicMock
+from facets import FacetCache, compute_facets, length_label, month_range
+
+
+def make_collection():
+    """A collection whose facet aggregation returns one result"""
+    collection = MagicMock()
+    collection.aggregate.side_effect = lambda pipeline: [
+        {
+            "speaker": [{"_id": "Ann", "count": 3}],
+            "month": [{"_id": "2025-02", "count": 2}],
+            "length": [{"_id": 0, "count": 1}, {"_id": 100, "count": 2}],
+        }
+    ]
+    return collection
+
+
+def test_compute_facets_labels_buckets():
+    """Facets are flattened to value and count, with readable labels"""
+    collection = make_collection()
+    facets = compute_facets(collection, {"speaker_lc": "ann"})
+    assert facets["speaker"] == [{"value": "Ann", "count": 3}]
+    assert facets["month"] == [
+        {"value": "2025-02", "count": 2, "from": "2025-02-01", "to": "2025-02-28"}
+    ]
+    assert facets["length"] == [
+        {"value": "0", "count": 1},
+        {"value": "100-499", "count": 2},
+    ]
+    pipeline = collection.aggregate.call_args[0][0]
+    assert pipeline[0] == {"$match": {"speaker_lc": "ann"}}
+    assert length_label(5000) == "5000+"
+    assert month_range("2024-02") == ("2024-02-01", "2024-02-29")
+
+
+def test_cache_hits_until_invalidated_or_stale():
+    """Results are reused per filter until a write or max_age"""
+    collection = make_collection()
+    cache = FacetCache(max_age=60)
+    cache.get(collection, {})
+    cache.get(collection, {})
+    assert collection.aggregate.call_count == 1
+    cache.get(collection, {"speaker_lc": "ann"})
+    assert collection.aggregate.call_count == 2
+    cache.invalidate()
+    cache.get(collection, {})
+    assert collection.aggregate.call_count == 3
+
+    stale = FacetCache(max_age=0)
+    stale.get(collection, {})
+    stale.get(collection, {})
+    assert collection.aggregate.call_count == 5
+
+
+def test_cache_is_bounded():
+    """The least recently used filter is evicted"""
+    collection = make_collection()
+    cache = FacetCache(size=2)
+    for speaker in ("a", "b", "a", "c"):
+        cache.get(collection, {"speaker_lc": speaker})
+    cache.get(collection, {"speaker_lc": "a"})
+    assert collection.aggregate.call_count == 3
+    cache.get(collection, {"speaker_lc": "b"})
+    assert collection.aggregate.call_count == 4
@@ -0,0 +1,77 @@
+# pylint: disable=redefined-outer-name
+"""Test the pooled ml-client API client"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+import pytest
+from ml_client import MLClient, MLClientBusy
+
+
+class FakeMLClient(BaseHTTPRequestHandler):
+    """Answers every POST with the request body, over keep-alive connections."""
+
+    protocol_version = "HTTP/1.1"
+    peers = set()
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Echo the JSON payload and note the client's address"""
+        FakeMLClient.peers.add(self.client_address)
+        payload = self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({"path": self.path, "payload": json.loads(payload)})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keep the test output quiet"""
+
+
+@pytest.fixture
+def fake_ml_client():
+    """A local HTTP server standing in for the ml-client"""
+    FakeMLClient.peers = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeMLClient)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/get-transcripts"
+    server.shutdown()
+    server.server_close()
+
+
+def test_calls_reuse_one_connection(fake_ml_client):
+    """Sequential calls share a keep-alive connection"""
+    client = MLClient(fake_ml_client)
+    for name in ("a.mp3", "b.mp3", "c.mp3"):
+        answer = client.transcribe(f"static/uploaded_audio/{name}")
+        assert answer["payload"] == {"audio_file_path": f"static/uploaded_audio/{name}"}
+    assert len(FakeMLClient.peers) == 1
+
+    answer = client.transcribe_batch(["a.mp3", "b.mp3"])
+    assert answer["path"] == "/get-transcripts/batch"
+    assert answer["payload"] == {"audio_file_paths": ["a.mp3", "b.mp3"]}
+
+
+def test_saturated_client_pushes_back():
+    """Calls beyond max_in_flight wait queue_seconds, then raise MLClientBusy"""
+    client = MLClient("http://ml-client", max_in_flight=1, queue_seconds=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_post(*_args, **_kwargs):
+        started.set()
+        release.wait(5)
+        return MagicMock(status_code=200, json=MagicMock(return_value={}))
+
+    with patch.object(client.session, "post", side_effect=slow_post):
+        first = threading.Thread(target=client.transcribe, args=("a.mp3",))
+        first.start()
+        assert started.wait(5)
+        with pytest.raises(MLClientBusy) as busy:
+            client.transcribe("b.mp3")
+        assert busy.value.retry_after == 0.05
+        release.set()
+        first.join()
+        assert client.transcribe("b.mp3") == {}
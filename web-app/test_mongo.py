@@ -0,0 +1,27 @@
+"""Test the per-process MongoDB connections"""
+
+import os
+from unittest.mock import patch
+import mongo
+from mongo import LazyDatabase
+
+
+# pylint: disable=protected-access
+@patch.dict(mongo._process, {"client": None, "pid": None})
+@patch("mongo.MongoClient")
+def test_client_is_created_lazily_per_process(mock_client):
+    """No client until first use, one per process, a new one after fork"""
+    db = LazyDatabase()
+    entries = db["transcriptions"]
+    assert entries.name == "transcriptions"
+    mock_client.assert_not_called()
+
+    entries.find_one({"_id": "a.mp3"})
+    db["transcriptions"].find_one({"_id": "b.mp3"})
+    assert mock_client.call_count == 1
+    database = mock_client.return_value.get_database.return_value
+    database.__getitem__.assert_called_with("transcriptions")
+
+    with patch("mongo.os.getpid", return_value=os.getpid() + 1):
+        entries.find_one({"_id": "a.mp3"})
+    assert mock_client.call_count == 2
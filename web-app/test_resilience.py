@@ -0,0 +1,105 @@
+"""Test the circuit breakers, adaptive timeouts and retries"""
+
+from unittest.mock import MagicMock, patch
+import pytest
+from resilience import (
+    LATENCY_MIN_SAMPLES,
+    AdaptiveTimeout,
+    CircuitBreaker,
+    CircuitOpenError,
+    Endpoint,
+    audio_duration,
+)
+
+
+class Flaky(Exception):
+    """A failure worth retrying."""
+
+
+def retryable(error):
+    """Only Flaky errors are retried"""
+    return isinstance(error, Flaky)
+
+
+def test_timeout_follows_duration_and_observed_latency():
+    """The estimate is used until enough calls were timed, then their p99"""
+    timeouts = AdaptiveTimeout(10, 100, 0.5)
+    assert timeouts.timeout(0) == 10 + 1.5 * 0.5
+    assert timeouts.timeout(60) == 10 + 1.5 * 0.5 * 60
+    assert timeouts.timeout(3600) == 100
+
+    for _ in range(LATENCY_MIN_SAMPLES * 5 - 1):
+        timeouts.observe(6, 60)
+    timeouts.observe(60, 60)
+    assert timeouts.ratio(50) == 0.1
+    assert timeouts.ratio(99) == 0.1
+    assert timeouts.ratio(100) == 1
+    assert timeouts.timeout(60) == pytest.approx(10 + 1.5 * 0.1 * 60)
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    """Failures in a row open the circuit, a trial call closes or reopens it"""
+    breaker = CircuitBreaker("test", failures=2, reset_seconds=60)
+    breaker.failure()
+    breaker.before_call()
+    breaker.failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as opened:
+        breaker.before_call()
+    assert 59 < opened.value.retry_after <= 60
+
+    breaker.reset_seconds = 0
+    assert breaker.state == "half open"
+    assert breaker.retry_after() == 0
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.failure()
+    breaker.before_call()
+    breaker.success()
+    assert breaker.state == "closed"
+    assert breaker.failed == 0
+
+
+@patch("resilience.RETRY_BACKOFF_SECONDS", 0)
+def test_endpoint_retries_idempotent_calls():
+    """Retryable failures are retried with the call's timeout, others raised"""
+    endpoint = Endpoint("test", AdaptiveTimeout(10, 100, 0.5), retryable)
+    func = MagicMock(side_effect=[Flaky(), Flaky(), "done"])
+    assert endpoint.call(func, duration=20) == "done"
+    assert [call[0][0] for call in func.call_args_list] == [25] * 3
+    assert endpoint.breaker.failed == 0
+
+    func = MagicMock(side_effect=Flaky())
+    with pytest.raises(Flaky):
+        endpoint.call(func, idempotent=False)
+    assert func.call_count == 1
+
+    func = MagicMock(side_effect=ValueError("bad request"))
+    with pytest.raises(ValueError):
+        endpoint.call(func)
+    assert func.call_count == 1
+    assert endpoint.breaker.failed == 0
+
+
+@patch("resilience.RETRY_BACKOFF_SECONDS", 0)
+def test_endpoint_fails_fast_when_open():
+    """Once the circuit is open, calls fail without reaching the endpoint"""
+    endpoint = Endpoint("test", AdaptiveTimeout(1, 10, 0.5), retryable, attempts=3)
+    endpoint.breaker.failures = 3
+    func = MagicMock(side_effect=Flaky())
+    with pytest.raises(Flaky):
+        endpoint.call(func)
+    assert func.call_count == 3
+    with pytest.raises(CircuitOpenError):
+        endpoint.call(func)
+    assert func.call_count == 3
+    assert endpoint.stats()["circuit"] == "open"
+
+
+def test_audio_duration_of_unreadable_file(tmp_path):
+    """Durations are estimated from the size, 0 for missing files"""
+    audio_file = tmp_path / "a.mp3"
+    audio_file.write_bytes(b"x" * 32000)
+    assert audio_duration(str(audio_file)) == 2
+    assert audio_duration(str(tmp_path / "missing.mp3")) == 0
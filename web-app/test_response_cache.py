@@ -0,0 +1,45 @@
+"""Test the rendered page cache and entry version stamps"""
+
+from unittest.mock import MagicMock
+from response_cache import EntryVersions, ResponseCache, make_etag
+
+
+def test_make_etag_is_stable_and_distinct():
+    """Same parts give the same tag, any change gives another"""
+    assert make_etag("a.mp3", 1) == make_etag("a.mp3", 1)
+    assert make_etag("a.mp3", 1) != make_etag("a.mp3", 2)
+    assert make_etag("a", "b") != make_etag("ab")
+
+
+def test_response_cache_evicts_by_size():
+    """Least recently used bodies go first once over the byte budget"""
+    cache = ResponseCache(max_bytes=10)
+    cache.put("a", "ta", b"aaaa")
+    cache.put("b", "tb", b"bbbb")
+    assert cache.get("a") == ("ta", b"aaaa")
+    cache.put("c", "tc", b"cccc")
+    assert cache.get("b") is None
+    assert cache.size == 8 and len(cache) == 2
+    cache.put("huge", "th", b"x" * 11)
+    assert cache.get("huge") is None
+    cache.put("a", "ta2", b"a")
+    assert cache.get("a") == ("ta2", b"a") and cache.size == 5
+    assert cache.get("a", max_age=-1) is None
+    cache.clear()
+    assert cache.size == 0 and cache.get("c") is None
+
+
+def test_entry_versions_are_checked_at_most_every_ttl():
+    """Versions come from memory within the ttl, forgetting forces a lookup"""
+    collection = MagicMock()
+    collection.find_one.return_value = {"_id": "a.mp3", "version": 3}
+    versions = EntryVersions(ttl=60)
+    assert versions.get(collection, "a.mp3") == 3
+    assert versions.get(collection, "a.mp3") == 3
+    assert collection.find_one.call_count == 1
+    versions.forget("a.mp3")
+    collection.find_one.return_value = {"_id": "a.mp3"}
+    assert versions.get(collection, "a.mp3") == 0
+    collection.find_one.return_value = None
+    assert versions.get(collection, "b.mp3") is None
+    assert EntryVersions(ttl=0).get(collection, "b.mp3") is None
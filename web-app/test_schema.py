@@ -0,0 +1,46 @@
+"""Test the shared index definitions and query-plan audit"""
+
+from unittest.mock import MagicMock
+from pymongo.errors import OperationFailure
+import schema
+
+
+def test_ensure_indexes_creates_every_index():
+    """Every declared index is created, and conflicts are reported not raised"""
+    db = MagicMock()
+    collections = {name: MagicMock() for name in schema.INDEXES}
+    db.__getitem__.side_effect = collections.__getitem__
+    collections["transcript_cache"].create_index.side_effect = OperationFailure(
+        "IndexOptionsConflict"
+    )
+
+    assert schema.ensure_indexes(db) == ["created_at_ttl"]
+    for name, specs in schema.INDEXES.items():
+        assert collections[name].create_index.call_count == len(specs)
+    names = [
+        call[1]["name"]
+        for call in collections["transcriptions"].create_index.call_args_list
+    ]
+    assert "audio_file" in names and "created_at_id" in names
+
+
+def test_audit_queries_reports_examined_vs_returned(capsys):
+    """The audit reports keys/docs examined against docs returned per shape"""
+    db = MagicMock()
+    db.__getitem__.return_value.find.return_value.explain.return_value = {
+        "queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}},
+        "executionStats": {
+            "nReturned": 1,
+            "totalKeysExamined": 0,
+            "totalDocsExamined": 500,
+        },
+    }
+    shapes = [schema.query_shape("by audio", "transcriptions", {"audio_file": "x"})]
+
+    (report,) = schema.audit_queries(db, shapes)
+    assert report["collscan"]
+    assert report["docs_examined"] == 500
+    assert report["returned"] == 1
+    assert "by audio: keys 0, docs 500, returned 1 [COLLSCAN]" in (
+        capsys.readouterr().out
+    )
@@ -0,0 +1,136 @@
+"""Test the transcript search index"""
+
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+from pymongo.errors import PyMongoError
+import search_index
+from search_index import TranscriptIndex, query_terms, snippet
+
+
+def make_index(snapshot_path=None):
+    """An index of three small transcripts"""
+    index = TranscriptIndex(snapshot_path)
+    index.add("a.mp3", "The budget review covered the budget and the release")
+    index.add("b.mp3", "Release planning for the next quarter")
+    index.add("c.mp3", "Team lunch, then a short budget question")
+    return index
+
+
+def test_search_ranks_with_bm25():
+    """More occurrences in a shorter transcript rank higher"""
+    index = make_index()
+    hits = index.search("budget")
+    assert [entry_id for entry_id, _ in hits] == ["a.mp3", "c.mp3"]
+    assert hits[0][1] > hits[1][1] > 0
+    # a rarer term outweighs a common one
+    assert index.search("release quarter")[0][0] == "b.mp3"
+    assert index.search("the and") == []
+    assert index.search("missing") == []
+    assert len(index.search("budget release", limit=1)) == 1
+
+
+def test_reindex_and_remove():
+    """Re-adding replaces an entry, removing drops it, compaction keeps results"""
+    index = make_index()
+    index.add("a.mp3", "nothing relevant")
+    assert [hit[0] for hit in index.search("budget")] == ["c.mp3"]
+    index.remove("c.mp3")
+    index.remove("unknown.mp3")
+    assert not index.search("budget")
+    assert len(index) == 2
+    index.compact()
+    assert not index.dead
+    assert len(index.ids) == 2
+    assert index.search("quarter")[0][0] == "b.mp3"
+    assert "budget" not in index.postings
+
+
+def test_dead_documents_do_not_count():
+    """Removed entries weigh neither on document frequencies nor on hits"""
+    index = make_index()
+    index.add("d.mp3", "budget budget budget")
+    index.remove("d.mp3")
+    assert index.dead
+    assert index.search("budget") == make_index().search("budget")
+
+
+def test_snapshot_round_trip(tmp_path):
+    """A saved index loads back with the same postings and results"""
+    path = str(tmp_path / "index.bin")
+    index = make_index(path)
+    index.save()
+    assert not (tmp_path / "index.bin").exists()  # never synced
+
+    index.synced_at = datetime(2025, 4, 1, tzinfo=timezone.utc)
+    index.remove("b.mp3")
+    index.save()
+    loaded = TranscriptIndex(path)
+    assert loaded.load()
+    assert loaded.synced_at == index.synced_at
+    assert loaded.search("budget") == index.search("budget")
+    assert loaded.postings.keys() == index.postings.keys()
+
+    (tmp_path / "index.bin").write_bytes(b"garbage")
+    assert not TranscriptIndex(path).load()
+
+
+def test_sync_reads_changed_entries():
+    """The first sync reads everything, later ones only recent changes"""
+    collection = MagicMock()
+    collection.find.return_value = [{"_id": "a.mp3", "transcript": "budget"}]
+    index = TranscriptIndex()
+    assert index.sync(collection) == 1
+    assert collection.find.call_args[0][0] == {}
+    index.sync(collection)
+    query = collection.find.call_args[0][0]
+    assert "$gte" in query["transcript_updated_at"]
+
+
+def test_refresh_loads_snapshot_and_throttles_sync(tmp_path, monkeypatch):
+    """Refresh loads the snapshot once and syncs at most every max_age"""
+    path = str(tmp_path / "index.bin")
+    saved = make_index(path)
+    saved.synced_at = datetime(2025, 4, 1, tzinfo=timezone.utc)
+    saved.save()
+
+    collection = MagicMock()
+    collection.find.return_value = []
+    index = TranscriptIndex(path)
+    index.refresh(collection, max_age=60)
+    assert index.search("budget")[0][0] == "a.mp3"
+    assert "$gte" in collection.find.call_args[0][0]["transcript_updated_at"]
+    index.refresh(collection, max_age=60)
+    assert collection.find.call_count == 1
+
+    monkeypatch.setattr(search_index, "SNAPSHOT_EVERY", 1)
+    index.add("d.mp3", "budget")
+    index.refresh(collection)
+    reloaded = TranscriptIndex(path)
+    assert reloaded.load()
+    assert "d.mp3" in [entry_id for entry_id, _ in reloaded.search("budget")]
+
+
+def test_refresh_later_syncs_in_background():
+    """The background sync indexes the entries, database errors are logged"""
+    collection = MagicMock()
+    collection.find.return_value = [{"_id": "a.mp3", "transcript": "budget"}]
+    index = TranscriptIndex()
+    index.refresh_later(collection).join()
+    assert index.search("budget")[0][0] == "a.mp3"
+
+    collection.find.side_effect = PyMongoError()
+    index = TranscriptIndex()
+    index.refresh_later(collection).join()
+    assert index.synced_at is None
+
+
+def test_snippet_highlights_and_escapes():
+    """Snippets are cut around the first match and HTML-escaped"""
+    text = "<b>intro</b> " + "filler " * 60 + "the Budget is <late> " + "tail " * 60
+    html = str(snippet(text, query_terms("budget late")))
+    assert "<mark>Budget</mark>" in html
+    assert "&lt;<mark>late</mark>&gt;" in html
+    assert html.startswith("… ") and html.endswith(" …")
+    assert "<b>" not in html
+    assert str(snippet("short text", [])) == "short text"
+    assert str(snippet("", ["a"])) == ""
@@ -0,0 +1,34 @@
+"""Test the content-addressed audio storage"""
+
+import hashlib
+import io
+import os
+from unittest.mock import patch
+import pytest
+from storage import blob_path, save_blob
+
+
+def test_save_blob(tmp_path):
+    """Blobs are stored under their digest and duplicates are not written twice"""
+    content = b"Mock audio content" * 10000
+    digest = hashlib.sha256(content).hexdigest()
+
+    path, saved_digest, existed = save_blob(io.BytesIO(content), tmp_path, "a.MP3")
+    assert saved_digest == digest
+    assert path == blob_path(tmp_path, digest, ".mp3")
+    assert not existed
+    with open(path, "rb") as f:
+        assert f.read() == content
+
+    path_again, _, existed = save_blob(io.BytesIO(content), tmp_path, "b.mp3")
+    assert path_again == path
+    assert existed
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+
+def test_save_blob_cleans_up_on_error(tmp_path):
+    """A failed write leaves no partial file behind"""
+    with patch("storage.os.replace", side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            save_blob(io.BytesIO(b"data"), tmp_path, "a.mp3")
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,73 @@
+"""Test the speaker and title typeahead"""
+
+from unittest.mock import MagicMock
+from suggest import SuggestIndex, _FieldIndex
+
+
+def make_collection(speakers, titles):
+    """A collection whose aggregations group the given values"""
+    collection = MagicMock()
+
+    def aggregate(pipeline):
+        values = speakers if pipeline[0]["$group"]["_id"] == "$speaker" else titles
+        return [{"_id": value, "count": count} for value, count in values.items()]
+
+    collection.aggregate.side_effect = aggregate
+    return collection
+
+
+def test_suggest_matches_word_starts():
+    """Prefixes match any word of a value, case-insensitively"""
+    collection = make_collection(
+        {"John Smith": 3, "Jane Doe": 1, None: 2},
+        {"Weekly meeting": 2, "Budget review": 1},
+    )
+    index = SuggestIndex()
+    assert index.suggest(collection, "j") == {
+        "speaker": ["Jane Doe", "John Smith"],
+        "title": [],
+    }
+    assert index.suggest(collection, "SMI", "speaker") == {"speaker": ["John Smith"]}
+    assert index.suggest(collection, "meet", "title") == {"title": ["Weekly meeting"]}
+    assert index.suggest(collection, "j", "speaker", limit=1) == {
+        "speaker": ["Jane Doe"]
+    }
+    assert collection.aggregate.call_count == 2  # loaded once
+
+
+def test_record_keeps_index_current():
+    """Writes add, rename and drop values by reference count"""
+    collection = make_collection({"Ann": 2}, {})
+    index = SuggestIndex()
+    index.record(new={"speaker": "Bob", "title": "Ignored"})  # not loaded yet
+    index.suggest(collection, "a")
+
+    index.record(new={"speaker": "Bob", "title": "Standup"})
+    assert index.suggest(collection, "b")["speaker"] == ["Bob"]
+    index.record({"speaker": "Ann", "title": "x"}, {"speaker": "Anna", "title": "x"})
+    assert index.suggest(collection, "an")["speaker"] == ["Ann", "Anna"]
+    index.record(old={"speaker": "Ann", "title": "x"})
+    assert index.suggest(collection, "an")["speaker"] == ["Anna"]
+    assert index.suggest(collection, "x")["title"] == []
+
+
+def test_index_is_bounded_and_reloads():
+    """The least used value is evicted, stale indexes are reloaded"""
+    collection = make_collection({"a1": 5, "a2": 1, "a3": 3}, {})
+    index = SuggestIndex(max_values=2, reload_seconds=0)
+    assert index.suggest(collection, "a")["speaker"] == ["a1", "a3"]
+    index.suggest(collection, "a")
+    assert collection.aggregate.call_count == 4
+
+
+def test_full_field_evicts_least_used_in_batches(monkeypatch):
+    """A full field drops its least used values at once, then has room"""
+    monkeypatch.setattr("suggest.SUGGEST_EVICT_FRACTION", 0.5)
+    index = _FieldIndex(max_values=4)
+    for value, count in (("Ann", 4), ("Bob", 1), ("Cy", 3), ("Dee", 2)):
+        index.add(value, count)
+    index.add("Eve")
+    assert sorted(index.values) == ["ann", "cy", "eve"]
+    assert {lowered for _, lowered in index.keys} == {"ann", "cy", "eve"}
+    index.add("Fay")
+    assert len(index.values) == 4
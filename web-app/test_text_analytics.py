@@ -0,0 +1,169 @@
+"""Test the shared word statistics"""
+
+import pytest
+import text_analytics
+from text_analytics import (
+    CountMinSketch,
+    analyze,
+    changed_span,
+    count_words,
+    top_words,
+    update_frequencies,
+    word_frequencies,
+    word_frequency,
+)
+
+
+def test_word_frequencies_ignores_case_and_punctuation():
+    """Words are lowercased and split on anything but word characters"""
+    counts = word_frequencies("Hello, world! 'Hello' -- HELLO world_wide")
+    assert list(counts.items()) == [("hello", 3), ("world", 1), ("world_wide", 1)]
+    assert not word_frequencies("")
+    assert not word_frequencies(None)
+
+
+def test_contractions_and_decimals_stay_whole():
+    """Apostrophes and dots inside a word keep it whole, as before the refactor"""
+    text = "I don't think it's 3.5 percent, U.S. e-mail rock'n'roll"
+    assert list(word_frequencies(text)) == [
+        "i",
+        "don't",
+        "think",
+        "it's",
+        "3.5",
+        "percent",
+        "u.s",
+        "e",
+        "mail",
+        "rock'n'roll",
+    ]
+    assert word_frequencies("'Tis the end... 'quoted' it's.") == {
+        "tis": 1,
+        "the": 1,
+        "end": 1,
+        "quoted": 1,
+        "it's": 1,
+    }
+    assert word_frequencies("Ça n'est pas 3.5") == {
+        "ça": 1,
+        "n'est": 1,
+        "pas": 1,
+        "3.5": 1,
+    }
+
+
+def test_word_count_counts_whitespace_tokens():
+    """word_count is the number of whitespace-separated tokens"""
+    text = "I don't think it's 3.5 percent, U.S. e-mail rock'n'roll -- ok"
+    assert count_words(text) == len(text.split()) == 11
+    assert analyze(text)["word_count"] == 11
+    assert count_words("") == count_words(None) == 0
+    transcribed = analyze("it's it's it's don't don't don't s t", "transcribe")
+    assert transcribed["top_words"] == [["it's", 3], ["don't", 3]]
+
+
+def test_word_frequencies_non_ascii_matches_ascii_rules():
+    """Non-ASCII text goes through the regex and splits the same way"""
+    assert word_frequencies("Café, café! naïve-idea") == {
+        "café": 2,
+        "naïve": 1,
+        "idea": 1,
+    }
+
+
+def test_word_frequencies_across_chunks(monkeypatch):
+    """Chunked tokenizing never splits a word"""
+    monkeypatch.setattr(text_analytics, "CHUNK_CHARS", 4)
+    text = "alpha beta alpha gamma " * 3
+    assert word_frequencies(text) == {"alpha": 6, "beta": 3, "gamma": 3}
+
+
+def test_top_words_filters_and_ranks():
+    """Policy filters apply, ties keep first-occurrence order"""
+    counts = word_frequencies("the cat sat cats cats tiger tiger mouse")
+    assert top_words(counts, min_length=4) == [
+        ["cats", 2],
+        ["tiger", 2],
+        ["mouse", 1],
+    ]
+    assert top_words(counts, min_length=4, top_k=2) == [["cats", 2], ["tiger", 2]]
+    assert top_words(counts, min_count=2) == [["cats", 2], ["tiger", 2]]
+
+
+def test_analyze_policies():
+    """Each call site's policy keeps its own threshold"""
+    text = "rain rain rain walk walk the the the dog"
+    assert analyze(text, "upload")["top_words"] == [["rain", 3], ["walk", 2]]
+    assert analyze(text, "edit")["top_words"] == [
+        ["rain", 3],
+        ["walk", 2],
+        ["dog", 1],
+    ]
+    transcribed = analyze(text, "transcribe")
+    assert transcribed["top_words"] == [["rain", 3]]
+    assert transcribed["word_count"] == 9
+    assert analyze(text, "edit", top_k=1)["top_words"] == [["rain", 3]]
+
+
+def test_top_words_are_bounded():
+    """Entries keep TOP_K top words however large the vocabulary"""
+    text = " ".join(f"word{i} " * (i % 7 + 1) for i in range(500))
+    stats = analyze(text)
+    assert len(stats["top_words"]) == text_analytics.TOP_K
+    assert stats["top_words"][0][1] == 7
+
+
+def test_sketch_never_undercounts_and_has_fixed_size():
+    """Sketch estimates are upper bounds and the blob size is constant"""
+    short = analyze("alpha beta beta")
+    long_text = " ".join(f"word{i % 3000}" for i in range(30000))
+    long = analyze(long_text)
+    assert len(short["word_sketch"]) == len(long["word_sketch"])
+    sketch = CountMinSketch.from_bytes(long["word_sketch"])
+    for word, count in long["frequencies"].items():
+        assert sketch.estimate(word) >= count
+    assert CountMinSketch.from_bytes(short["word_sketch"]).estimate("Beta") == 2
+    assert analyze("")["word_sketch"] is None
+
+
+def test_sketch_rejects_bad_blobs():
+    """Garbage is not loaded as a sketch"""
+    with pytest.raises(ValueError):
+        CountMinSketch.from_bytes(b"\x01")
+    with pytest.raises(ValueError):
+        CountMinSketch.from_bytes(b"\x09\x04\x00\x01" + bytes(16))
+
+
+def test_word_frequency_exact_then_estimated():
+    """Top words are exact, other words come from the sketch"""
+    stats = analyze("river river river stone stone tree", top_k=1)
+    entry = {"top_words": stats["top_words"], "word_sketch": stats["word_sketch"]}
+    assert word_frequency(entry, "River") == (3, True)
+    count, exact = word_frequency(entry, "stone")
+    assert count >= 2 and not exact
+    assert word_frequency({"top_words": [["river", 3]]}, "stone") == (None, False)
+
+
+def test_changed_span_covers_whole_words():
+    """The edited span is widened to word boundaries"""
+    old = "the quick brown fox"
+    new = "the quack brown fox"
+    assert changed_span(old, new) == (4, 9, 9)
+    assert changed_span(old, old) == (16, 19, 19)
+    assert changed_span("", "new words") == (0, 0, 9)
+
+
+def test_update_frequencies_matches_full_recount():
+    """Incremental counts equal a full recount, large edits fall back"""
+    old = "alpha beta, gamma. " * 2000 + "delta"
+    edits = [
+        old.replace("gamma", "gammas", 1),
+        old[:100] + old[120:],
+        old + " epsilon",
+        "zeta " + old,
+    ]
+    for new in edits:
+        counts = update_frequencies(word_frequencies(old), old, new)
+        assert counts == word_frequencies(new)
+        assert all(count > 0 for count in counts.values())
+    assert update_frequencies(word_frequencies(old), old, "short") is None
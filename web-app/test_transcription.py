@@ -0,0 +1,106 @@
+"""Test the transcription by the ml-client"""
+
+from unittest.mock import patch, MagicMock
+import requests
+from pymongo.errors import PyMongoError
+from resilience import CircuitBreaker
+from ml_client import MLClientBusy
+from transcription import (
+    enqueue_transcription,
+    get_ml_client,
+    retranscribe_missing,
+    trigger_ml,
+)
+
+
+@patch("transcription.jobs_collection.find_one_and_update")
+def test_enqueue_transcription(mock_upsert):
+    """Test the enqueue_transcription function."""
+    mock_upsert.return_value = {"_id": "65f000000000000000000001"}
+    assert enqueue_transcription("test/audio.mp3") == "65f000000000000000000001"
+    query, update = mock_upsert.call_args[0]
+    # an active job for the same file is reused instead of queueing another
+    assert query["audio_file"] == "test/audio.mp3"
+    assert query["status"] == {"$in": ["queued", "running"]}
+    assert update["$setOnInsert"]["status"] == "queued"
+    assert update["$setOnInsert"]["attempts"] == 0
+    assert mock_upsert.call_args[1]["upsert"]
+
+    mock_upsert.side_effect = PyMongoError()
+    assert enqueue_transcription("test/audio.mp3") is None
+
+
+@patch.object(get_ml_client().session, "post")
+def test_trigger_ml_request_exception(mock_post):
+    """Test trigger_ml function with request exception"""
+    # Mock request exception
+    mock_post.side_effect = requests.exceptions.RequestException("Connection failed")
+    result = trigger_ml("test/audio.mp3")
+    assert result == "Request exception"
+
+
+@patch.object(get_ml_client().session, "post")
+def test_trigger_ml_connection_error(mock_post):
+    """Test trigger_ml function with connection error"""
+    # Mock connection error
+    mock_post.side_effect = ConnectionError("Connection failed")
+    result = trigger_ml("test/audio.mp3")
+    assert result == "Connection error"
+
+
+@patch("resilience.RETRY_BACKOFF_SECONDS", 0)
+@patch.object(get_ml_client().session, "post")
+def test_trigger_ml_retries_then_fails_fast(mock_post):
+    """Test trigger_ml retries connection errors and stops calling a failing ml-client"""
+    answered = MagicMock(status_code=200)
+    answered.json.return_value = {"transcript": "hello"}
+    mock_post.side_effect = [requests.exceptions.ConnectionError("refused"), answered]
+    with patch.object(
+        get_ml_client().endpoint, "breaker", CircuitBreaker("ml-client", failures=3)
+    ):
+        assert trigger_ml("test/audio.mp3") == {"transcript": "hello"}
+        connect_timeout, read_timeout = mock_post.call_args[1]["timeout"]
+        assert connect_timeout < read_timeout
+
+        mock_post.side_effect = requests.exceptions.ConnectionError("refused")
+        assert trigger_ml("test/audio.mp3") == "Request exception"
+        calls = mock_post.call_count
+        assert trigger_ml("test/audio.mp3") == "Circuit open"
+        assert mock_post.call_count == calls
+
+
+@patch.object(get_ml_client().session, "post")
+def test_trigger_ml_json_response(mock_post):
+    """Test trigger_ml function with different JSON responses"""
+    test_cases = [
+        # Empty response
+        {},
+        # Response with only message
+        {"message": "processing complete"},
+        # Response with transcript and other fields
+        {"transcript": "hello world", "confidence": 0.95},
+        # Response with multiple fields
+        {"transcript": "test", "message": "success", "duration": 1.5},
+    ]
+    for test_data in test_cases:
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = test_data
+        mock_post.return_value = mock_response
+
+        result = trigger_ml("test/audio.mp3")
+        assert result == test_data, f"Failed for test data: {test_data}"
+
+
+def test_retranscribe_missing_sends_batches():
+    """Entries without transcripts are sent to the ml-client in batches"""
+    answer = {"results": [{"status": "done"}, {"status": "not_found"}]}
+    with patch(
+        "transcription.collection.distinct", return_value=["a.mp3", "b.mp3", "c.mp3"]
+    ) as mock_distinct, patch.object(
+        get_ml_client(), "transcribe_batch", side_effect=[answer, MLClientBusy(5)]
+    ) as mock_batch:
+        statuses = retranscribe_missing(batch_size=2)
+    assert mock_distinct.call_args[0][1] == {"transcript": {"$in": ["", None]}}
+    assert mock_batch.call_args_list[0][0][0] == ["a.mp3", "b.mp3"]
+    assert statuses == {"done": 1, "not_found": 1, "not sent": 1}
@@ -0,0 +1,119 @@
+"""Test the resumable chunked uploads"""
+
+import fcntl
+import hashlib
+import io
+import os
+import pytest
+from storage import blob_path
+from uploads import ChunkedUploads, UploadError
+
+
+class BrokenStream(io.BytesIO):
+    """A request body whose connection drops after the first read."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        if self.reads > 1:
+            raise ConnectionResetError("client went away")
+        return super().read(size)
+
+
+def test_upload_in_chunks(tmp_path):
+    """Chunks at the current offset are appended, then stored under the digest"""
+    content = os.urandom(200_000)
+    uploads = ChunkedUploads(str(tmp_path), chunk_bytes=150_000)
+    session = uploads.create("talk.MP3", len(content))
+    upload_id = session["upload_id"]
+    assert session["offset"] == 0
+
+    assert uploads.append(upload_id, 0, io.BytesIO(content[:150_000]))["offset"] == (
+        150_000
+    )
+    with pytest.raises(UploadError) as stale:
+        uploads.append(upload_id, 0, io.BytesIO(content[:150_000]))
+    assert (stale.value.status, stale.value.offset) == (409, 150_000)
+    with pytest.raises(UploadError) as early:
+        uploads.complete(upload_id)
+    assert early.value.status == 409
+
+    uploads.append(upload_id, 150_000, io.BytesIO(content[150_000:]))
+    path, digest, existed, filename = uploads.complete(upload_id)
+    assert digest == hashlib.sha256(content).hexdigest()
+    assert path == blob_path(str(tmp_path), digest, ".mp3")
+    assert (existed, filename) == (False, "talk.MP3")
+    with open(path, "rb") as f:
+        assert f.read() == content
+    assert not os.listdir(uploads.partial_folder)
+
+    again = uploads.create("copy.mp3", len(content))["upload_id"]
+    uploads.append(again, 0, io.BytesIO(content[:150_000]))
+    uploads.append(again, 150_000, io.BytesIO(content[150_000:]))
+    assert uploads.complete(again)[:3] == (path, digest, True)
+
+
+def test_resume_in_another_process(tmp_path):
+    """A broken chunk keeps what arrived and any process can carry on"""
+    content = os.urandom(3 * 64 * 1024)
+    uploads = ChunkedUploads(str(tmp_path))
+    upload_id = uploads.create("a.wav", len(content))["upload_id"]
+
+    with pytest.raises(ConnectionResetError):
+        uploads.append(upload_id, 0, BrokenStream(content))
+    offset = uploads.status(upload_id)["offset"]
+    assert offset == 64 * 1024
+
+    # a fresh instance has hashed nothing and catches up from disk
+    other = ChunkedUploads(str(tmp_path))
+    other.append(upload_id, offset, io.BytesIO(content[offset:]))
+    assert other.complete(upload_id)[1] == hashlib.sha256(content).hexdigest()
+
+
+def test_upload_limits(tmp_path):
+    """Oversized files and chunks are refused and leave nothing behind"""
+    uploads = ChunkedUploads(str(tmp_path), max_bytes=1000, chunk_bytes=100)
+    with pytest.raises(UploadError) as too_large:
+        uploads.create("a.mp3", 1001)
+    assert too_large.value.status == 413
+    with pytest.raises(UploadError) as no_size:
+        uploads.create("a.mp3", "")
+    assert no_size.value.status == 400
+
+    upload_id = uploads.create("a.mp3", 150)["upload_id"]
+    with pytest.raises(UploadError) as declared:
+        uploads.append(upload_id, 0, io.BytesIO(b"x" * 101), length=101)
+    assert declared.value.status == 413
+    uploads.append(upload_id, 0, io.BytesIO(b"x" * 100))
+    with pytest.raises(UploadError) as streamed:
+        uploads.append(upload_id, 100, io.BytesIO(b"y" * 51))
+    assert streamed.value.status == 413
+    assert uploads.status(upload_id)["offset"] == 100
+
+    uploads.append(upload_id, 100, io.BytesIO(b"y" * 50))
+    digest = uploads.complete(upload_id)[1]
+    assert digest == hashlib.sha256(b"x" * 100 + b"y" * 50).hexdigest()
+
+
+def test_unknown_busy_and_expired_uploads(tmp_path):
+    """Unknown ids are 404, concurrent writers 409, idle sessions expire"""
+    uploads = ChunkedUploads(str(tmp_path), ttl=60)
+    for upload_id in ("../../etc/passwd", "0" * 32):
+        with pytest.raises(UploadError) as missing:
+            uploads.status(upload_id)
+        assert missing.value.status == 404
+
+    upload_id = uploads.create("a.mp3", 10)["upload_id"]
+    part_path = os.path.join(uploads.partial_folder, f"{upload_id}.part")
+    with open(part_path, "rb") as other_writer:
+        fcntl.flock(other_writer, fcntl.LOCK_EX)
+        with pytest.raises(UploadError) as busy:
+            uploads.append(upload_id, 0, io.BytesIO(b"data"))
+        assert busy.value.status == 409
+
+    assert uploads.expire(now=os.path.getmtime(part_path) + 30) == 0
+    assert uploads.expire(now=os.path.getmtime(part_path) + 61) == 1
+    assert not os.listdir(uploads.partial_folder)
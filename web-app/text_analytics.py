@@ -0,0 +1,462 @@
+"""
+Word statistics for transcripts, shared by the web-app and the ml client.
+
+analyze() tokenizes a transcript once, with a translation table for ASCII
+text and a precompiled regex otherwise, and returns its word count, word
+frequencies and top words. With top_k set, the top words are picked with a
+heap instead of sorting the whole vocabulary. Which words count as "top" is
+set by a filtering policy; each call site picks one of POLICIES.
+
+Entries store only the TOP_K top words. The counts of every other word are
+kept approximately in a count-min sketch of fixed size (CountMinSketch), so
+an entry's size does not grow with the vocabulary of its transcript.
+
+update_frequencies() turns the word counts of a transcript into those of an
+edited version by re-counting only the edited span.
+
+Run this file directly to benchmark it against the previous
+Counter + list comprehension + sorted implementation.
+"""
+
+import hashlib
+import heapq
+import re
+import struct
+import sys
+from array import array
+from collections import Counter
+from operator import itemgetter
+
+# A word is a run of word characters (letters, digits, underscore) that may
+# contain apostrophes and dots, as in "don't", "3.5" or "u.s", but does not
+# start or end with one. ASCII text is tokenized by mapping every other
+# character to a space, splitting and stripping the ends of each token, about
+# twice as fast as the regex used for other text.
+INNER_CHARS = "'."
+TOKEN_RE = re.compile(r"\w(?:[\w'.]*\w)?")
+ASCII_NON_WORD = {
+    code: " "
+    for code in range(128)
+    if not (chr(code).isalnum() or chr(code) in "_" + INNER_CHARS)
+}
+WHITESPACE_RE = re.compile(r"\s")
+
+# Edits whose changed span is larger than this fraction of the transcript are
+# re-analyzed in full instead of incrementally
+INCREMENTAL_MAX_FRACTION = 0.25
+
+# Long transcripts are tokenized in slices of about this many characters, so
+# only one slice worth of tokens is held in memory at a time
+CHUNK_CHARS = 1 << 20
+
+STOP_WORDS = frozenset(
+    {
+        "the",
+        "is",
+        "in",
+        "and",
+        "of",
+        "a",
+        "to",
+        "with",
+        "that",
+        "for",
+        "on",
+        "as",
+        "are",
+        "at",
+        "by",
+        "an",
+        "be",
+        "this",
+        "it",
+        "from",
+        "or",
+        "was",
+        "we",
+        "you",
+        "your",
+        "they",
+        "he",
+        "she",
+        "but",
+        "not",
+        "have",
+        "has",
+        "had",
+        "can",
+        "will",
+        "do",
+        "does",
+        "did",
+        "so",
+        "if",
+        "then",
+        "them",
+        "these",
+        "those",
+        "there",
+        "here",
+    }
+)
+
+# Top words stored on an entry, detail.html charts the first 10
+TOP_K = 10
+
+# Filtering policies: which words are kept as top words
+# - min_length: shortest word kept
+# - min_count: fewest occurrences kept
+# - top_k: how many top words to keep, None keeps them all
+POLICIES = {
+    # web-app upload_entry()
+    "upload": {"min_length": 4, "min_count": 1, "top_k": TOP_K},
+    # web-app edit_entry()
+    "edit": {"min_length": 3, "min_count": 1, "top_k": TOP_K},
+    # ml client after transcription
+    "transcribe": {"min_length": 1, "min_count": 3, "top_k": TOP_K},
+}
+
+# Count-min sketch dimensions: 4 rows of 256 32-bit counters, 4 KB per entry.
+# An estimate never undercounts, and overcounts by at most about 1% of the
+# transcript's word count with 98% probability, usually far less.
+SKETCH_DEPTH = 4
+SKETCH_WIDTH = 256
+SKETCH_VERSION = 1
+_SKETCH_HEADER = struct.Struct("<BBH")
+
+
+def _chunks(text, size=CHUNK_CHARS):
+    """
+    Split text into slices of about size characters, cut at whitespace so no
+    token is split.
+    """
+    start = 0
+    while start < len(text):
+        end = start + size
+        if end < len(text):
+            boundary = WHITESPACE_RE.search(text, end)
+            end = boundary.end() if boundary else len(text)
+        yield text[start:end]
+        start = end
+
+
+def tokenize(text):
+    """
+    Split text into lowercase words.
+
+    Returns:
+        list: the words in order
+    """
+    lowered = text.lower()
+    if lowered.isascii():
+        tokens = (
+            token.strip(INNER_CHARS)
+            for token in lowered.translate(ASCII_NON_WORD).split()
+        )
+        return [token for token in tokens if token]
+    return TOKEN_RE.findall(lowered)
+
+
+def count_words(text):
+    """
+    Number of whitespace-separated tokens in text, the stored word_count.
+
+    Unlike the words counted by word_frequencies(), a token is anything
+    between whitespace, so "e-mail" or a lone "--" count as one.
+    """
+    if not text or not isinstance(text, str):
+        return 0
+    return sum(len(chunk.split()) for chunk in _chunks(text))
+
+
+def word_frequencies(text):
+    """
+    Count every lowercase word of text in a single tokenizing pass.
+
+    Returns:
+        Counter: word -> occurrences, in order of first occurrence
+    """
+    counts = Counter()
+    if not text or not isinstance(text, str):
+        return counts
+    for chunk in _chunks(text):
+        counts.update(tokenize(chunk))
+    return counts
+
+
+def text_digest(text):
+    """
+    Hex SHA-256 of a transcript, to check stored word counts still match it.
+    """
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_" or char in INNER_CHARS
+
+
+def _common_prefix(old, new, limit, block=4096):
+    """Length of the common prefix of old and new, at most limit."""
+    start = 0
+    while start + block <= limit and (
+        old[start : start + block] == new[start : start + block]
+    ):
+        start += block
+    while start < limit and old[start] == new[start]:
+        start += 1
+    return start
+
+
+def changed_span(old, new):
+    """
+    Locate the edit between two versions of a transcript.
+
+    The common prefix and suffix are skipped, then the span is widened to
+    whole words so no word is split.
+
+    Returns:
+        tuple: (start, old_end, new_end), old[start:old_end] was replaced by
+            new[start:new_end]
+    """
+    limit = min(len(old), len(new))
+    start = _common_prefix(old, new, limit)
+    suffix = _common_prefix(old[::-1], new[::-1], limit - start)
+    old_end, new_end = len(old) - suffix, len(new) - suffix
+    while start > 0 and _is_word_char(old[start - 1]):
+        start -= 1
+    while old_end < len(old) and _is_word_char(old[old_end]):
+        old_end += 1
+        new_end += 1
+    return start, old_end, new_end
+
+
+def update_frequencies(counts, old, new, max_fraction=INCREMENTAL_MAX_FRACTION):
+    """
+    Update the word counts of old into those of new by re-counting only the
+    edited span.
+
+    Args:
+        counts (Counter): word counts of old, updated in place
+        old (str): the transcript the counts were computed from
+        new (str): the edited transcript
+        max_fraction (float): largest edit, relative to the transcript length,
+            worth updating incrementally
+
+    Returns:
+        Counter: the word counts of new, or None if the edit is too large and
+            new should be analyzed in full
+    """
+    start, old_end, new_end = changed_span(old, new)
+    if (old_end - start) + (new_end - start) > max_fraction * max(len(new), 1):
+        return None
+    counts.update(word_frequencies(new[start:new_end]))
+    counts.subtract(word_frequencies(old[start:old_end]))
+    for word in [word for word, count in counts.items() if count <= 0]:
+        del counts[word]
+    return counts
+
+
+def top_words(counts, min_length=1, min_count=1, top_k=None, stop_words=STOP_WORDS):
+    """
+    Pick the most frequent words that pass the filtering policy.
+
+    Ties keep the order of first occurrence. With top_k set, only the top_k
+    words are selected, through a heap, without sorting the whole vocabulary.
+
+    Returns:
+        list: [word, count] pairs, most frequent first
+    """
+    candidates = (
+        [word, count]
+        for word, count in counts.items()
+        if count >= min_count and len(word) >= min_length and word not in stop_words
+    )
+    if top_k is None:
+        return sorted(candidates, key=itemgetter(1), reverse=True)
+    return heapq.nlargest(top_k, candidates, key=itemgetter(1))
+
+
+class CountMinSketch:
+    """
+    Fixed-size approximate word counts.
+
+    Each word is counted in one cell per row, picked by a stable hash; its
+    estimate is the smallest of those cells.
+    """
+
+    def __init__(self, depth=SKETCH_DEPTH, width=SKETCH_WIDTH, counters=None):
+        self.depth = depth
+        self.width = width
+        self.counters = counters or array("I", bytes(4 * depth * width))
+
+    def _cells(self, word):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=4 * self.depth)
+        hashes = struct.unpack(f"<{self.depth}I", digest.digest())
+        return [
+            row * self.width + value % self.width for row, value in enumerate(hashes)
+        ]
+
+    def add(self, word, count=1):
+        """
+        Count count more occurrences of word.
+
+        Uses conservative update: only the cells below the word's new estimate
+        are raised, which keeps the estimates of colliding words tighter.
+        """
+        cells = self._cells(word)
+        counters = self.counters
+        target = min(min(counters[cell] for cell in cells) + count, 0xFFFFFFFF)
+        for cell in cells:
+            if counters[cell] < target:
+                counters[cell] = target
+
+    def estimate(self, word):
+        """
+        Estimate how often word was counted.
+
+        Returns:
+            int: the estimate, never below the true count
+        """
+        return min(self.counters[cell] for cell in self._cells(word.lower()))
+
+    @classmethod
+    def from_counts(cls, counts, **dimensions):
+        """Build a sketch of a word -> count mapping."""
+        sketch = cls(**dimensions)
+        for word, count in counts.items():
+            sketch.add(word, count)
+        return sketch
+
+    def to_bytes(self):
+        """
+        Serialize the sketch, as stored in an entry's word_sketch field.
+        """
+        counters = array("I", self.counters)
+        if sys.byteorder == "big":
+            counters.byteswap()
+        header = _SKETCH_HEADER.pack(SKETCH_VERSION, self.depth, self.width)
+        return header + counters.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Load a sketch serialized by to_bytes().
+
+        Raises:
+            ValueError: if data is not a serialized sketch
+        """
+        data = bytes(data)
+        if len(data) < _SKETCH_HEADER.size:
+            raise ValueError("Truncated word sketch")
+        version, depth, width = _SKETCH_HEADER.unpack_from(data)
+        body = data[_SKETCH_HEADER.size :]
+        if version != SKETCH_VERSION or len(body) != 4 * depth * width:
+            raise ValueError("Unsupported word sketch")
+        counters = array("I")
+        counters.frombytes(body)
+        if sys.byteorder == "big":
+            counters.byteswap()
+        return cls(depth, width, counters)
+
+
+def word_frequency(entry, word):
+    """
+    How often a word occurs in an entry's transcript: exact for its top words,
+    estimated from its word_sketch otherwise.
+
+    Args:
+        entry (dict): the entry, with top_words and optionally word_sketch
+        word (str): the word to look up
+
+    Returns:
+        tuple: (count, exact), count is None if the entry has no sketch
+    """
+    word = word.lower()
+    for top_word, count in entry.get("top_words") or []:
+        if top_word == word:
+            return count, True
+    if not entry.get("word_sketch"):
+        return None, False
+    return CountMinSketch.from_bytes(entry["word_sketch"]).estimate(word), False
+
+
+def analyze(text, policy="upload", **overrides):
+    """
+    Compute the word statistics of a transcript.
+
+    Args:
+        text (str): the transcript
+        policy (str): name of the filtering policy in POLICIES
+        overrides: policy settings to override, e.g. top_k=None
+
+    Returns:
+        dict: word_count, frequencies (Counter), top_words ([word, count] pairs)
+            and word_sketch (serialized CountMinSketch of every word, None
+            if the text has no words)
+    """
+    return summarize(word_frequencies(text), text, policy, **overrides)
+
+
+def summarize(counts, text, policy="upload", **overrides):
+    """
+    Compute the word statistics of a transcript from its word counts.
+
+    Args:
+        counts (Counter): word -> occurrences
+        text (str): the transcript, for its word_count
+        policy (str): name of the filtering policy in POLICIES
+        overrides: policy settings to override
+
+    Returns:
+        dict: the same statistics as analyze()
+    """
+    settings = {**POLICIES[policy], **overrides}
+    return {
+        "word_count": count_words(text),
+        "frequencies": counts,
+        "top_words": top_words(counts, **settings),
+        "word_sketch": (
+            CountMinSketch.from_counts(counts).to_bytes() if counts else None
+        ),
+    }
+
+
+def _legacy_top_words(text):
+    """The implementation analyze() replaced, kept for the benchmark."""
+    return sorted(
+        [
+            (word, count)
+            for word, count in Counter(re.findall(r"\b\w+\b", text.lower())).items()
+            if len(word) > 3 and word not in STOP_WORDS
+        ],
+        key=lambda x: x[1],
+        reverse=True,
+    )[:10], len(text.split())
+
+
+def _benchmark(words=1_000_000):
+    """Time and trace peak memory of analyze() against the legacy chain."""
+    # pylint: disable=import-outside-toplevel
+    import random
+    import time
+    import tracemalloc
+
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(50_000)] + list(STOP_WORDS)
+    text = " ".join(rng.choice(vocabulary) for _ in range(words))
+
+    for name, run in (
+        ("legacy", lambda: _legacy_top_words(text)),
+        ("analyze", lambda: analyze(text, top_k=10)),
+    ):
+        tracemalloc.start()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name}: {elapsed:.3f}s, peak {peak / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    _benchmark()
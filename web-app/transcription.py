@@ -0,0 +1,137 @@
+"""
+Transcription of uploaded audio by the ml-client, either through the durable
+job queue its workers claim from, or with an inline call.
+"""
+
+import functools
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+import requests
+from ml_client import MLClient, MLClientBusy
+from resilience import CircuitOpenError
+from entries import collection, jobs_collection
+
+# Load environment variables from .env file, before the settings below read them
+load_dotenv()
+
+ML_CLIENT_URL = os.getenv("ML_CLIENT_URL", "http://ml-client:6000/get-transcripts")
+if os.getenv("MODE") == "docker":
+    ML_CLIENT_URL = os.getenv("ML_CLIENT_URL", "http://ml-client:6000/get-transcripts")
+elif os.getenv("MODE") == "local":
+    ML_CLIENT_URL = os.getenv("ML_CLIENT_URL", "http://localhost:6000/get-transcripts")
+
+# "queue" hands transcription to ml-client workers, "sync" calls the ml-client inline
+TRANSCRIBE_MODE = os.getenv("TRANSCRIBE_MODE", "queue")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+
+@functools.lru_cache(maxsize=None)
+def get_ml_client():
+    """
+    The process's pooled, bounded client for inline transcription calls
+    (see ml_client.py), created on first use so importing the app builds
+    nothing.
+    """
+    return MLClient(ML_CLIENT_URL)
+
+
+def enqueue_transcription(filepath):
+    """
+    Adds a transcription job for the audio file to the durable job queue.
+    ml-client workers claim it, transcribe the file and update every entry
+    using it. If a job for the same file is already queued or running, that
+    job is reused.
+
+    Args:
+        filepath (str): The file path of the audio file.
+
+    Returns:
+        str: the job id if the job was queued, None otherwise.
+    """
+    now = datetime.now(timezone.utc)
+    job = {
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": JOB_MAX_ATTEMPTS,
+        "created_at": now,
+        "updated_at": now,
+    }
+    try:
+        job = jobs_collection.find_one_and_update(
+            {"audio_file": filepath, "status": {"$in": ["queued", "running"]}},
+            {"$setOnInsert": job},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return str(job["_id"])
+    except PyMongoError as e:
+        print("Error queueing transcription:", e)
+        return None
+
+
+def trigger_ml(filepath):
+    """
+    Triggers machine learning client by sending a signal to ml client by Flask
+
+    The call goes through the pooled ml-client client: its timeout grows with the
+    audio duration, connection errors, timeouts and 502-504 answers are
+    retried with backoff, and while the ml-client keeps failing its circuit
+    is open and the call fails at once.
+
+    Args:
+        filepath (str): The file path of the audio file.
+
+    Returns:
+        dict: the ml client's response if the request was answered,
+        an error string otherwise.
+
+    Raises:
+        MLClientBusy: if every call slot to the ml-client stayed taken
+    """
+    try:
+        # Send the data to ML Client
+        print(f"Sending request to ML client at {ML_CLIENT_URL} with file: {filepath}")
+        response_data = get_ml_client().transcribe(filepath)
+        print(f"ML client response: {response_data}")
+        return response_data
+    except CircuitOpenError as e:
+        print(f"ML client unavailable: {e}")
+        return "Circuit open"
+    except requests.exceptions.RequestException as e:
+        print(f"Request exception: {e}")
+        return "Request exception"
+    except ConnectionError:
+        return "Connection error"
+    except TimeoutError:
+        return "Timeout error"
+
+
+def retranscribe_missing(batch_size=50):
+    """
+    Sends the audio of every entry without a transcript to the ml-client's
+    batch endpoint, batch_size files per request.
+
+    Returns:
+        Counter: number of files per batch item status
+    """
+    paths = collection.distinct("audio_file", {"transcript": {"$in": ["", None]}})
+    statuses = Counter()
+    for start in range(0, len(paths), batch_size):
+        batch = paths[start : start + batch_size]
+        try:
+            answer = get_ml_client().transcribe_batch(batch)
+        except (
+            MLClientBusy,
+            CircuitOpenError,
+            requests.exceptions.RequestException,
+        ) as e:
+            print(f"Stopped after {start} files: {e}")
+            statuses["not sent"] += len(paths) - start
+            break
+        statuses.update(item["status"] for item in answer.get("results", []))
+        print(f"{start + len(batch)}/{len(paths)} files: {dict(statuses)}")
+    return statuses
@@ -0,0 +1,264 @@
+"""
+Upload routes: one-shot /upload, and the resumable /uploads protocol for
+larger files (uploads.py). Both store the audio under its content digest
+and create the entry, reusing, requesting or queueing its transcript.
+"""
+
+import os
+from datetime import datetime
+from flask import Blueprint, current_app, jsonify, request
+from pymongo.errors import PyMongoError
+from storage import save_blob
+from uploads import ChunkedUploads, UploadError
+from ml_client import MLClientBusy
+from entries import collection, upload_entry
+from transcription import TRANSCRIBE_MODE, enqueue_transcription, trigger_ml
+
+UPLOAD_FOLDER = os.path.join("static", "uploaded_audio")
+# Larger files go through the resumable /uploads protocol, in chunks
+chunked_uploads = ChunkedUploads(UPLOAD_FOLDER)
+
+blueprint = Blueprint("uploads", __name__)
+
+
+@blueprint.route("/upload", methods=["POST"])
+def upload():
+    """
+    Handles the upload of audio files and associated metadata.
+
+    This route processes POST requests containing:
+    - An audio file
+    - Form data including title, speaker, date, and description
+
+    The audio is stored under its content digest. If the same audio was
+    already transcribed, the new entry reuses that transcript and its word
+    stats without calling the ml-client. Otherwise, in queue mode the entry
+    is saved with an empty transcript and a transcription job is queued for
+    the ml-client workers.
+
+    Returns:
+        tuple: (json with the job id, 202) if the transcription was queued
+        str: A success message if the upload is successful
+        tuple: (error message, status code) if the upload fails
+
+    Raises:
+        400: If no audio file is provided or if no file is selected
+    """
+    # check if the audio file is provided
+    if "audio" not in request.files:
+        return "No audio file", 400
+
+    file = request.files["audio"]
+    if file.filename == "":
+        return "No selected file", 400
+
+    # save the file to the uploads folder in the root directory
+    try:
+        # Store the audio under its content digest, hashing while writing
+        filepath, digest, duplicate = save_blob(
+            file.stream, current_app.config["UPLOAD_FOLDER"], file.filename
+        )
+    except (OSError, IOError) as e:
+        print("Error saving file:", e)
+        return "Error saving file", 500
+    return create_uploaded_entry(filepath, digest, duplicate, file.filename)
+
+
+def create_uploaded_entry(filepath, digest, duplicate, filename):
+    """
+    Saves the entry of stored audio with the metadata from the request's form,
+    and reuses, requests or queues its transcript.
+
+    Args:
+        filepath (str): path of the stored audio blob
+        digest (str): hex SHA-256 of the audio
+        duplicate (bool): True if the blob was stored before
+        filename (str): the uploaded file's original name
+
+    Returns:
+        the upload response, see upload()
+    """
+    response = ("File uploaded successfully", 200)
+
+    # Generate unique entry id, several entries may share one blob
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    entry_id = os.path.join(
+        current_app.config["UPLOAD_FOLDER"], f"{timestamp}_{filename}"
+    )
+    print("entry id:", entry_id)
+    print("filepath:", filepath)
+
+    # get data from the form
+    try:
+        # Prepare metadata dictionary
+        metadata = {
+            "title": request.form["title"],
+            "speaker": request.form["speaker"],
+            "date": request.form["date"],
+            "context": request.form["description"],
+        }
+        print("Got data from page:", metadata)
+        metadata["audio_file"] = filepath
+        metadata["audio_sha256"] = digest
+
+        # Reuse the transcript of an earlier upload of the same audio
+        transcribed = find_transcribed_blob(digest) if duplicate else None
+        if transcribed:
+            print(f"Reusing transcript of {transcribed['_id']}")
+            metadata["transcript"] = transcribed["transcript"]
+            metadata["word_count"] = transcribed.get("word_count")
+            metadata["top_words"] = transcribed.get("top_words")
+            metadata["word_sketch"] = transcribed.get("word_sketch")
+        elif TRANSCRIBE_MODE == "queue":
+            # The entry is saved first so the worker has something to update
+            metadata["transcript"] = ""
+        else:
+            # Try to send to ML for transcript
+            try:
+                print(f"Sending file to ML client: {filepath}")
+                ml_response = trigger_ml(filepath)
+                print(f"ML client response: {ml_response}")
+                # an error string when the ml-client could not be reached
+                if not isinstance(ml_response, dict):
+                    ml_response = {}
+                metadata["transcript"] = ml_response.get("transcript", "")
+            except MLClientBusy as e:
+                # nothing is saved, the retried upload finds the stored blob
+                print("ML client saturated:", e)
+                return (
+                    "Transcription busy, please retry",
+                    503,
+                    {"Retry-After": str(max(1, round(e.retry_after)))},
+                )
+
+        # Save metadata using upload_entry function
+        if not upload_entry(entry_id, metadata):
+            print("Error uploading entry to MongoDB")
+            return "Error saving metadata to database", 500
+
+        if TRANSCRIBE_MODE == "queue" and not transcribed:
+            response = queued_response(filepath)
+
+    except (OSError, IOError) as e:
+        print("Error during data processing:", e)
+        return "Error during data processing", 500
+
+    return response
+
+
+def find_transcribed_blob(digest):
+    """
+    Finds an entry whose audio has the given digest and already has a transcript.
+
+    Args:
+        digest (str): hex SHA-256 of the audio content
+
+    Returns:
+        dict: the entry's transcript and word stats, or None
+    """
+    try:
+        return collection.find_one(
+            {"audio_sha256": digest, "transcript": {"$nin": ["", None]}},
+            {"transcript": 1, "word_count": 1, "top_words": 1, "word_sketch": 1},
+        )
+    except PyMongoError as e:
+        print("Error looking up duplicate audio:", e)
+        return None
+
+
+def queued_response(filepath):
+    """
+    Queues the transcription job for an uploaded file and builds the upload response.
+
+    Returns:
+        tuple: (json with the job id, 202) or (error message, 500)
+    """
+    job_id = enqueue_transcription(filepath)
+    if job_id is None:
+        return "Error queueing transcription", 500
+    return jsonify({"message": "File uploaded successfully", "job_id": job_id}), 202
+
+
+def upload_error_response(error):
+    """
+    JSON response for an UploadError, with the offset to resume from if known.
+    """
+    body = {"message": str(error)}
+    if error.offset is not None:
+        body["offset"] = error.offset
+    return jsonify(body), error.status
+
+
+@blueprint.route("/uploads", methods=["POST"])
+def start_chunked_upload():
+    """
+    Opens a resumable upload for a file of the given name and size in bytes.
+
+    Returns:
+        tuple: (json with the upload_id and offset 0, 201) or (error, status)
+    """
+    fields = request.get_json(silent=True) or request.form
+    try:
+        session = chunked_uploads.create(fields.get("filename"), fields.get("size"))
+    except UploadError as e:
+        return upload_error_response(e)
+    except OSError as e:
+        print("Error opening upload:", e)
+        return jsonify({"message": "Error saving file"}), 500
+    session["chunk_bytes"] = chunked_uploads.chunk_bytes
+    return jsonify(session), 201
+
+
+@blueprint.route("/uploads/<upload_id>", methods=["GET", "PUT", "DELETE"])
+def chunked_upload(upload_id):
+    """
+    GET reports how many bytes of an upload were received, to resume from.
+    PUT appends the request body, which must start at the `offset` argument.
+    DELETE abandons the upload.
+
+    The body is streamed to disk as it arrives. A PUT that breaks off keeps
+    what was received, and a PUT at a stale offset gets 409 with the current
+    offset.
+
+    Returns:
+        json: the upload's filename, size and offset, or an error message
+    """
+    try:
+        if request.method == "GET":
+            return jsonify(chunked_uploads.status(upload_id))
+        if request.method == "DELETE":
+            chunked_uploads.status(upload_id)
+            chunked_uploads.abort(upload_id)
+            return "", 204
+        offset = request.args.get("offset", type=int)
+        if offset is None:
+            return jsonify({"message": "Missing offset"}), 400
+        return jsonify(
+            chunked_uploads.append(
+                upload_id, offset, request.stream, request.content_length
+            )
+        )
+    except UploadError as e:
+        return upload_error_response(e)
+    except OSError as e:
+        print("Error writing upload chunk:", e)
+        return jsonify({"message": "Error saving file"}), 500
+
+
+@blueprint.route("/uploads/<upload_id>/complete", methods=["POST"])
+def complete_chunked_upload(upload_id):
+    """
+    Stores a fully received upload and creates its entry from the form data
+    (title, speaker, date and description), like a one-shot /upload.
+
+    Returns:
+        the upload response, see upload()
+    """
+    try:
+        filepath, digest, duplicate, filename = chunked_uploads.complete(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    except OSError as e:
+        print("Error saving file:", e)
+        return "Error saving file", 500
+    return create_uploaded_entry(filepath, digest, duplicate, filename)
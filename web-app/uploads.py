@@ -0,0 +1,286 @@
+"""
+Resumable chunked uploads.
+
+A client opens an upload with the file name and size, sends the bytes in
+chunks that each name the offset they start at, and completes the upload.
+Chunks are appended to a .part file in the upload folder's .partial folder,
+on the shared volume, so the finished file is renamed into place rather than
+copied. A dropped connection only loses the chunk in flight: the client asks
+for the current offset and carries on from there.
+
+Every session is a pair of files, <id>.json and <id>.part, and the part
+file's size is the offset. Any worker process can therefore take the next
+chunk. An exclusive lock on the part file keeps two requests from appending
+to the same upload at once. Each process hashes the chunks it appends as it
+writes them. A process that takes over an upload first hashes what other
+processes wrote, so completing an upload only reads what was not hashed yet.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from storage import CHUNK_SIZE, store_blob
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024**3)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+# Sessions not written to for this long are removed
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+
+UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    """
+    A request the upload cannot take, with the HTTP status to answer with.
+    """
+
+    def __init__(self, message, status, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUploads:
+    """
+    Resumable uploads written to folder/.partial and stored with store_blob().
+    """
+
+    # hash states kept for uploads in progress, each a few hundred bytes
+    max_hashers = 256
+
+    def __init__(
+        self,
+        folder,
+        max_bytes=UPLOAD_MAX_BYTES,
+        chunk_bytes=UPLOAD_CHUNK_BYTES,
+        ttl=UPLOAD_SESSION_TTL,
+    ):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        self.ttl = ttl
+        # upload id -> [offset hashed up to, sha256], least recent first
+        self._hashers = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def partial_folder(self):
+        """Where sessions are kept, next to the finished blobs."""
+        return os.path.join(self.folder, ".partial")
+
+    def _paths(self, upload_id):
+        if not UPLOAD_ID.match(upload_id or ""):
+            raise UploadError("Upload not found", 404)
+        base = os.path.join(self.partial_folder, upload_id)
+        return base + ".json", base + ".part"
+
+    def _session(self, upload_id):
+        meta_path, part_path = self._paths(upload_id)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                return json.load(f), part_path
+        except (OSError, ValueError) as e:
+            raise UploadError("Upload not found", 404) from e
+
+    def create(self, filename, size):
+        """
+        Open an upload session.
+
+        Args:
+            filename (str): the original file name
+            size (int): total size of the file in bytes
+
+        Returns:
+            dict: the session's upload_id, filename, size and offset
+
+        Raises:
+            UploadError: if the size is missing or too large
+        """
+        try:
+            size = int(size)
+        except (TypeError, ValueError) as e:
+            raise UploadError("Invalid upload size", 400) from e
+        if size <= 0:
+            raise UploadError("Invalid upload size", 400)
+        if size > self.max_bytes:
+            raise UploadError("Upload too large", 413)
+        if not filename:
+            raise UploadError("No selected file", 400)
+
+        os.makedirs(self.partial_folder, exist_ok=True)
+        self.expire()
+        upload_id = secrets.token_hex(16)
+        meta_path, part_path = self._paths(upload_id)
+        with open(part_path, "xb"):
+            pass
+        meta = {"filename": os.path.basename(filename), "size": size}
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return {"upload_id": upload_id, "offset": 0, **meta}
+
+    def status(self, upload_id):
+        """
+        The session's upload_id, filename, size and offset, to resume from.
+
+        Raises:
+            UploadError: if there is no such upload
+        """
+        meta, part_path = self._session(upload_id)
+        try:
+            offset = os.path.getsize(part_path)
+        except OSError as e:
+            raise UploadError("Upload not found", 404) from e
+        return {"upload_id": upload_id, "offset": offset, **meta}
+
+    def _hasher(self, upload_id, part_file, offset):
+        """
+        A sha256 of the part file's first offset bytes, continuing from what
+        this process hashed before.
+        """
+        with self._lock:
+            state = self._hashers.pop(upload_id, None)
+        if state is None or state[0] > offset:
+            state = [0, hashlib.sha256()]
+        if state[0] < offset:
+            part_file.seek(state[0])
+            while state[0] < offset:
+                chunk = part_file.read(min(CHUNK_SIZE, offset - state[0]))
+                if not chunk:
+                    raise UploadError("Upload changed while reading", 409)
+                state[1].update(chunk)
+                state[0] += len(chunk)
+        return state
+
+    def _keep_hasher(self, upload_id, state):
+        with self._lock:
+            self._hashers[upload_id] = state
+            while len(self._hashers) > self.max_hashers:
+                self._hashers.popitem(last=False)
+
+    def _open_locked(self, upload_id):
+        meta, part_path = self._session(upload_id)
+        try:
+            part_file = open(part_path, "r+b")  # pylint: disable=consider-using-with
+        except OSError as e:
+            raise UploadError("Upload not found", 404) from e
+        try:
+            fcntl.flock(part_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError as e:
+            part_file.close()
+            raise UploadError("Upload busy, retry", 409) from e
+        return meta, part_path, part_file
+
+    def append(self, upload_id, offset, stream, length=None):
+        """
+        Append a chunk read from stream, which must start at the current offset.
+
+        The chunk is copied to disk CHUNK_SIZE bytes at a time and hashed on
+        the way. If the stream breaks off, what was received is kept and the
+        client resumes from the offset status() reports.
+
+        Args:
+            upload_id (str): the session
+            offset (int): where the chunk starts in the file
+            stream: a binary file-like object, e.g. request.stream
+            length (int): the chunk's size, if known in advance
+
+        Returns:
+            dict: the session after the chunk, see status()
+
+        Raises:
+            UploadError: if the offset is not the current one, or the chunk is
+            larger than chunk_bytes or than what is left of the file
+        """
+        meta, _, part_file = self._open_locked(upload_id)
+        with part_file:
+            current = os.fstat(part_file.fileno()).st_size
+            if offset != current:
+                raise UploadError("Offset mismatch", 409, current)
+            room = min(self.chunk_bytes, meta["size"] - current)
+            if length is not None and length > room:
+                raise UploadError("Chunk too large", 413, current)
+
+            state = self._hasher(upload_id, part_file, current)
+            part_file.seek(current)
+            try:
+                while True:
+                    chunk = stream.read(min(CHUNK_SIZE, room + 1))
+                    if not chunk:
+                        break
+                    if len(chunk) > room:
+                        part_file.truncate(current)
+                        state = None
+                        raise UploadError("Chunk too large", 413, current)
+                    part_file.write(chunk)
+                    state[1].update(chunk)
+                    state[0] += len(chunk)
+                    room -= len(chunk)
+            finally:
+                part_file.flush()
+                if state is not None:
+                    self._keep_hasher(upload_id, state)
+            offset = part_file.tell()
+        return {"upload_id": upload_id, "offset": offset, **meta}
+
+    def complete(self, upload_id):
+        """
+        Store a fully received upload under its digest, see store_blob().
+
+        Returns:
+            tuple: (path of the blob, hex digest, True if the blob already
+            existed, the original file name)
+
+        Raises:
+            UploadError: if bytes are still missing
+        """
+        meta, part_path, part_file = self._open_locked(upload_id)
+        with part_file:
+            current = os.fstat(part_file.fileno()).st_size
+            if current != meta["size"]:
+                raise UploadError("Upload incomplete", 409, current)
+            digest = self._hasher(upload_id, part_file, current)[1].hexdigest()
+            path, existed = store_blob(part_path, self.folder, digest, meta["filename"])
+            self.abort(upload_id)
+        return path, digest, existed, meta["filename"]
+
+    def abort(self, upload_id):
+        """
+        Drop a session and whatever it received.
+        """
+        for path in self._paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+
+    def expire(self, now=None):
+        """
+        Remove sessions nothing was written to for ttl seconds.
+
+        Returns:
+            int: how many sessions were removed
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        try:
+            names = os.listdir(self.partial_folder)
+        except OSError:
+            return 0
+        for name in names:
+            upload_id, extension = os.path.splitext(name)
+            if extension != ".part" or not UPLOAD_ID.match(upload_id):
+                continue
+            try:
+                idle = now - os.path.getmtime(os.path.join(self.partial_folder, name))
+            except OSError:
+                continue
+            if idle > self.ttl:
+                self.abort(upload_id)
+                removed += 1
+        return removed